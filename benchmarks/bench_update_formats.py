@@ -0,0 +1,64 @@
+"""Compares the cost of building XML, JSON and CSV update requests.
+
+Run from the repository root::
+
+    python benchmarks/bench_update_formats.py [ndocs]
+
+Requests are not sent anywhere, the body is only consumed.
+"""
+from __future__ import print_function, unicode_literals
+
+import sys
+import time
+from datetime import datetime
+
+from mock import patch
+
+sys.path.insert(0, '.')
+
+from solar.pysolr import Solr
+
+
+FIELDS = ['id', 'name', 'price', 'is_active', 'dt_created', 'tags']
+
+
+def make_docs(ndocs):
+    for i in range(ndocs):
+        yield {
+            'id': str(i),
+            'name': 'Product #%d, "special" edition' % i,
+            'price': i * 1.5,
+            'is_active': i % 2 == 0,
+            'dt_created': datetime(2013, 5, 1, 12, 30),
+            'tags': ['tag%d' % (i % 7), 'tag%d' % (i % 11)],
+        }
+
+
+def consume(method, path, body=None, headers=None, files=None):
+    if body is not None and not isinstance(body, bytes):
+        for _ in body:
+            pass
+    return '{}'
+
+
+def bench(name, func, ndocs):
+    docs = list(make_docs(ndocs))
+    solr = Solr('http://localhost:8983/solr')
+    with patch.object(solr, '_send_request', side_effect=consume):
+        start = time.time()
+        func(solr, docs)
+        seconds = time.time() - start
+    print('%-5s %8.3fs %10.0f docs/s' % (name, seconds, ndocs / seconds))
+
+
+def main():
+    ndocs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bench('xml', lambda solr, docs: solr.add(docs, format='xml'), ndocs)
+    bench('json', lambda solr, docs: solr.add(docs, format='json'), ndocs)
+    bench('csv', lambda solr, docs: solr.bulk_load_csv(docs, FIELDS,
+                                                       multivalued=['tags']),
+          ndocs)
+
+
+if __name__ == '__main__':
+    main()
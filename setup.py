@@ -13,6 +13,8 @@ def requires():
     r = ['requests>=1.1.0']
     if sys.version_info < (2, 7):
         r.append('ordereddict')
+    if sys.version_info < (3, 2):
+        r.append('futures')
     return r
 
 setup(
@@ -32,6 +34,9 @@ setup(
             'lxml',
             'cssselect',
         ],
+        'aio': [
+            'aiohttp',
+        ],
     },
     classifiers=[
         "Development Status :: 3 - Alpha",
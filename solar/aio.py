@@ -0,0 +1,501 @@
+"""Asyncio support.
+
+Requires Python 3.5+ and ``aiohttp``::
+
+    searcher = AsyncSolrSearcher('http://localhost:8983/solr')
+
+    q = searcher.search('nokia').filter(status=0).limit(10)
+    results = await q.fetch()
+    total = await q.count()
+    async for doc in q:
+        print(doc.id)
+"""
+import asyncio
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .pysolr import Solr, SolrError, SolrUnavailableError, SolrCircuitOpenError
+from .pysolr import force_bytes, force_unicode
+from .batch import UpdateBatch
+from .paging import DeepPagingError
+from .query import SolrQuery
+from .searcher import SolrSearcher
+from .util import make_request_key
+
+
+class AsyncSolr(Solr):
+    """
+    Solr client for asyncio applications.
+
+    Has the same interface as :class:`solar.pysolr.Solr` but every API method
+    is a coroutine. Requests are sent using ``aiohttp``.
+    Hedged requests are not supported.
+
+    Optionally accepts ``session`` for a shared ``aiohttp.ClientSession``.
+    By default the session is created on the first request.
+
+    Optionally accepts ``limit`` for the maximum number of simultaneous
+    connections of the created session. Default is ``100``.
+    """
+    def __init__(self, url, decoder=None, timeout=60, max_get_params_length=1023,
+                 check_interval=5, policy=None, circuit_breaker=None,
+                 gzip_min_size=None, session=None, limit=100):
+        super(AsyncSolr, self).__init__(
+            url, decoder=decoder, timeout=timeout,
+            max_get_params_length=max_get_params_length,
+            check_interval=check_interval, policy=policy,
+            circuit_breaker=circuit_breaker, gzip_min_size=gzip_min_size)
+        self.session = session
+        self.limit = limit
+
+    def _get_session(self):
+        if self.session is None:
+            if aiohttp is None:
+                raise ImportError('AsyncSolr requires aiohttp to be installed')
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _send_request(self, method, path='', body=None, headers=None, files=None):
+        if files is not None:
+            raise SolrError('Sending files is not supported by AsyncSolr')
+
+        read = self._is_read_request(method, path)
+        endpoints = self.endpoints.candidates()
+        for i, endpoint in enumerate(endpoints):
+            try:
+                return await self._send_endpoint_request(
+                    endpoint, method, path, body=body, headers=headers)
+            except (SolrUnavailableError, SolrCircuitOpenError) as err:
+                if isinstance(err, SolrUnavailableError):
+                    self.endpoints.mark_dead(endpoint)
+                if i == len(endpoints) - 1 or not self._can_retry(err, read):
+                    raise
+                self.log.warning("Retrying request to '%s' on another node", path)
+
+    async def _send_endpoint_request(self, endpoint, method, path='', body=None, headers=None):
+        url = self._create_full_url(path, endpoint.url)
+        method = method.lower()
+        log_body = body
+
+        if headers is None:
+            headers = {}
+
+        if log_body is None:
+            log_body = ''
+        elif not isinstance(log_body, str):
+            log_body = repr(body)
+
+        self.log.debug("Starting request to '%s' (%s) with body '%s'...",
+                       url, method, log_body[:10])
+
+        bytes_body = body
+        if bytes_body is not None:
+            if isinstance(body, (bytes, str)):
+                bytes_body = force_bytes(body)
+            else:
+                # generated update message
+                bytes_body = b''.join(body)
+
+        if not 'content-type' in [key.lower() for key in headers.keys()]:
+            headers['Content-type'] = 'application/xml; charset=UTF-8'
+
+        session = self._get_session()
+        read = self._is_read_request(method, path)
+        if not self.endpoints.request_started(endpoint):
+            raise SolrCircuitOpenError(
+                "Circuit breaker for server '%s' is open" % endpoint.url)
+        start_time = time.time()
+        failed = True
+        try:
+            async with session.request(
+                    method, url, data=bytes_body, headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout)) as resp:
+                status = resp.status
+                resp_headers = resp.headers
+                content = await resp.read()
+            failed = status in self.unavailable_statuses
+        except asyncio.TimeoutError as err:
+            error_message = "Connection to server '%s' timed out: %s"
+            self.log.error(error_message, url, err, exc_info=True)
+            raise SolrUnavailableError(error_message % (url, err))
+        except aiohttp.ClientError as err:
+            error_message = "Failed to connect to server at '%s', are you sure that URL is correct? Checking it in a browser might help: %s"
+            params = (url, err)
+            self.log.error(error_message, *params, exc_info=True)
+            raise SolrUnavailableError(error_message % params)
+        finally:
+            self.endpoints.request_finished(endpoint, time.time() - start_time,
+                                            read=read, failed=failed)
+
+        end_time = time.time()
+        self.log.info("Finished '%s' (%s) with body '%s' in %0.3f seconds.",
+                      url, method, log_body[:10], end_time - start_time)
+
+        if status != 200:
+            error_message = self._extract_error(resp_headers, content)
+            self.log.error(error_message, extra={'data': {'headers': resp_headers,
+                                                          'response': content}})
+            if status in self.unavailable_statuses:
+                raise SolrUnavailableError(error_message, status_code=status)
+            raise SolrError(error_message, status_code=status)
+
+        return force_unicode(content)
+
+    # ``add``, ``delete``, ``commit`` and ``optimize`` return the result of
+    # ``_send_request`` as is, so they are already awaitable
+
+    async def _select(self, params):
+        return await self._send_request(*self._select_request(params))
+
+    async def search(self, q, **kwargs):
+        params = {'q': q}
+        params.update(kwargs)
+        response = await self._select(params)
+        return self._parse_search(response)
+
+    async def get(self, id=None, ids=None, **kwargs):
+        if id is None and ids is None:
+            raise ValueError('You must specify "id" or "ids".')
+        elif id is not None and ids is not None:
+            raise ValueError('You many only specify "id" OR "ids", not both.')
+        elif id is not None:
+            params = {'id': id}
+        elif ids is not None:
+            params = {'ids': ids}
+        params.update(kwargs)
+        response = await self._get(params)
+        return self._parse_get(response, single=id is not None)
+
+    async def more_like_this(self, q, mltfl, **kwargs):
+        params = {
+            'q': q,
+            'mlt.fl': mltfl,
+        }
+        params.update(kwargs)
+        response = await self._mlt(params)
+        return self._parse_mlt(response)
+
+    async def suggest_terms(self, fields, prefix, **kwargs):
+        params = {
+            'terms.fl': fields,
+            'terms.prefix': prefix,
+        }
+        params.update(kwargs)
+        response = await self._suggest_terms(params)
+        return self._parse_suggest_terms(response)
+
+    async def index_version(self):
+        response = await self._send_request(
+            'get', 'admin/luke?numTerms=0&show=index&wt=json')
+        return self._parse_index_version(response)
+
+    async def extract(self, file_obj, extractOnly=True, **kwargs):
+        raise SolrError('Extracting is not supported by AsyncSolr')
+
+    def export(self, q, fl, sort, **kwargs):
+        raise SolrError('Exporting is not supported by AsyncSolr')
+
+    async def bulk_load_csv(self, docs, fields, separator=',', split='|', multivalued=(),
+                            batch_size=None, commit=True, commitWithin=None,
+                            waitFlush=None, waitSearcher=None):
+        # every batch must be sent before the next one
+        result = None
+        for batch, last in self._csv_batches(docs, batch_size):
+            result = await self._csv_update(batch, fields, separator, split, multivalued,
+                                            commit=commit if last else False,
+                                            commitWithin=commitWithin, waitFlush=waitFlush,
+                                            waitSearcher=waitSearcher)
+        return result
+
+
+class AsyncSolrQuery(SolrQuery):
+    """Query which results must be fetched with ``await query.fetch()``.
+
+    After fetching results are available synchronously
+    via ``results``, iteration, ``len`` and indexing.
+    """
+    def _fetch_results(self, only_count=False):
+        if self._result_cache is None:
+            raise RuntimeError(
+                'Results are not fetched, use "await query.fetch()" first')
+        return self._result_cache
+
+    async def _do_search(self, only_count=False):
+        params = self._prepare_params(only_count=only_count)
+        if self._cache_ttl is not None:
+            params['_cache_ttl'] = self._cache_ttl
+        deep_paging = self.searcher.deep_paging
+        if deep_paging is not None and not only_count and deep_paging.check(params):
+            raise DeepPagingError('Cursor deep paging is not supported by AsyncSolrQuery')
+        raw_results = await self.searcher.select(self._make_q(), **params)
+        return self._make_results(raw_results)
+
+    async def fetch(self):
+        if self._result_cache is None:
+            self._result_cache = await self._do_search()
+        return self._result_cache
+
+    async def count(self):
+        ndocs = self._cached_count()
+        if ndocs is not None:
+            return ndocs
+        raw_results = await self.searcher.select(self._make_q(), **self._count_params())
+        return raw_results.hits
+
+    async def all(self):
+        return list(await self.fetch())
+
+    async def get(self, *args, **kwargs):
+        clone = self.filter(*args, **kwargs).limit(1)
+        results = await clone.fetch()
+        if len(results):
+            return clone[0]
+
+    def __aiter__(self):
+        return _AsyncQueryIterator(self)
+
+    def iterator(self, batch_size=1000):
+        """Async version of :meth:`SolrQuery.iterator`::
+
+            async for doc in searcher.search().iterator(5000):
+                ...
+        """
+        return _AsyncCursorIterator(self, batch_size)
+
+
+class _AsyncQueryIterator(object):
+    def __init__(self, query):
+        self.query = query
+        self.it = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.it is None:
+            await self.query.fetch()
+            self.it = iter(self.query)
+        try:
+            return next(self.it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _AsyncCursorIterator(object):
+    def __init__(self, query, batch_size):
+        self.query = query
+        self.clone = query._cursor_clone(batch_size)
+        self.cursor_mark = '*'
+        self.it = iter(())
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            try:
+                return next(self.it)
+            except StopIteration:
+                pass
+            if self.cursor_mark is None:
+                raise StopAsyncIteration
+            self.clone._params['cursorMark'] = self.cursor_mark
+            results = await self.clone._do_search()
+            self.it = self.query._iter_page(results)
+            self.cursor_mark = self.query._next_cursor_mark(results, self.cursor_mark)
+
+
+class AsyncUpdateBatch(UpdateBatch):
+    """:class:`~solar.batch.UpdateBatch` whose methods are coroutines.
+
+    Usage::
+
+        async with searcher.update_batch(commit=True) as batch:
+            await batch.add([{'id': 1, 'name': 'Nokia'}])
+            await batch.delete_ids([2])
+    """
+    def __enter__(self):
+        raise TypeError('Use "async with" with AsyncUpdateBatch')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            await self.close()
+        else:
+            self.discard()
+
+    async def _append(self, name, command, size):
+        if self._push(name, command, size):
+            await self.flush()
+
+    async def add(self, docs):
+        for command in self._add_commands(docs):
+            await self._append(*command)
+
+    async def delete_ids(self, ids):
+        for command in self._delete_ids_commands(ids):
+            await self._append(*command)
+
+    async def delete(self, *args, **kwargs):
+        await self._append(*self._delete_command(*args, **kwargs))
+
+    async def flush(self, commit=False):
+        commands = self._take(commit)
+        if commands is None:
+            return None
+        searcher = self.searcher
+        try:
+            result = await searcher.solr.batch_update(
+                commands, format=self.format,
+                **searcher._update_commit_params(commit))
+        finally:
+            searcher._invalidate_cache()
+        self.requests += 1
+        self.commands += len(commands)
+        searcher._request_commit(commit)
+        return result
+
+    async def close(self):
+        return await self.flush(commit=self.commit)
+
+
+class AsyncSolrSearcher(SolrSearcher):
+    solr_cls = AsyncSolr
+    query_cls = AsyncSolrQuery
+    update_batch_cls = AsyncUpdateBatch
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncSolrSearcher, self).__init__(*args, **kwargs)
+        self._in_flight = {}
+
+    async def select(self, q, _cache_ttl=None, **kwargs):
+        cache = self.cache
+        if cache is None or _cache_ttl == 0:
+            return await self._select(q, **kwargs)
+
+        if cache.needs_version_check():
+            cache.update_version(await self.solr.index_version())
+        key = make_request_key(q, kwargs)
+        raw_results = cache.get(key)
+        if raw_results is None:
+            raw_results = await self._select(q, **kwargs)
+            cache.set(key, raw_results, ttl=_cache_ttl)
+        return raw_results
+
+    async def _select(self, q, **kwargs):
+        if not self.single_flight:
+            return await self.solr.search(q, **kwargs)
+
+        key = make_request_key(q, kwargs)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.solr.search(q, **kwargs))
+            self._in_flight[key] = task
+
+            def forget(t):
+                if self._in_flight.get(key) is t:
+                    del self._in_flight[key]
+            task.add_done_callback(forget)
+        # cancellation of one waiter must not cancel the shared request
+        return await asyncio.shield(task)
+
+    async def get(self, id=None, ids=None, **kwargs):
+        if ids and hasattr(ids, '__iter__'):
+            ids = ','.join(ids)
+        raw_results = await self.solr.get(id=id, ids=ids, **kwargs)
+        return [self.document_cls(**raw_doc) for raw_doc in raw_results.docs]
+
+    async def multi_search(self, queries):
+        return list(await asyncio.gather(*[q.fetch() for q in queries]))
+
+    # cache must be invalidated after the update request is done
+
+    async def add(self, docs, commit=True):
+        try:
+            result = await self.solr.add(docs, **self._update_commit_params(commit))
+        finally:
+            self._invalidate_cache()
+        self._request_commit(commit)
+        return result
+
+    async def bulk_load_csv(self, docs, fields, commit=True, **kwargs):
+        try:
+            result = await self.solr.bulk_load_csv(
+                docs, fields, **dict(kwargs, **self._update_commit_params(commit)))
+        finally:
+            self._invalidate_cache()
+        self._request_commit(commit)
+        return result
+
+    async def commit(self):
+        try:
+            return await super(AsyncSolrSearcher, self).commit()
+        finally:
+            self._invalidate_cache()
+
+    async def wait_for_commit(self, timeout=None):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, super(AsyncSolrSearcher, self).wait_for_commit, timeout)
+
+    async def _delete_by_id(self, q, commit):
+        params = self._update_commit_params(commit)
+        commit_now = params.pop('commit')
+        deleted = 0
+        start_time = time.time()
+        cursor_mark = '*'
+        try:
+            while True:
+                results = await self.solr.search(
+                    q, **self._cursor_params(cursor_mark, self.delete_batch_size))
+                if results.docs:
+                    delay = self._delete_delay(deleted, start_time)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    await self.solr.batch_update(
+                        [('delete', {'id': doc[self.unique_field]}) for doc in results.docs],
+                        commit=False, **params)
+                    deleted += len(results.docs)
+                if not results.docs or results.next_cursor_mark in (None, cursor_mark):
+                    break
+                cursor_mark = results.next_cursor_mark
+            if commit_now:
+                await self.solr.commit()
+        finally:
+            self._invalidate_cache()
+        self._request_commit(commit)
+        return deleted
+
+    async def delete(self, *args, **kwargs):
+        commit = kwargs.pop('commit', True)
+        by_id = kwargs.pop('by_id', self.delete_by_id)
+        if by_id:
+            return await self._delete_by_id(self.make_delete_query(*args, **kwargs), commit)
+        try:
+            result = await self.solr.delete(q=self.make_delete_query(*args, **kwargs),
+                                            **self._update_commit_params(commit))
+        finally:
+            self._invalidate_cache()
+        self._request_commit(commit)
+        return result
+
+    async def optimize_index(self):
+        try:
+            return await super(AsyncSolrSearcher, self).optimize_index()
+        finally:
+            self._invalidate_cache()
+
+    async def close(self):
+        await self.solr.close()
@@ -0,0 +1,164 @@
+from __future__ import unicode_literals
+
+from .compat import force_unicode
+from .util import json_default
+
+
+# fields maintained by Solr itself
+INTERNAL_FIELDS = ('_version_',)
+
+
+def _normalize(value):
+    if isinstance(value, (list, tuple)):
+        values = [_normalize(v) for v in value if v is not None and v != '']
+        if not values:
+            return None
+        if len(values) == 1:
+            return values[0]
+        return values
+    if value is None or value == '':
+        return None
+    if hasattr(value, 'strftime'):
+        return json_default(value)
+    if isinstance(value, bytes):
+        return force_unicode(value)
+    return value
+
+
+def diff_doc(old, new, key_fields=('id',), non_updatable=(), ignore_fields=(),
+             remove_missing=True):
+    """Returns minimal atomic update that turns ``old`` document into ``new``.
+
+    ``key_fields`` are copied into the update as is. Only ``set`` operation
+    is used so the update can be safely sent again. Fields that are present
+    in ``old`` but missing in ``new`` are removed if ``remove_missing``
+    is ``True``, ``ignore_fields`` are never compared.
+
+    Returns ``new`` if there is no ``old`` document, ``new`` already contains
+    atomic updates or if any of the ``non_updatable`` fields changed.
+    Returns ``None`` if documents are equal.
+    """
+    if old is None or any(isinstance(v, dict) for v in new.values()):
+        return new
+
+    skip = set(key_fields) | set(ignore_fields) | set(INTERNAL_FIELDS) | set(['boost'])
+    changes = {}
+    for field, value in new.items():
+        if field in skip:
+            continue
+        value = _normalize(value)
+        if value != _normalize(old.get(field)):
+            changes[field] = {'set': value}
+    if remove_missing:
+        for field, value in old.items():
+            if field in skip or field in new:
+                continue
+            if _normalize(value) is not None:
+                changes[field] = {'set': None}
+
+    if not changes:
+        return None
+    if any(field in non_updatable for field in changes):
+        return new
+
+    update = dict((field, new[field]) for field in key_fields if field in new)
+    update.update(changes)
+    if 'boost' in new:
+        update['boost'] = new['boost']
+    return update
+
+
+class AtomicUpdater(object):
+    """Sends only changed fields of the documents as atomic updates.
+
+    Previous versions of the documents are taken from the ``snapshot``,
+    any mapping from unique value to the indexed document (for example
+    :mod:`shelve`), which is updated after Solr accepted the documents.
+    Without ``snapshot`` they are fetched with the realtime get handler
+    in batches of ``fetch_batch_size``, then all the fields of the schema
+    must be stored (or be ``ignore_fields``, like copy field targets).
+
+    Fields that cannot be updated atomically should be listed in
+    ``non_updatable``, the whole document is sent when any of them changed.
+
+    Usage::
+
+        updater = AtomicUpdater(searcher, non_updatable=['description'])
+        updater.add([{'id': 1, 'price': 100, 'description': ...}])
+    """
+    def __init__(self, searcher, snapshot=None, non_updatable=(), ignore_fields=(),
+                 fetch_batch_size=100):
+        self.searcher = searcher
+        self.snapshot = snapshot
+        self.non_updatable = set(non_updatable)
+        self.ignore_fields = set(ignore_fields)
+        self.fetch_batch_size = fetch_batch_size
+        self.full = 0
+        self.partial = 0
+        self.unchanged = 0
+
+    @property
+    def key_fields(self):
+        fields = [self.searcher.unique_field, self.searcher.db_field]
+        # CommonSearcher
+        if getattr(self.searcher, 'type_field', None):
+            fields.append(self.searcher.type_field)
+        return tuple(fields)
+
+    def fetch(self, keys):
+        """Returns indexed documents for ``keys`` using realtime get."""
+        docs = {}
+        unique_field = self.searcher.unique_field
+        for i in range(0, len(keys), self.fetch_batch_size):
+            batch = keys[i:i + self.fetch_batch_size]
+            results = self.searcher.solr.get(ids=','.join(force_unicode(k) for k in batch))
+            for doc in results.docs:
+                docs[force_unicode(doc[unique_field])] = doc
+        return docs
+
+    def get_old_docs(self, keys):
+        if self.snapshot is None:
+            return self.fetch(keys)
+        old_docs = {}
+        for key in keys:
+            doc = self.snapshot.get(key)
+            if doc is not None:
+                old_docs[key] = doc
+        return old_docs
+
+    def diff(self, docs):
+        """Returns list of ``(key, doc, update)`` for the changed documents."""
+        keyed = []
+        for doc in docs:
+            if not doc:
+                continue
+            key = self.searcher.get_doc_unique_value(doc)
+            keyed.append((force_unicode(key) if key is not None else None, doc))
+        old_docs = self.get_old_docs([key for key, _ in keyed if key is not None])
+
+        changed = []
+        for key, doc in keyed:
+            update = diff_doc(old_docs.get(key), doc,
+                              key_fields=self.key_fields,
+                              non_updatable=self.non_updatable,
+                              ignore_fields=self.ignore_fields)
+            if update is None:
+                self.unchanged += 1
+                continue
+            if update is doc:
+                self.full += 1
+            else:
+                self.partial += 1
+            changed.append((key, doc, update))
+        return changed
+
+    def add(self, docs, commit=True):
+        changed = self.diff(docs)
+        if not changed:
+            return None
+        result = self.searcher.add([update for _, _, update in changed], commit=commit)
+        if self.snapshot is not None:
+            for key, doc, _ in changed:
+                if key is not None:
+                    self.snapshot[key] = doc
+        return result
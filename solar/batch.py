@@ -0,0 +1,136 @@
+from __future__ import unicode_literals
+
+import threading
+
+from .indexer import estimate_doc_size
+
+
+class UpdateBatch(object):
+    """Collects adds, atomic updates and deletes and sends them in order
+    with as few update requests as possible.
+
+    Pending commands are sent with :meth:`flush` when there are
+    ``max_commands`` of them or their approximate size exceeds ``max_bytes``.
+    Only the last request made by :meth:`close` commits if ``commit``
+    is ``True``. Used as a context manager the batch is closed on exit,
+    pending commands are dropped if an exception was raised.
+
+    Usage::
+
+        with searcher.update_batch(commit=True) as batch:
+            batch.add([{'id': 1, 'name': 'Nokia'}])
+            batch.add([{'id': 2, 'price': {'inc': 10}}])
+            batch.delete_ids([3, 4])
+            batch.delete(category='obsolete')
+    """
+    max_commands = 1000
+    max_bytes = 1024 * 1024
+
+    def __init__(self, searcher, max_commands=None, max_bytes=None, commit=False,
+                 format=None):
+        self.searcher = searcher
+        if max_commands is not None:
+            self.max_commands = max_commands
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self.commit = commit
+        self.format = format
+        self.requests = 0
+        self.commands = 0
+        self._pending = []
+        self._size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def _push(self, name, command, size):
+        """Appends command and returns ``True`` if the batch must be flushed."""
+        self._pending.append((name, command))
+        self._size += size
+        return (len(self._pending) >= self.max_commands or
+                self._size >= self.max_bytes)
+
+    def _append(self, name, command, size):
+        with self._lock:
+            if self._push(name, command, size):
+                self.flush()
+
+    def _add_commands(self, docs):
+        for doc in docs:
+            if not doc:
+                continue
+            doc = self.searcher.prepare_doc(doc)
+            yield 'add', doc, estimate_doc_size(doc)
+
+    def _delete_ids_commands(self, ids):
+        for id in ids:
+            id = self.searcher.get_unique_value(id)
+            yield 'delete', {'id': id}, len('%s' % id) + 16
+
+    def _delete_command(self, *args, **kwargs):
+        q = self.searcher.make_delete_query(*args, **kwargs)
+        return 'delete', {'query': q}, len(q) + 16
+
+    def _take(self, commit):
+        """Returns pending commands to send or ``None`` if there is nothing to do."""
+        commands = self._pending
+        if not commands and not commit:
+            return None
+        self._pending = []
+        self._size = 0
+        return commands
+
+    def add(self, docs):
+        """Adds documents, values can be atomic updates."""
+        for command in self._add_commands(docs):
+            self._append(*command)
+
+    def delete_ids(self, ids):
+        for command in self._delete_ids_commands(ids):
+            self._append(*command)
+
+    def delete(self, *args, **kwargs):
+        """Deletes documents matching query,
+        accepts the same arguments as :meth:`SolrSearcher.delete`.
+        """
+        self._append(*self._delete_command(*args, **kwargs))
+
+    def flush(self, commit=False):
+        """Sends pending commands. Returns ``None`` if there was nothing to send
+        and ``commit`` is ``False``.
+        """
+        with self._lock:
+            commands = self._take(commit)
+            if commands is None:
+                return None
+            searcher = self.searcher
+            try:
+                result = searcher.solr.batch_update(
+                    commands, format=self.format,
+                    **searcher._update_commit_params(commit))
+            finally:
+                searcher._invalidate_cache()
+            self.requests += 1
+            self.commands += len(commands)
+        searcher._request_commit(commit)
+        return result
+
+    def close(self):
+        """Sends pending commands and commits if ``commit`` is ``True``."""
+        return self.flush(commit=self.commit)
+
+    def discard(self):
+        """Drops pending commands."""
+        with self._lock:
+            self._pending = []
+            self._size = 0
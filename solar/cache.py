@@ -0,0 +1,90 @@
+from __future__ import unicode_literals
+
+import time
+import logging
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+
+log = logging.getLogger(__name__)
+
+
+class ResultCache(object):
+    """Size-bounded LRU cache of the decoded Solr responses.
+
+    Entries expire after ``ttl`` seconds, every entry can have its own ttl.
+
+    If ``version_check_interval`` is set the searcher asks Solr for
+    the index version at most once per interval and the cache is cleared
+    when the version changes.
+
+    Usage::
+
+        searcher = SolrSearcher('http://localhost:8983/solr',
+                                cache=ResultCache(maxsize=10000, ttl=60))
+    """
+    def __init__(self, maxsize=1000, ttl=60, version_check_interval=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self._next_version_check = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                self.misses += 1
+                return None
+            # move to the end as most recently used
+            self._data[key] = item
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires_at, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def needs_version_check(self):
+        """Returns ``True`` if it is time to check index version."""
+        if self.version_check_interval is None:
+            return False
+        now = time.time()
+        with self._lock:
+            if now < self._next_version_check:
+                return False
+            self._next_version_check = now + self.version_check_interval
+            return True
+
+    def update_version(self, version):
+        if version != self.version:
+            if self.version is not None:
+                log.debug('Index version changed: %s -> %s, clearing cache',
+                          self.version, version)
+                self.clear()
+            self.version = version
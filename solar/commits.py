@@ -0,0 +1,217 @@
+from __future__ import unicode_literals
+
+import time
+import logging
+import threading
+from collections import deque
+
+
+log = logging.getLogger(__name__)
+
+
+class CommitManager(object):
+    """Coalesces commits of the Solr index.
+
+    Instead of committing on every update call :meth:`request_commit`
+    which only marks the index as dirty. A background thread makes
+    all the pending changes visible with one soft commit every
+    ``soft_commit_interval`` seconds and flushes them to disk with a hard
+    commit that does not open new searcher every ``hard_commit_interval``
+    seconds.
+
+    If ``commit_within`` (in milliseconds) is set the searcher sends updates
+    with ``commitWithin`` parameter and soft commits are left to Solr;
+    changes are considered visible when ``commit_within`` milliseconds
+    have passed since the commit was requested.
+
+    Callers that need to read their own writes can wait for visibility::
+
+        commit_manager = CommitManager(solr, soft_commit_interval=1)
+        searcher = SolrSearcher(solr=solr, commit_manager=commit_manager)
+        searcher.add(docs)
+        searcher.wait_for_commit(timeout=5)
+
+    ``on_commit`` callbacks are called after every soft commit
+    and after the ``commit_within`` window passed.
+    Commits are sent from the background thread so ``solr`` must be
+    a blocking :class:`~solar.pysolr.Solr` instance even when it is used
+    with an asynchronous searcher.
+    """
+    def __init__(self, solr, soft_commit_interval=1.0, hard_commit_interval=60,
+                 commit_within=None):
+        self.solr = solr
+        self.soft_commit_interval = soft_commit_interval
+        self.hard_commit_interval = hard_commit_interval
+        self.commit_within = commit_within
+        self.on_commit = []
+        self.soft_commits = 0
+        self.hard_commits = 0
+        # number of the last commit request and of the last visible one
+        self.requested = 0
+        self.committed = 0
+        self._hard_pending = False
+        self._next_hard_commit = None
+        # (time, ticket) pairs of changes sent with commitWithin
+        self._visible_at = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    def request_commit(self):
+        """Marks changes as pending and returns ticket for :meth:`wait`."""
+        with self._cond:
+            self.requested += 1
+            self._hard_pending = True
+            if self._next_hard_commit is None and self.hard_commit_interval is not None:
+                self._next_hard_commit = time.time() + self.hard_commit_interval
+            ticket = self.requested
+            if self.commit_within is not None:
+                self._visible_at.append((time.time() + self.commit_within / 1000.0, ticket))
+            self._cond.notify_all()
+        self._start()
+        return ticket
+
+    def wait(self, ticket=None, timeout=None):
+        """Blocks until changes for the ``ticket`` are visible.
+
+        Without ``ticket`` waits for all the changes requested so far.
+        When soft commits are not made in the background
+        (``soft_commit_interval`` is ``None`` and there is no ``commit_within``)
+        soft commit is made immediately.
+        Returns ``False`` if ``timeout`` expired.
+        """
+        with self._cond:
+            if ticket is None:
+                ticket = self.requested
+            if self.committed >= ticket:
+                return True
+        if self.commit_within is None and self.soft_commit_interval is None:
+            self.soft_commit()
+            return True
+
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._cond:
+            while self.committed < ticket:
+                if deadline is None:
+                    self._cond.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+            return True
+
+    def soft_commit(self):
+        """Makes all the pending changes visible."""
+        with self._cond:
+            ticket = self.requested
+            if self.committed >= ticket:
+                return
+        self.solr.commit(softCommit=True)
+        with self._cond:
+            self.soft_commits += 1
+            self.committed = max(self.committed, ticket)
+            while self._visible_at and self._visible_at[0][1] <= self.committed:
+                self._visible_at.popleft()
+            self._cond.notify_all()
+        for callback in self.on_commit:
+            callback()
+
+    def _commit_within_passed(self):
+        """Marks changes sent with commitWithin as visible when their time has come."""
+        now = time.time()
+        with self._cond:
+            ticket = None
+            while self._visible_at and self._visible_at[0][0] <= now:
+                ticket = self._visible_at.popleft()[1]
+            if ticket is None or ticket <= self.committed:
+                return
+            self.committed = ticket
+            self._cond.notify_all()
+        for callback in self.on_commit:
+            callback()
+
+    def hard_commit(self):
+        """Flushes all the changes to disk without opening new searcher."""
+        with self._cond:
+            if not self._hard_pending:
+                return
+            self._hard_pending = False
+            self._next_hard_commit = None
+        try:
+            self.solr.commit(openSearcher=False)
+        except Exception:
+            with self._cond:
+                self._hard_pending = True
+            raise
+        self.hard_commits += 1
+
+    def flush(self):
+        """Commits all the pending changes now."""
+        self.soft_commit()
+        self.hard_commit()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def _start(self):
+        if (self.commit_within is None and self.soft_commit_interval is None and
+                self.hard_commit_interval is None):
+            return
+        with self._cond:
+            if self._thread is not None or self._closed:
+                return
+            thread = self._thread = threading.Thread(
+                target=self._run, name='solr-commit-manager')
+            thread.daemon = True
+        thread.start()
+
+    def _next_run(self):
+        next_run = None
+        if self.commit_within is not None:
+            if self._visible_at:
+                next_run = self._visible_at[0][0]
+        elif self.soft_commit_interval is not None and self.committed < self.requested:
+            next_run = time.time() + self.soft_commit_interval
+        if next_run is None:
+            return self._next_hard_commit
+        if self._next_hard_commit is not None:
+            return min(next_run, self._next_hard_commit)
+        return next_run
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    next_run = self._next_run()
+                    if next_run is not None:
+                        break
+                    # nothing to commit, wait for requests
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # give other writes the chance to join this commit
+                while not self._closed:
+                    remaining = next_run - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                hard = (self._next_hard_commit is not None and
+                        self._next_hard_commit <= time.time())
+            try:
+                if self.commit_within is not None:
+                    self._commit_within_passed()
+                elif self.soft_commit_interval is not None:
+                    self.soft_commit()
+                if hard:
+                    self.hard_commit()
+            except Exception:
+                log.exception('Error when committing Solr index')
@@ -20,6 +20,11 @@ if PY2:
 else:
     from itertools import zip_longest
 
+if PY2:
+    import Queue as queue
+else:
+    import queue
+
 if PY2:
     def implements_to_string(cls):
         cls.__unicode__ = cls.__str__
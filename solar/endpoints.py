@@ -0,0 +1,329 @@
+from __future__ import unicode_literals
+
+import math
+import time
+import random
+import logging
+import threading
+from collections import deque
+
+
+log = logging.getLogger(__name__)
+
+
+class CircuitBreaker(object):
+    """Per-node circuit breaker.
+
+    Keeps outcomes of the last ``window`` requests. When at least
+    ``min_calls`` were made and the share of failed requests reaches
+    ``error_rate`` or the share of requests slower than ``slow_call_duration``
+    seconds reaches ``slow_call_rate`` the circuit opens and requests
+    are rejected. After ``reset_timeout`` seconds the circuit becomes half-open
+    and lets ``half_open_calls`` trial requests through: if they succeed
+    the circuit is closed, otherwise it is opened again.
+
+    ``transitions`` counts how many times each state was entered
+    and ``rejected`` counts requests that were not allowed.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, error_rate=0.5, slow_call_duration=None, slow_call_rate=0.5,
+                 window=20, min_calls=10, reset_timeout=10, half_open_calls=1):
+        self.error_rate = error_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.name = None
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.transitions = {self.CLOSED: 0, self.OPEN: 0, self.HALF_OPEN: 0}
+        self.rejected = 0
+        self._calls = deque(maxlen=window)
+        self._trials = 0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        log.warning('Circuit breaker of %s changed state: %s -> %s',
+                    self.name, self.state, state)
+        self.state = state
+        self.transitions[state] += 1
+        if state == self.OPEN:
+            self.opened_at = time.time()
+        self._calls.clear()
+        self._trials = 0
+
+    def allow(self):
+        """Returns ``True`` if a request can be sent."""
+        with self._lock:
+            if (self.state == self.OPEN and
+                    time.time() - self.opened_at >= self.reset_timeout):
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, failed, latency):
+        slow = (self.slow_call_duration is not None and
+                latency >= self.slow_call_duration)
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                if failed or slow:
+                    self._set_state(self.OPEN)
+                else:
+                    self._calls.append((False, False))
+                    if len(self._calls) >= self.half_open_calls:
+                        self._set_state(self.CLOSED)
+                return
+            if self.state == self.OPEN:
+                return
+            self._calls.append((failed, slow))
+            n = len(self._calls)
+            if n < self.min_calls:
+                return
+            failures = sum(1 for f, _ in self._calls if f)
+            slows = sum(1 for _, sl in self._calls if sl)
+            if (failures >= self.error_rate * n or
+                    slows >= self.slow_call_rate * n):
+                self._set_state(self.OPEN)
+
+
+class Endpoint(object):
+    """Single Solr node.
+
+    Tracks number of requests in flight and peak-EWMA of the latency:
+    a slower response raises the average immediately while faster ones
+    decay it over ``decay`` seconds.
+    """
+    decay = 10.0
+
+    def __init__(self, url, breaker=None):
+        self.url = url
+        self.breaker = breaker
+        if breaker is not None:
+            breaker.name = url
+        self.alive = True
+        self.ejected_at = None
+        self.pending = 0
+        self.ewma = 0.0
+        self._stamp = time.time()
+
+    def observe(self, latency):
+        now = time.time()
+        if latency > self.ewma:
+            self.ewma = latency
+        else:
+            w = math.exp(-(now - self._stamp) / self.decay)
+            self.ewma = self.ewma * w + latency * (1.0 - w)
+        self._stamp = now
+
+    @property
+    def cost(self):
+        return self.ewma * (self.pending + 1)
+
+    def __repr__(self):
+        return '<Endpoint {!r} {}>'.format(
+            self.url, 'alive' if self.alive else 'dead')
+
+
+class RoundRobinPolicy(object):
+    """Rotates requests across endpoints."""
+    def __init__(self):
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def order(self, endpoints):
+        with self._lock:
+            n = self._counter
+            self._counter += 1
+        n = n % len(endpoints)
+        return endpoints[n:] + endpoints[:n]
+
+
+class PeakEwmaPolicy(object):
+    """Picks the less loaded of two random endpoints (power of two choices)
+    using peak-EWMA latency multiplied by number of requests in flight.
+    """
+    def order(self, endpoints):
+        if len(endpoints) < 2:
+            return list(endpoints)
+        a, b = random.sample(endpoints, 2)
+        if b.cost < a.cost:
+            a, b = b, a
+        rest = sorted((e for e in endpoints if e is not a and e is not b),
+                      key=lambda e: e.cost)
+        return [a, b] + rest
+
+
+POLICIES = {
+    'round_robin': RoundRobinPolicy,
+    'peak_ewma': PeakEwmaPolicy,
+}
+
+
+class EndpointPool(object):
+    """Set of Solr replicas which requests are rotated across.
+
+    Nodes that failed are ejected from rotation and probed
+    with ``check`` callable every ``check_interval`` seconds
+    in a background thread until they are alive again.
+    ``check`` accepts an endpoint and returns ``True`` when it is healthy.
+    Pass ``check_interval=None`` to disable background probing.
+
+    ``policy`` is ``'round_robin'`` (default), ``'peak_ewma'``
+    or an object with ``order(endpoints)`` method.
+
+    Latencies of the last ``window`` read requests are kept
+    to calculate percentiles for hedged requests.
+
+    ``breaker`` is a factory of :class:`CircuitBreaker` objects,
+    one is created for every endpoint. Default is ``None``
+    that disables circuit breakers.
+    """
+    min_samples = 20
+
+    def __init__(self, urls, check=None, check_interval=5, policy=None, window=1000,
+                 breaker=None):
+        self.endpoints = [Endpoint(url, breaker=breaker() if breaker else None)
+                          for url in urls]
+        if not self.endpoints:
+            raise ValueError('At least one url must be specified')
+        self.check_fn = check
+        self.check_interval = check_interval
+        if policy is None:
+            policy = 'round_robin'
+        if policy in POLICIES:
+            policy = POLICIES[policy]()
+        self.policy = policy
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._checker = None
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    @property
+    def alive(self):
+        return [e for e in self.endpoints if e.alive]
+
+    @property
+    def dead(self):
+        return [e for e in self.endpoints if not e.alive]
+
+    def candidates(self, failover=True):
+        """Returns endpoints in the order they should be tried.
+
+        Alive nodes go first, dead nodes are used only as a last resort
+        so requests are still sent when the whole cluster is ejected.
+        Without ``failover`` only the first candidate is returned.
+        """
+        alive = self.alive
+        if alive:
+            endpoints = self.policy.order(alive)
+            if failover:
+                endpoints += self.dead
+        else:
+            endpoints = self.policy.order(self.endpoints)
+        if not failover:
+            return endpoints[:1]
+        return endpoints
+
+    def request_started(self, endpoint):
+        """Returns ``False`` if circuit breaker of the endpoint is open."""
+        if endpoint.breaker is not None and not endpoint.breaker.allow():
+            return False
+        with self._lock:
+            endpoint.pending += 1
+        return True
+
+    def request_finished(self, endpoint, latency, read=True, failed=False):
+        with self._lock:
+            endpoint.pending -= 1
+            endpoint.observe(latency)
+            if read:
+                self._latencies.append(latency)
+        if endpoint.breaker is not None:
+            endpoint.breaker.record(failed, latency)
+
+    def breaker_stats(self):
+        """Returns state and counters of the circuit breakers by urls."""
+        stats = {}
+        for endpoint in self.endpoints:
+            breaker = endpoint.breaker
+            if breaker is None:
+                continue
+            stats[endpoint.url] = {
+                'state': breaker.state,
+                'transitions': dict(breaker.transitions),
+                'rejected': breaker.rejected,
+            }
+        return stats
+
+    def latency_percentile(self, percentile):
+        """Returns latency percentile of the recent read requests
+        or ``None`` if there are not enough samples yet.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        ix = int(math.ceil(percentile / 100.0 * len(latencies))) - 1
+        return latencies[min(max(ix, 0), len(latencies) - 1)]
+
+    def mark_dead(self, endpoint):
+        with self._lock:
+            if not endpoint.alive:
+                return
+            endpoint.alive = False
+            endpoint.ejected_at = time.time()
+        log.warning('Solr node %s is ejected', endpoint.url)
+        self._start_checker()
+
+    def mark_alive(self, endpoint):
+        with self._lock:
+            if endpoint.alive:
+                return
+            endpoint.alive = True
+            endpoint.ejected_at = None
+        log.info('Solr node %s is alive again', endpoint.url)
+
+    def check(self):
+        """Probes all the dead endpoints once."""
+        for endpoint in self.dead:
+            try:
+                healthy = self.check_fn(endpoint)
+            except Exception:
+                log.debug('Health check for %s failed', endpoint.url, exc_info=True)
+                healthy = False
+            if healthy:
+                self.mark_alive(endpoint)
+
+    def _start_checker(self):
+        if self.check_fn is None or self.check_interval is None:
+            return
+        with self._lock:
+            if self._checker is not None:
+                return
+            checker = self._checker = threading.Thread(
+                target=self._run_checker, name='solr-health-checker')
+            checker.daemon = True
+        checker.start()
+
+    def _run_checker(self):
+        while True:
+            time.sleep(self.check_interval)
+            self.check()
+            with self._lock:
+                if all(e.alive for e in self.endpoints):
+                    self._checker = None
+                    return
@@ -0,0 +1,208 @@
+from __future__ import unicode_literals
+
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .pysolr import Solr
+from .util import LocalParams, json_default
+
+
+log = logging.getLogger(__name__)
+
+
+class PartitionStats(object):
+    def __init__(self, partition, docs=0, seconds=0.0, error=None):
+        self.partition = partition
+        self.docs = docs
+        self.seconds = seconds
+        self.error = error
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    @property
+    def docs_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return self.docs / self.seconds
+
+    def __repr__(self):
+        return '<PartitionStats {}: {} docs in {:.3f}s, {:.0f} docs/s{}>'.format(
+            self.partition, self.docs, self.seconds, self.docs_per_second,
+            ', failed: {}'.format(self.error) if self.failed else '')
+
+
+class ExportStats(object):
+    def __init__(self, partitions, seconds):
+        self.partitions = partitions
+        self.seconds = seconds
+
+    @property
+    def docs(self):
+        return sum(p.docs for p in self.partitions)
+
+    @property
+    def failed_partitions(self):
+        return [p for p in self.partitions if p.failed]
+
+    @property
+    def docs_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return self.docs / self.seconds
+
+
+def _iter_batches(solr, mode, q, params, batch_size):
+    """Yields lists of rows of one partition."""
+    if mode == 'export':
+        batch = []
+        for row in solr.export(q, **params):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+
+    cursor_mark = '*'
+    while True:
+        results = solr.search(q, cursorMark=cursor_mark, rows=batch_size, **params)
+        if results.docs:
+            yield results.docs
+        if not results.docs or results.next_cursor_mark in (None, cursor_mark):
+            return
+        cursor_mark = results.next_cursor_mark
+
+
+def _write_rows(f, rows):
+    f.write(b''.join(
+        json.dumps(row, default=json_default).encode('utf-8') + b'\n'
+        for row in rows))
+
+
+def _export_partition(solr, partition, mode, q, params, batch_size, path=None, sink=None):
+    # solr is an url when running in a separate process
+    if not isinstance(solr, Solr):
+        solr = Solr(solr)
+    stats = PartitionStats(partition)
+    start_time = time.time()
+    f = open(path.format(partition=partition), 'wb') if path else None
+    try:
+        for rows in _iter_batches(solr, mode, q, params, batch_size):
+            if f is not None:
+                _write_rows(f, rows)
+            else:
+                sink(rows, partition)
+            stats.docs += len(rows)
+    except Exception as e:
+        log.exception('Failed to export partition %s', partition)
+        stats.error = e
+    finally:
+        if f is not None:
+            f.close()
+    stats.seconds = time.time() - start_time
+    log.info('Exported partition %s: %s docs in %.1fs, %.0f docs/s',
+             partition, stats.docs, stats.seconds, stats.docs_per_second)
+    return stats
+
+
+class ParallelExporter(object):
+    """Dumps all the documents matching the query splitting it
+    into ``partitions`` disjoint parts with ``{!hash}`` filter
+    on the unique field, which must have docValues.
+    Every partition is read in its own worker.
+
+    ``mode`` is ``'cursor'`` to page with ``cursorMark`` over ``/select``
+    or ``'export'`` to stream with the ``/export`` handler; the latter
+    is faster but requires ``fields`` (or :meth:`SolrQuery.only`)
+    with docValues. Rows are plain dictionaries.
+
+    :meth:`run` writes rows as JSON lines into the ``path``; when the path
+    contains ``{partition}`` every partition gets its own file. Otherwise
+    lists of rows are passed with the partition number to ``callback``,
+    calls are serialized. With ``processes=True`` partitions are exported
+    in separate processes, then only per-partition files are supported.
+
+    Usage::
+
+        exporter = ParallelExporter(searcher.search(status=0), partitions=8,
+                                    mode='export', fields=['id', 'price'])
+        stats = exporter.run(path='/tmp/products-{partition}.json')
+        for p in stats.partitions:
+            log.info('%s: %.0f docs/s', p.partition, p.docs_per_second)
+    """
+    def __init__(self, query, partitions=4, mode='cursor', fields=None,
+                 batch_size=1000, processes=False):
+        if mode not in ('cursor', 'export'):
+            raise ValueError('Unknown export mode: {0}'.format(mode))
+        self.query = query
+        self.partitions = partitions
+        self.mode = mode
+        self.fields = fields
+        self.batch_size = batch_size
+        self.processes = processes
+
+    def partition_query(self, partition):
+        unique_field = self.query.searcher.unique_field
+        return self.query.filter(_local_params=LocalParams(
+            'hash', workers=self.partitions, worker=partition,
+            partitionKeys=unique_field, cache='false'))
+
+    def partition_params(self, partition):
+        """Returns ``(q, params)`` of the request for the partition."""
+        query = self.partition_query(partition)
+        if self.mode == 'export':
+            return query._make_q(), query._export_params(self.fields or ())
+        if self.fields:
+            query = query.only(*self.fields)
+        params = query._cursor_clone(self.batch_size)._prepare_params()
+        params.pop('rows', None)
+        return query._make_q(), params
+
+    def run(self, path=None, callback=None):
+        """Exports all the partitions and returns :class:`ExportStats`."""
+        if (path is None) == (callback is None):
+            raise ValueError('Specify either path or callback')
+        per_partition = path is not None and '{partition}' in path
+        if self.processes and not per_partition:
+            raise ValueError('Path must contain {partition} to export in processes')
+
+        lock = threading.Lock()
+        merged = None
+        if path is not None and not per_partition:
+            merged = open(path, 'wb')
+
+            def callback(rows, partition):
+                _write_rows(merged, rows)
+
+        def sink(rows, partition):
+            with lock:
+                callback(rows, partition)
+
+        solr = self.query.searcher.solr
+        start_time = time.time()
+        if self.processes:
+            executor = ProcessPoolExecutor(max_workers=self.partitions)
+            solr = solr.url
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.partitions)
+        try:
+            futures = []
+            for partition in range(self.partitions):
+                q, params = self.partition_params(partition)
+                futures.append(executor.submit(
+                    _export_partition, solr, partition, self.mode, q, params,
+                    self.batch_size,
+                    path=path if per_partition else None,
+                    sink=None if per_partition else sink))
+            partitions = [future.result() for future in futures]
+        finally:
+            executor.shutdown(wait=True)
+            if merged is not None:
+                merged.close()
+        return ExportStats(partitions, time.time() - start_time)
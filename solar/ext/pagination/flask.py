@@ -24,7 +24,14 @@ class Pagination(object):
         
     @property
     def pages(self):
-        return int(ceil(self.total / float(self.per_page)))
+        pages = int(ceil(self.total / float(self.per_page)))
+        # do not link to the pages rejected by the deep paging policy
+        deep_paging = self.query.query.searcher.deep_paging
+        if deep_paging is not None:
+            max_pages = deep_paging.max_pages(self.per_page)
+            if max_pages is not None:
+                pages = min(pages, max_pages)
+        return pages
 
     def prev(self):
         return type(self)(
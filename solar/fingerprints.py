@@ -0,0 +1,79 @@
+from __future__ import unicode_literals
+
+import json
+import hashlib
+import threading
+
+try:
+    import dbm
+except ImportError:
+    import anydbm as dbm
+
+from .compat import force_unicode
+from .util import json_default
+
+
+def doc_fingerprint(doc):
+    """Returns hash of the canonical serialization of the document."""
+    data = json.dumps(doc, default=json_default, sort_keys=True,
+                      separators=(',', ':'))
+    return hashlib.sha1(data.encode('utf-8')).digest()[:16]
+
+
+class FingerprintStore(object):
+    """Persistent map from document's unique value to its fingerprint.
+
+    Fingerprints are kept in a :mod:`dbm` database at ``path``.
+    :class:`~solar.indexer.BulkIndexer` skips documents whose fingerprint
+    did not change and stores fingerprints of the sent documents after
+    Solr accepted them.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._db = dbm.open(path, 'c')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(key):
+        return force_unicode(key).encode('utf-8')
+
+    def get(self, key):
+        with self._lock:
+            try:
+                return self._db[self._key(key)]
+            except KeyError:
+                return None
+
+    def is_changed(self, key, fingerprint):
+        return self.get(key) != fingerprint
+
+    def update(self, fingerprints):
+        """Stores ``(key, fingerprint)`` pairs."""
+        with self._lock:
+            for key, fingerprint in fingerprints:
+                self._db[self._key(key)] = fingerprint
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                try:
+                    del self._db[self._key(key)]
+                except KeyError:
+                    pass
+
+    def keys(self):
+        with self._lock:
+            return [k.decode('utf-8') for k in self._db.keys()]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._db)
+
+    def sync(self):
+        with self._lock:
+            if hasattr(self._db, 'sync'):
+                self._db.sync()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,326 @@
+from __future__ import unicode_literals
+
+import json
+import time
+import logging
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+from .compat import queue, string_types, force_unicode
+from .fingerprints import doc_fingerprint
+from .pysolr import SolrError
+from .util import json_default
+
+
+log = logging.getLogger(__name__)
+
+
+def estimate_doc_size(doc):
+    """Returns approximate size of the document in the update message."""
+    size = 0
+    for key, value in doc.items():
+        size += len(key) + 8
+        if isinstance(value, dict):
+            size += estimate_doc_size(value)
+        elif isinstance(value, (list, tuple)):
+            for v in value:
+                size += _estimate_value_size(v) + 8
+        else:
+            size += _estimate_value_size(value)
+    return size
+
+
+def _estimate_value_size(value):
+    if isinstance(value, string_types):
+        return len(value)
+    if value is None:
+        return 0
+    return len(force_unicode(value))
+
+
+class BatchResult(object):
+    def __init__(self, docs, size, seconds, error=None, rejected=None):
+        self.docs = docs
+        self.size = size
+        self.seconds = seconds
+        self.error = error
+        # (doc, error) pairs of the documents Solr refused to index
+        self.rejected = rejected or []
+
+    @property
+    def ndocs(self):
+        return len(self.docs)
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    @property
+    def docs_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return self.ndocs / self.seconds
+
+    def __repr__(self):
+        return '<BatchResult {} docs, {} bytes in {:.3f}s{}{}>'.format(
+            self.ndocs, self.size, self.seconds,
+            ', rejected: {}'.format(len(self.rejected)) if self.rejected else '',
+            ', failed: {}'.format(self.error) if self.failed else '')
+
+
+class DeadLetterFile(object):
+    """Appends rejected documents with the error messages to a file,
+    one JSON object per line. Can be passed as ``dead_letter``
+    to :class:`BulkIndexer`.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+        self._lock = threading.Lock()
+
+    def __call__(self, doc, error):
+        line = json.dumps({'doc': doc, 'error': force_unicode(error)},
+                          default=json_default, sort_keys=True)
+        with self._lock:
+            self._file.write(line.encode('utf-8') + b'\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class IndexStats(object):
+    def __init__(self):
+        self.batches = 0
+        self.docs = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.rejected = 0
+        self.size = 0
+        self.seconds = 0.0
+        self.failed_batches = []
+        self._lock = threading.Lock()
+
+    def add_batch(self, result):
+        with self._lock:
+            self.batches += 1
+            if result.failed:
+                self.failed_batches.append(result)
+                return
+            self.docs += result.ndocs - len(result.rejected)
+            self.size += result.size
+            self.rejected += len(result.rejected)
+
+    @property
+    def failed_docs(self):
+        return sum(r.ndocs for r in self.failed_batches)
+
+    @property
+    def docs_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return self.docs / self.seconds
+
+
+class BulkIndexer(object):
+    """Indexes documents from an arbitrary iterable.
+
+    Documents are grouped into batches of at most ``batch_size`` documents
+    and about ``batch_bytes`` bytes. Batches are sent with ``searcher.add``
+    from ``workers`` threads; when ``queue_size`` batches are waiting
+    the producer is blocked. Documents with the same unique value in a batch
+    are deduplicated, the last one wins.
+
+    Failed batches do not stop indexing, they are reported in the returned
+    :class:`IndexStats`. ``on_batch`` is called with :class:`BatchResult`
+    for every sent batch.
+
+    When Solr rejects a document of a batch (responds with one of
+    ``bisect_statuses``) and ``bisect`` is ``True`` the batch is split in halves that are sent again
+    recursively, so a malformed document is found in about ``2 * log2(n)``
+    additional requests and the rest of the batch is indexed. Rejected
+    documents are passed with the error to ``dead_letter`` callable,
+    for example :class:`DeadLetterFile`, and counted in ``stats.rejected``
+    instead of ``stats.docs``.
+
+    Index is committed once after all the batches were sent
+    if ``commit`` is ``True``.
+
+    With :class:`~solar.fingerprints.FingerprintStore` as ``fingerprints``
+    documents that did not change since they were indexed last time are
+    skipped; if ``delete_missing`` is ``True`` documents that are present
+    in the store but were not passed to :meth:`index` are deleted,
+    so pass all the documents in this case.
+
+    Usage::
+
+        indexer = BulkIndexer(searcher, batch_size=500, workers=4)
+        stats = indexer.index(make_doc(obj) for obj in query.yield_per(500))
+        log.info('Indexed %s docs, %.1f docs/s', stats.docs, stats.docs_per_second)
+    """
+    # statuses of the responses to the requests with invalid documents,
+    # other errors (e.g. 401 or 404) fail the whole batch
+    bisect_statuses = (400, 413)
+
+    def __init__(self, searcher, batch_size=1000, batch_bytes=10 * 1024 * 1024,
+                 workers=4, queue_size=None, commit=True, on_batch=None,
+                 fingerprints=None, delete_missing=False, delete_batch_size=500,
+                 bisect=True, dead_letter=None):
+        self.searcher = searcher
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.workers = workers
+        self.queue_size = queue_size or workers * 2
+        self.commit = commit
+        self.on_batch = on_batch
+        self.fingerprints = fingerprints
+        self.delete_missing = delete_missing
+        self.delete_batch_size = delete_batch_size
+        self.bisect = bisect
+        self.dead_letter = dead_letter
+
+    def _make_batch(self, batch, size):
+        docs = []
+        fingerprints = []
+        for key, (doc, _, fingerprint) in batch.items():
+            docs.append(doc)
+            if fingerprint is not None:
+                fingerprints.append((key, fingerprint))
+        return docs, size, fingerprints
+
+    def _batches(self, docs, stats, seen):
+        batch = OrderedDict()
+        size = 0
+        for doc in docs:
+            if not doc:
+                continue
+            key = self.searcher.get_doc_unique_value(doc)
+            fingerprint = None
+            if key is None:
+                key = object()
+            elif self.fingerprints is not None:
+                key = force_unicode(key)
+                fingerprint = doc_fingerprint(doc)
+            prev = batch.pop(key, None)
+            if prev is not None:
+                stats.duplicates += 1
+                size -= prev[1]
+            if fingerprint is not None:
+                # a duplicate can follow a changed document from a previous batch
+                if key not in seen and not self.fingerprints.is_changed(key, fingerprint):
+                    seen.add(key)
+                    stats.skipped += 1
+                    continue
+                seen.add(key)
+            doc_size = estimate_doc_size(doc)
+            batch[key] = (doc, doc_size, fingerprint)
+            size += doc_size
+            if len(batch) >= self.batch_size or size >= self.batch_bytes:
+                yield self._make_batch(batch, size)
+                batch = OrderedDict()
+                size = 0
+        if batch:
+            yield self._make_batch(batch, size)
+
+    def _add(self, docs, rejected):
+        try:
+            self.searcher.add(docs, commit=False)
+        except SolrError as e:
+            if not self.bisect or e.status_code not in self.bisect_statuses:
+                raise
+            if len(docs) == 1:
+                log.warning('Solr rejected document %r: %s',
+                            self.searcher.get_doc_unique_value(docs[0]), e)
+                rejected.append((docs[0], e))
+                return
+            middle = len(docs) // 2
+            self._add(docs[:middle], rejected)
+            self._add(docs[middle:], rejected)
+
+    def send_batch(self, docs, size, fingerprints=None):
+        start_time = time.time()
+        error = None
+        rejected = []
+        try:
+            self._add(docs, rejected)
+        except Exception as e:
+            log.exception('Failed to index batch of %s documents', len(docs))
+            error = e
+        else:
+            if rejected:
+                rejected_keys = set(
+                    force_unicode(self.searcher.get_doc_unique_value(doc))
+                    for doc, _ in rejected)
+                fingerprints = [(key, fingerprint) for key, fingerprint in fingerprints or ()
+                                if key not in rejected_keys]
+                if self.dead_letter is not None:
+                    for doc, e in rejected:
+                        self.dead_letter(doc, e)
+            if fingerprints:
+                self.fingerprints.update(fingerprints)
+        return BatchResult(docs, size, time.time() - start_time, error=error,
+                           rejected=rejected)
+
+    def _delete_missing(self, seen, stats):
+        missing = [key for key in self.fingerprints.keys() if key not in seen]
+        unique_field = '{}__in'.format(self.searcher.unique_field)
+        for i in range(0, len(missing), self.delete_batch_size):
+            keys = missing[i:i + self.delete_batch_size]
+            self.searcher.delete(commit=False, **{unique_field: keys})
+            self.fingerprints.delete(keys)
+            stats.deleted += len(keys)
+
+    def _worker(self, batches, stats):
+        while True:
+            item = batches.get()
+            try:
+                if item is None:
+                    return
+                result = self.send_batch(*item)
+                stats.add_batch(result)
+                if self.on_batch:
+                    try:
+                        self.on_batch(result)
+                    except Exception:
+                        # worker must stay alive, otherwise index() blocks forever
+                        log.exception('Error in on_batch callback')
+            finally:
+                batches.task_done()
+
+    def index(self, docs):
+        stats = IndexStats()
+        start_time = time.time()
+        batches = queue.Queue(maxsize=self.queue_size)
+        threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, args=(batches, stats),
+                                 name='solr-indexer-{}'.format(i))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+
+        seen = set()
+        try:
+            for batch in self._batches(docs, stats, seen):
+                # blocks when all the workers are busy and the queue is full
+                batches.put(batch)
+        finally:
+            for t in threads:
+                batches.put(None)
+            for t in threads:
+                t.join()
+
+        if self.fingerprints is not None:
+            if self.delete_missing and not stats.failed_batches:
+                self._delete_missing(seen, stats)
+            self.fingerprints.sync()
+        if self.commit:
+            self.searcher.commit()
+        stats.seconds = time.time() - start_time
+        return stats
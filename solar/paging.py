@@ -0,0 +1,166 @@
+from __future__ import unicode_literals
+
+import time
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+from .compat import force_unicode
+from .pysolr import Results, SolrError
+from .util import make_request_key
+
+
+class DeepPagingError(SolrError):
+    """Raised when a query requests a page that is too deep."""
+    pass
+
+
+def cursor_sort(sort, unique_field):
+    """Adds unique field to the prepared ``sort`` parameter as a tiebreaker."""
+    fields = [s.strip() for s in force_unicode(sort or '').split(',') if s.strip()]
+    if not any(s.split()[0] == unique_field for s in fields):
+        fields.append('{} asc'.format(unique_field))
+    return ','.join(fields)
+
+
+class DeepPagingPolicy(object):
+    """Protects Solr from the requests with large ``start``,
+    every such request makes Solr collect and sort ``start + rows`` documents.
+
+    Requests with ``start`` greater than ``max_start`` are handled
+    according to ``mode``:
+
+    - ``'reject'`` raises :exc:`DeepPagingError`;
+    - ``'clamp'`` sends the request with ``start=max_start``;
+    - ``'cursor'`` fetches the page with ``cursorMark``. Cursor marks are
+      remembered for ``cursor_ttl`` seconds per query (at most
+      ``cursor_cache_size`` queries), so sequential deep pages cost
+      the same as the first ones. To reach a page without a remembered mark
+      the unique values are walked from the nearest known position in
+      chunks of ``walk_rows``; if that takes more than ``max_walk``
+      requests the page is handled according to ``walk_fallback``
+      (``'reject'`` or ``'clamp'``). Unique field is added to the sort
+      as a tiebreaker, so documents with equal sort values can be ordered
+      differently than on the shallow pages. Grouped queries are rejected.
+
+    :class:`~solar.ext.pagination.flask.Pagination` does not show the pages
+    that cannot be reached in ``'reject'`` and ``'clamp'`` modes.
+
+    Usage::
+
+        searcher = SolrSearcher('http://localhost:8983/solr',
+                                deep_paging=DeepPagingPolicy(max_start=5000,
+                                                             mode='cursor'))
+    """
+    def __init__(self, max_start=10000, mode='reject', cursor_cache_size=1000,
+                 cursor_ttl=600, walk_rows=1000, max_walk=10, walk_fallback='reject'):
+        if mode not in ('reject', 'clamp', 'cursor'):
+            raise ValueError('Unknown deep paging mode: {0}'.format(mode))
+        if walk_fallback not in ('reject', 'clamp'):
+            raise ValueError('Unknown walk fallback: {0}'.format(walk_fallback))
+        self.max_start = max_start
+        self.mode = mode
+        self.cursor_cache_size = cursor_cache_size
+        self.cursor_ttl = cursor_ttl
+        self.walk_rows = walk_rows
+        self.max_walk = max_walk
+        self.walk_fallback = walk_fallback
+        self._cursors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def max_pages(self, per_page):
+        """Returns the number of reachable pages or ``None`` if all of them
+        can be reached."""
+        if self.mode == 'cursor':
+            return None
+        return self.max_start // per_page + 1
+
+    def check(self, params):
+        """Rejects or clamps deep request in place.
+
+        Returns ``True`` if the page must be fetched with cursor.
+        """
+        start = int(params.get('start') or 0)
+        if start <= self.max_start:
+            return False
+        if self.mode == 'clamp':
+            params['start'] = self.max_start
+            return False
+        if self.mode == 'reject' or params.get('group'):
+            raise DeepPagingError(
+                'Start {0} is greater than allowed {1}'.format(start, self.max_start))
+        return True
+
+    def select(self, searcher, q, params):
+        """Returns raw results of the request with ``params``."""
+        if not self.check(params):
+            return searcher.select(q, **params)
+        return self._select_cursor(searcher, q, params)
+
+    def _cursor_key(self, q, params):
+        return make_request_key(q, dict(
+            (p, v) for p, v in params.items()
+            if p not in ('start', 'rows', 'cursorMark', '_cache_ttl')))
+
+    def _nearest(self, key, start):
+        """Returns ``(position, cursor_mark)`` nearest to the ``start``."""
+        now = time.time()
+        with self._lock:
+            item = self._cursors.pop(key, None)
+            if item is None or item[0] <= now:
+                return 0, '*'
+            self._cursors[key] = item
+            positions = [p for p in item[1] if p <= start]
+            if not positions:
+                return 0, '*'
+            position = max(positions)
+            return position, item[1][position]
+
+    def _remember(self, key, position, cursor_mark):
+        with self._lock:
+            item = self._cursors.pop(key, None)
+            if item is None or item[0] <= time.time():
+                item = (time.time() + self.cursor_ttl, {})
+            item[1][position] = cursor_mark
+            self._cursors[key] = item
+            while len(self._cursors) > self.cursor_cache_size:
+                self._cursors.popitem(last=False)
+
+    def _select_cursor(self, searcher, q, params):
+        start = int(params['start'])
+        cursor_params = dict(params, sort=cursor_sort(params.get('sort'), searcher.unique_field))
+        del cursor_params['start']
+        key = self._cursor_key(q, cursor_params)
+        position, cursor_mark = self._nearest(key, start)
+        walk = -(-(start - position) // self.walk_rows)
+        if self.max_walk is not None and walk > self.max_walk:
+            if self.walk_fallback == 'reject':
+                raise DeepPagingError(
+                    'Start {0} is too far from the known cursor positions'.format(start))
+            params['start'] = self.max_start
+            return searcher.select(q, **params)
+        params = cursor_params
+
+        # only unique values are fetched to skip documents
+        walk_params = dict(params, fl=searcher.unique_field,
+                           facet='false', hl='false', stats='false')
+        while position < start:
+            walk_params['rows'] = min(self.walk_rows, start - position)
+            walk_params['cursorMark'] = cursor_mark
+            raw_results = searcher.select(q, **walk_params)
+            if not raw_results.docs or raw_results.next_cursor_mark is None:
+                # there are no documents at the start
+                return Results([], raw_results.hits)
+            position += len(raw_results.docs)
+            cursor_mark = raw_results.next_cursor_mark
+            self._remember(key, position, cursor_mark)
+
+        params['cursorMark'] = cursor_mark
+        raw_results = searcher.select(q, **params)
+        if raw_results.docs and raw_results.next_cursor_mark is not None:
+            self._remember(key, position + len(raw_results.docs),
+                           raw_results.next_cursor_mark)
+        return raw_results
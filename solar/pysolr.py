@@ -8,8 +8,14 @@ import logging
 import re
 import requests
 import time
-import types
 import ast
+import zlib
+import codecs
+import itertools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .endpoints import EndpointPool
 
 try:
     # Prefer lxml, if installed.
@@ -125,6 +131,15 @@ def force_bytes(value):
     return value
 
 
+def format_date(value):
+    """
+    Formats date or datetime the way Solr expects, e.g. ``2013-05-01T12:30:00Z``.
+    """
+    if hasattr(value, 'hour'):
+        return "%sZ" % value.isoformat()
+    return "%sT00:00:00Z" % value.isoformat()
+
+
 def unescape_html(text):
     """
     Removes HTML or XML character references and entities from a text string.
@@ -209,13 +224,68 @@ def clean_xml_string(s):
 
 
 class SolrError(Exception):
+    """
+    Optionally accepts ``status_code`` of the HTTP response.
+    """
+    def __init__(self, *args, **kwargs):
+        self.status_code = kwargs.pop('status_code', None)
+        super(SolrError, self).__init__(*args, **kwargs)
+
+    @property
+    def is_client_error(self):
+        """
+        ``True`` if Solr rejected the request itself, for example
+        because of a malformed document, so it must not be retried as is.
+        """
+        return self.status_code is not None and 400 <= self.status_code < 500
+
+
+class SolrUnavailableError(SolrError):
+    """
+    Raised when a Solr node could not serve a request: the connection
+    failed, timed out or the node responded that it is unavailable.
+    """
+    pass
+
+
+class SolrCircuitOpenError(SolrError):
+    """
+    Raised without sending a request when circuit breakers
+    of the Solr nodes are open.
+    """
     pass
 
 
+class CompressionStats(object):
+    """
+    Counts bytes before and after compression of update requests
+    and the time spent on it.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.raw_size = 0
+        self.compressed_size = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, raw_size, compressed_size, seconds):
+        with self._lock:
+            self.requests += 1
+            self.raw_size += raw_size
+            self.compressed_size += compressed_size
+            self.seconds += seconds
+
+    @property
+    def ratio(self):
+        if not self.raw_size:
+            return None
+        return float(self.compressed_size) / self.raw_size
+
+
 class Results(object):
     def __init__(self, docs, hits, highlighting=None, facets=None,
                  spellcheck=None, stats=None, qtime=None, debug=None,
-                 grouped=None):
+                 grouped=None, next_cursor_mark=None):
         self.docs = docs
         self.hits = hits
         self.highlighting = highlighting or {}
@@ -225,6 +295,7 @@ class Results(object):
         self.qtime = qtime
         self.debug = debug or {}
         self.grouped = grouped or {}
+        self.next_cursor_mark = next_cursor_mark
 
     def __len__(self):
         return len(self.docs)
@@ -237,40 +308,223 @@ class Solr(object):
     """
     The main object for working with Solr.
 
+    Accepts ``url`` of the Solr core or a list of urls of its replicas.
+    Requests are rotated across replicas, nodes that fail to respond are
+    ejected from the rotation until a health check succeeds and read
+    requests are retried on the next live node.
+
     Optionally accepts ``decoder`` for an alternate JSON decoder instance.
     Default is ``json.JSONDecoder()``.
 
     Optionally accepts ``timeout`` for wait seconds until giving up on a
     request. Default is ``60`` seconds.
 
+    Optionally accepts ``check_interval`` for seconds between health checks
+    of ejected nodes. Default is ``5`` seconds.
+
+    Optionally accepts ``policy`` for choosing a replica: ``'round_robin'``
+    or ``'peak_ewma'`` that prefers the less loaded of two random replicas
+    by their recent latency. Default is ``'round_robin'``.
+
+    Optionally accepts ``hedge_percentile``. If the search request was not
+    answered within this percentile of recent search latencies the duplicate
+    request is sent to another replica and the first successful response
+    is used. Default is ``None`` that disables hedged requests.
+
+    Optionally accepts ``circuit_breaker`` for a factory of
+    :class:`solar.endpoints.CircuitBreaker` objects. Every node gets its own
+    breaker and requests to the node fail fast with ``SolrCircuitOpenError``
+    while its breaker is open; such requests, updates included, are sent
+    to the next node. Default is ``None``.
+
+    Optionally accepts ``gzip_min_size``. Update requests whose body is
+    at least this number of bytes are sent with ``Content-Encoding: gzip``,
+    Solr's servlet container must be configured to inflate request bodies.
+    Sizes and time of the compression are counted in ``compression_stats``.
+    Default is ``None`` that disables compression.
+
     Usage::
 
         solr = pysolr.Solr('http://localhost:8983/solr')
         # With a 10 second timeout.
         solr = pysolr.Solr('http://localhost:8983/solr', timeout=10)
+        # With two replicas
+        solr = pysolr.Solr(['http://solr1:8983/solr', 'http://solr2:8983/solr'])
+        # Hedge searches slower than 95% of the others
+        solr = pysolr.Solr(['http://solr1:8983/solr', 'http://solr2:8983/solr'],
+                           policy='peak_ewma', hedge_percentile=95)
+        # Stop sending requests to a node for 30 seconds
+        # if a half of the requests failed or took more than a second
+        solr = pysolr.Solr('http://localhost:8983/solr',
+                           circuit_breaker=functools.partial(
+                               CircuitBreaker, slow_call_duration=1,
+                               reset_timeout=30))
 
     """
-    def __init__(self, url, decoder=None, timeout=60, max_get_params_length=1023):
+    # statuses which mean that node cannot serve requests right now,
+    # note that Solr responds 500 on some malformed queries
+    unavailable_statuses = (502, 503, 504)
+    ping_path = 'admin/ping?wt=json'
+    read_paths = ('select', 'get', 'mlt', 'terms', 'export', 'admin/ping')
+
+    hedge_min_delay = 0.005
+    hedge_workers = 32
+    # maximum number of kept connections per node
+    pool_maxsize = 32
+    # format of the add requests: 'xml' or 'json'
+    update_format = 'xml'
+    json_chunk_size = 64 * 1024
+    gzip_level = 6
+    # size of the chunks read from the streamed responses
+    stream_chunk_size = 64 * 1024
+
+    def __init__(self, url, decoder=None, timeout=60, max_get_params_length=1023,
+                 check_interval=5, policy=None, hedge_percentile=None,
+                 circuit_breaker=None, gzip_min_size=None):
         self.decoder = decoder or json.JSONDecoder()
-        self.url = url
+        if isinstance(url, (list, tuple)):
+            urls = list(url)
+        else:
+            urls = [url]
+        self.url = urls[0]
+        self.endpoints = EndpointPool(urls, check=self._ping_endpoint,
+                                      check_interval=check_interval,
+                                      policy=policy, breaker=circuit_breaker)
+        self.hedge_percentile = hedge_percentile
+        self.gzip_min_size = gzip_min_size
+        self.compression_stats = CompressionStats()
+        self._executor = None
+        self._executor_lock = threading.Lock()
         self.timeout = timeout
         self.max_get_params_length = max_get_params_length
         self.log = self._get_log()
         self.session = requests.Session()
         self.session.stream = False
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
     def _get_log(self):
         return LOG
 
-    def _create_full_url(self, path=''):
+    def _create_full_url(self, path='', url=None):
+        url = url or self.url
         if len(path):
-            return '/'.join([self.url.rstrip('/'), path.lstrip('/')])
+            return '/'.join([url.rstrip('/'), path.lstrip('/')])
 
         # No path? No problem.
-        return self.url
-
-    def _send_request(self, method, path='', body=None, headers=None, files=None):
-        url = self._create_full_url(path)
+        return url
+
+    def _is_read_request(self, method, path):
+        return method.lower() == 'get' or path.lstrip('/').startswith(self.read_paths)
+
+    def _ping_endpoint(self, endpoint):
+        url = self._create_full_url(self.ping_path, endpoint.url)
+        resp = requests.get(url, timeout=self.timeout)
+        return resp.status_code == 200
+
+    def _can_retry(self, err, read):
+        # request rejected by the circuit breaker was not sent at all,
+        # so even updates can be sent to another node
+        return read or isinstance(err, SolrCircuitOpenError)
+
+    def _send_request(self, method, path='', body=None, headers=None, files=None,
+                      stream=False):
+        read = self._is_read_request(method, path)
+        endpoints = self.endpoints.candidates()
+        for i, endpoint in enumerate(endpoints):
+            try:
+                return self._send_endpoint_request(
+                    endpoint, method, path, body=body, headers=headers, files=files,
+                    stream=stream)
+            except (SolrUnavailableError, SolrCircuitOpenError) as err:
+                if isinstance(err, SolrUnavailableError):
+                    self.endpoints.mark_dead(endpoint)
+                if i == len(endpoints) - 1 or not self._can_retry(err, read):
+                    raise
+                self.log.warning("Retrying request to '%s' on another node", path)
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers)
+            return self._executor
+
+    def _send_hedged_request(self, method, path='', body=None, headers=None):
+        """
+        Sends request to the best replica and if it does not respond
+        in time sends the same request to the next replicas.
+        Returns the first successful response.
+
+        The first request is sent from its own thread, so the number of
+        concurrent searches is not limited by ``hedge_workers`` and the delay
+        does not include the time spent in the executor's queue;
+        only the hedged requests are sent from the executor.
+        """
+        delay = self.endpoints.latency_percentile(self.hedge_percentile)
+        if delay is None or len(self.endpoints.alive) < 2:
+            return self._send_request(method, path, body=body, headers=headers)
+        delay = max(delay, self.hedge_min_delay)
+        endpoints = self.endpoints.candidates()
+        primary = endpoints.pop(0)
+
+        futures = [self._start_thread(
+            self._send_failover_request, [primary], method, path, body, headers)]
+        hedged = False
+        error = None
+        while futures:
+            done, pending = wait(futures, timeout=None if hedged else delay,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except (SolrUnavailableError, SolrCircuitOpenError) as err:
+                    error = err
+            futures = list(pending)
+            if not hedged:
+                # the first replica is slow or has failed
+                hedged = True
+                self.log.debug("Hedging request to '%s' after %0.3f seconds", path, delay)
+                futures.append(self._get_executor().submit(
+                    self._send_failover_request, endpoints, method, path, body, headers))
+        raise error
+
+    @staticmethod
+    def _start_thread(func, *args):
+        """Calls ``func`` in a new daemon thread and returns its future."""
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        future.set_running_or_notify_cancel()
+        thread = threading.Thread(target=run, name='solr-request')
+        thread.daemon = True
+        thread.start()
+        return future
+
+    def _send_failover_request(self, endpoints, method, path, body, headers):
+        """Tries ``endpoints`` in order until one of them is available."""
+        for i, endpoint in enumerate(endpoints):
+            try:
+                return self._send_endpoint_request(
+                    endpoint, method, path, body=body, headers=dict(headers or {}))
+            except (SolrUnavailableError, SolrCircuitOpenError) as err:
+                if isinstance(err, SolrUnavailableError):
+                    self.endpoints.mark_dead(endpoint)
+                if i == len(endpoints) - 1:
+                    raise
+
+    def _send_endpoint_request(self, endpoint, method, path='', body=None, headers=None, files=None,
+                               stream=False):
+        """
+        Returns the body of the response, or an iterator over its byte chunks
+        if ``stream`` is ``True``.
+        """
+        url = self._create_full_url(path, endpoint.url)
         method = method.lower()
         log_body = body
 
@@ -284,13 +538,18 @@ class Solr(object):
 
         self.log.debug("Starting request to '%s' (%s) with body '%s'...",
                        url, method, log_body[:10])
-        start_time = time.time()
 
         try:
             requests_method = getattr(self.session, method, 'get')
         except AttributeError as err:
             raise SolrError("Unable to send HTTP method '{0}.".format(method))
 
+        read = self._is_read_request(method, path)
+        if not self.endpoints.request_started(endpoint):
+            raise SolrCircuitOpenError(
+                "Circuit breaker for server '%s' is open" % endpoint.url)
+        start_time = time.time()
+        failed = True
         try:
             # Everything except the body can be Unicode. The body must be
             # encoded to bytes to work properly on Py3.
@@ -303,30 +562,52 @@ class Solr(object):
                 headers['Content-type'] = 'application/xml; charset=UTF-8'
 
             resp = requests_method(url, data=bytes_body, headers=headers, files=files,
-                                   timeout=self.timeout)
+                                   timeout=self.timeout, stream=stream)
+            failed = int(resp.status_code) in self.unavailable_statuses
         except requests.exceptions.Timeout as err:
             error_message = "Connection to server '%s' timed out: %s"
             self.log.error(error_message, url, err, exc_info=True)
-            raise SolrError(error_message % (url, err))
+            raise SolrUnavailableError(error_message % (url, err))
         except requests.exceptions.ConnectionError as err:
             error_message = "Failed to connect to server at '%s', are you sure that URL is correct? Checking it in a browser might help: %s"
             params = (url, err)
             self.log.error(error_message, *params, exc_info=True)
-            raise SolrError(error_message % params)
+            raise SolrUnavailableError(error_message % params)
+        finally:
+            self.endpoints.request_finished(endpoint, time.time() - start_time,
+                                            read=read, failed=failed)
 
         end_time = time.time()
         self.log.info("Finished '%s' (%s) with body '%s' in %0.3f seconds.",
                       url, method, log_body[:10], end_time - start_time)
 
         if int(resp.status_code) != 200:
-            error_message = self._extract_error(resp)
+            error_message = self._extract_error(resp.headers, resp.content)
             self.log.error(error_message, extra={'data': {'headers': resp.headers,
                                                           'response': resp.content}})
-            raise SolrError(error_message)
+            if int(resp.status_code) in self.unavailable_statuses:
+                raise SolrUnavailableError(error_message, status_code=int(resp.status_code))
+            raise SolrError(error_message, status_code=int(resp.status_code))
 
+        if stream:
+            return self._iter_response(resp)
         return force_unicode(resp.content)
 
-    def _select(self, params):
+    def _iter_response(self, resp):
+        """
+        Yields byte chunks of the streamed response, the connection
+        is released when the iteration is finished or abandoned.
+        """
+        try:
+            for chunk in resp.iter_content(self.stream_chunk_size):
+                yield chunk
+        finally:
+            resp.close()
+
+    def _select_request(self, params):
+        """
+        Returns ``(method, path, body, headers)`` for a select request.
+        """
         # specify json encoding of results
         params['wt'] = 'json'
         params_encoded = safe_urlencode(params, True)
@@ -334,14 +615,19 @@ class Solr(object):
         if len(params_encoded) <= self.max_get_params_length:
             # Typical case.
             path = 'select/?%s' % params_encoded
-            return self._send_request('get', path)
+            return 'get', path, None, None
         else:
             # Handles very long queries by submitting as a POST.
             path = 'select/'
             headers = {
                 'Content-type': 'application/x-www-form-urlencoded; charset=utf-8',
             }
-            return self._send_request('post', path, body=params_encoded, headers=headers)
+            return 'post', path, params_encoded, headers
+
+    def _select(self, params):
+        if self.hedge_percentile:
+            return self._send_hedged_request(*self._select_request(params))
+        return self._send_request(*self._select_request(params))
 
     def _get(self, params):
         params['wt'] = 'json'
@@ -360,7 +646,9 @@ class Solr(object):
         path = 'terms/?%s' % safe_urlencode(params, True)
         return self._send_request('get', path)
 
-    def _update(self, message, clean_ctrl_chars=True, commit=True, waitFlush=None, waitSearcher=None):
+    def _update(self, message, clean_ctrl_chars=True, commit=True, waitFlush=None, waitSearcher=None,
+                commitWithin=None, softCommit=None, openSearcher=None,
+                content_type='text/xml; charset=utf-8', params=None):
         """
         Posts the given xml message to http://<self.url>/update and
         returns the result.
@@ -369,6 +657,9 @@ class Solr(object):
         of control characters (default True). This is done by default because
         these characters would cause Solr to fail to parse the XML. Only pass
         False if you're positive your data is clean.
+
+        The message can be a generator of byte chunks, then it is sent
+        with chunked transfer encoding and is not cleaned.
         """
         path = 'update/'
 
@@ -386,24 +677,91 @@ class Solr(object):
         if waitSearcher is not None:
             query_vars.append('waitSearcher=%s' % str(bool(waitSearcher)).lower())
 
+        if commitWithin is not None:
+            query_vars.append('commitWithin=%d' % int(commitWithin))
+
+        if softCommit is not None:
+            query_vars.append('softCommit=%s' % str(bool(softCommit)).lower())
+
+        if openSearcher is not None:
+            query_vars.append('openSearcher=%s' % str(bool(openSearcher)).lower())
+
+        if params:
+            query_vars.append(safe_urlencode(sorted(params.items())))
+
         if query_vars:
             path = '%s?%s' % (path, '&'.join(query_vars))
 
         # Clean the message of ctrl characters.
-        if clean_ctrl_chars:
+        if clean_ctrl_chars and isinstance(message, (bytes, type(''))):
             message = sanitize(message)
 
-        return self._send_request('post', path, message, {'Content-type': 'text/xml; charset=utf-8'})
+        headers = {'Content-type': content_type}
+        message, compressed = self._maybe_compress(message)
+        if compressed:
+            headers['Content-Encoding'] = 'gzip'
+        return self._send_request('post', path, message, headers)
+
+    def _compress_chunks(self, chunks):
+        """
+        Gzips byte chunks as they are consumed.
+        """
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        raw_size = compressed_size = 0
+        seconds = 0.0
+        for chunk in chunks:
+            raw_size += len(chunk)
+            start_time = time.time()
+            data = compressor.compress(chunk)
+            seconds += time.time() - start_time
+            if data:
+                compressed_size += len(data)
+                yield data
+        start_time = time.time()
+        data = compressor.flush()
+        seconds += time.time() - start_time
+        compressed_size += len(data)
+        self.compression_stats.add(raw_size, compressed_size, seconds)
+        yield data
 
-    def _extract_error(self, resp):
+    def _maybe_compress(self, body):
+        """
+        Returns ``(body, compressed)``. Bodies smaller than ``gzip_min_size``
+        are not compressed; a generator body is read only until the threshold
+        is reached and then is compressed while it is being sent.
+        """
+        if self.gzip_min_size is None or body is None:
+            return body, False
+
+        if isinstance(body, (bytes, type(''))):
+            data = force_bytes(body)
+            if len(data) < self.gzip_min_size:
+                return body, False
+            return b''.join(self._compress_chunks([data])), True
+
+        chunks = iter(body)
+        head = []
+        size = 0
+        for chunk in chunks:
+            chunk = force_bytes(chunk)
+            head.append(chunk)
+            size += len(chunk)
+            if size >= self.gzip_min_size:
+                break
+        else:
+            return b''.join(head), False
+        rest = (force_bytes(chunk) for chunk in chunks)
+        return self._compress_chunks(itertools.chain(head, rest)), True
+
+    def _extract_error(self, headers, content):
         """
         Extract the actual error message from a solr response.
         """
-        reason = resp.headers.get('reason', None)
+        reason = headers.get('reason', None)
         full_html = None
 
         if reason is None:
-            reason, full_html = self._scrape_response(resp.headers, resp.content)
+            reason, full_html = self._scrape_response(headers, content)
 
         msg = "[Reason: %s]" % reason
 
@@ -517,10 +875,7 @@ class Solr(object):
         we send to solr.
         """
         if hasattr(value, 'strftime'):
-            if hasattr(value, 'hour'):
-                value = "%sZ" % value.isoformat()
-            else:
-                value = "%sT00:00:00Z" % value.isoformat()
+            value = format_date(value)
         elif isinstance(value, bool):
             if value:
                 value = 'true'
@@ -639,7 +994,9 @@ class Solr(object):
         params = {'q': q}
         params.update(kwargs)
         response = self._select(params)
+        return self._parse_search(response)
 
+    def _parse_search(self, response):
         # TODO: make result retrieval lazy and allow custom result objects
         result = self.decoder.decode(response)
         result_kwargs = {}
@@ -665,6 +1022,9 @@ class Solr(object):
         if result.get('grouped'):
             result_kwargs['grouped'] = result['grouped']
 
+        if result.get('nextCursorMark'):
+            result_kwargs['next_cursor_mark'] = result['nextCursorMark']
+
         response = result.get('response') or {}
         numFound = response.get('numFound', 0)
         self.log.debug("Found '%s' search results.", numFound)
@@ -694,10 +1054,12 @@ class Solr(object):
             params = {'ids': ids}
         params.update(kwargs)
         response = self._get(params)
+        return self._parse_get(response, single=id is not None)
 
+    def _parse_get(self, response, single=False):
         result = self.decoder.decode(response)
 
-        if id is not None:
+        if single:
             docs = list(filter(None, [result.get('doc')]))
             numFound = len(docs)
         else:
@@ -706,6 +1068,84 @@ class Solr(object):
             numFound = response.get('numFound', 0)
         return Results(docs, numFound)
 
+    def export(self, q, fl, sort, **kwargs):
+        """
+        Streams all the documents matching the query with the ``/export``
+        handler and yields them as dictionaries.
+
+        Requires ``q``, ``fl`` and ``sort``. Only docValues fields
+        can be exported.
+
+        Optionally accepts ``**kwargs`` for additional options,
+        for example ``fq``.
+
+        The response is parsed while it is being received, so memory usage
+        does not depend on the number of documents.
+
+        Usage::
+
+            for row in solr.export('*:*', fl='id,price', sort='id asc'):
+                ...
+
+        """
+        params = {'q': q, 'fl': fl, 'sort': sort, 'wt': 'json'}
+        params.update(kwargs)
+        chunks = self._send_request(
+            'post', 'export', safe_urlencode(params, True),
+            headers={'Content-type': 'application/x-www-form-urlencoded; charset=utf-8'},
+            stream=True)
+        return self._parse_export(chunks)
+
+    _export_docs_re = re.compile(r'"docs"\s*:\s*\[')
+
+    def _parse_export(self, chunks):
+        """
+        Incrementally parses documents of the JSON response from byte chunks.
+        """
+        decode_chunk = codecs.getincrementaldecoder('utf-8')().decode
+        chunks = iter(chunks)
+        try:
+            buf = ''
+            pos = None
+            while pos is None:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise SolrError('Malformed export response: %s' % buf[:100])
+                buf += decode_chunk(chunk)
+                match = self._export_docs_re.search(buf)
+                if match:
+                    pos = match.end()
+
+            eof = False
+            while True:
+                while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buf) and buf[pos] == ']':
+                    return
+                try:
+                    if pos == len(buf):
+                        raise ValueError('No data')
+                    doc, pos = self.decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if eof:
+                        raise SolrError('Malformed export response: %s' % buf[pos:pos + 100])
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        eof = True
+                        chunk = b''
+                    # drop parsed documents
+                    buf = buf[pos:] + decode_chunk(chunk, final=eof)
+                    pos = 0
+                    continue
+                if 'EXCEPTION' in doc:
+                    raise SolrError(doc['EXCEPTION'])
+                yield doc
+        finally:
+            # closes the streamed response
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
     def more_like_this(self, q, mltfl, **kwargs):
         """
         Finds and returns results similar to the provided query.
@@ -723,7 +1163,9 @@ class Solr(object):
         }
         params.update(kwargs)
         response = self._mlt(params)
+        return self._parse_mlt(response)
 
+    def _parse_mlt(self, response):
         result = self.decoder.decode(response)
 
         if result['response'] is None:
@@ -750,6 +1192,9 @@ class Solr(object):
         }
         params.update(kwargs)
         response = self._suggest_terms(params)
+        return self._parse_suggest_terms(response)
+
+    def _parse_suggest_terms(self, response):
         result = self.decoder.decode(response)
         terms = result.get("terms", {})
         res = {}
@@ -773,6 +1218,20 @@ class Solr(object):
         self.log.debug("Found '%d' Term suggestions results.", sum(len(j) for i, j in res.items()))
         return res
 
+    def index_version(self):
+        """
+        Returns version of the index, it changes after every commit
+        that made changes visible.
+
+        Requires the Luke request handler at ``admin/luke``.
+        """
+        response = self._send_request('get', 'admin/luke?numTerms=0&show=index&wt=json')
+        return self._parse_index_version(response)
+
+    def _parse_index_version(self, response):
+        result = self.decoder.decode(response)
+        return result['index']['version']
+
     def _build_doc(self, doc, boost=None):
         doc_elem = ET.Element('doc')
         
@@ -796,11 +1255,13 @@ class Solr(object):
 
             # Handle atomic updates
             if isinstance(value, dict):
-                for _key, _values in value.iteritems():
+                for _key, _values in value.items():
                     attrs = {'name': key, 'update': _key}
 
-                    if isinstance(_values, types.NoneType):
+                    if _values is None:
                         attrs['null'] = 'true'
+                        doc_elem.append(ET.Element('field', **attrs))
+                        continue
 
                     if boost and key in boost:
                         attrs['boost'] = force_unicode(boost[key])
@@ -816,7 +1277,191 @@ class Solr(object):
 
         return doc_elem
 
-    def add(self, docs, commit=True, boost=None, commitWithin=None, waitFlush=None, waitSearcher=None):
+    def _to_json_value(self, value):
+        """
+        Converts python values to a form suitable for JSON update message.
+        """
+        if hasattr(value, 'strftime'):
+            return format_date(value)
+        if isinstance(value, (bool, int, long, float)):
+            return value
+        return force_unicode(value)
+
+    def _json_field_value(self, value):
+        if isinstance(value, (list, tuple)):
+            values = [self._to_json_value(v) for v in value
+                      if not self._is_null_value(v)]
+            return values or None
+        if self._is_null_value(value):
+            return None
+        return self._to_json_value(value)
+
+    def _build_json_doc(self, doc, boost=None):
+        """
+        Returns ``add`` command of the JSON update message.
+        """
+        json_doc = {}
+        command = {'doc': json_doc}
+
+        for key, value in doc.items():
+            if key == 'boost':
+                command['boost'] = float(value)
+                continue
+
+            # Handle atomic updates
+            if isinstance(value, dict):
+                field = {}
+                for op, op_value in value.items():
+                    field[op] = self._json_field_value(op_value)
+                json_doc[key] = field
+                continue
+
+            value = self._json_field_value(value)
+            if value is None:
+                continue
+            if boost and key in boost:
+                value = {'value': value, 'boost': float(boost[key])}
+            json_doc[key] = value
+
+        return command
+
+    def _json_commands(self, commands):
+        """
+        Generates JSON update message in chunks of about ``json_chunk_size``
+        bytes from ``(name, command)`` pairs.
+        """
+        buf = [b'{']
+        size = 1
+        first = True
+        for name, command in commands:
+            part = force_bytes('%s"%s":%s' % (
+                '' if first else ',',
+                name,
+                json.dumps(command, ensure_ascii=False, separators=(',', ':'))))
+            first = False
+            buf.append(part)
+            size += len(part)
+            if size >= self.json_chunk_size:
+                yield b''.join(buf)
+                buf = []
+                size = 0
+        buf.append(b'}')
+        yield b''.join(buf)
+
+    def _to_csv_value(self, value):
+        """
+        Converts python values to a form suitable for CSV update message.
+
+        Unlike :meth:`_from_python` strings are not cleaned from the characters
+        that are invalid in XML.
+        """
+        if hasattr(value, 'strftime'):
+            return format_date(value)
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return force_unicode(value)
+
+    def _csv_value(self, value, separator, split):
+        if isinstance(value, (list, tuple)):
+            value = split.join(self._to_csv_value(v) for v in value
+                               if not self._is_null_value(v))
+        elif self._is_null_value(value):
+            return ''
+        else:
+            value = self._to_csv_value(value)
+        if (separator in value or '"' in value or '\n' in value or '\r' in value
+                or value != value.strip()):
+            value = '"%s"' % value.replace('"', '""')
+        return value
+
+    def _csv_rows(self, docs, fields, separator, split):
+        """
+        Generates CSV message in chunks of about ``json_chunk_size`` bytes.
+        """
+        buf = [force_bytes(separator.join(fields) + '\n')]
+        size = len(buf[0])
+        for doc in docs:
+            row = force_bytes(separator.join(
+                self._csv_value(doc.get(field), separator, split)
+                for field in fields) + '\n')
+            buf.append(row)
+            size += len(row)
+            if size >= self.json_chunk_size:
+                yield b''.join(buf)
+                buf = []
+                size = 0
+        if buf:
+            yield b''.join(buf)
+
+    def bulk_load_csv(self, docs, fields, separator=',', split='|', multivalued=(),
+                      batch_size=None, commit=True, commitWithin=None,
+                      waitFlush=None, waitSearcher=None):
+        """
+        Adds documents with the CSV update handler.
+
+        It is the cheapest format to build and to parse but supports only
+        flat documents without atomic updates and boosts.
+
+        Requires ``docs``, any iterable of dictionaries, and ``fields``,
+        the list of the field names in the order of the columns.
+
+        Optionally accepts ``separator`` of the columns. Default is ``','``.
+
+        Optionally accepts ``multivalued``, the list of the multivalued
+        fields, and ``split`` that separates their values, values must not
+        contain it. Default is ``()`` and ``'|'``.
+
+        Optionally accepts ``batch_size``. Documents are sent in requests
+        of ``batch_size`` documents, only the last request commits.
+        Default is ``None`` that sends all the documents in one request.
+
+        Optionally accepts ``commit``, ``commitWithin``, ``waitFlush``
+        and ``waitSearcher`` like :meth:`add`.
+
+        Usage::
+
+            solr.bulk_load_csv(docs, fields=['id', 'name', 'tags'],
+                               multivalued=['tags'])
+
+        """
+        result = None
+        for batch, last in self._csv_batches(docs, batch_size):
+            result = self._csv_update(batch, fields, separator, split, multivalued,
+                                      commit=commit if last else False,
+                                      commitWithin=commitWithin, waitFlush=waitFlush,
+                                      waitSearcher=waitSearcher)
+        return result
+
+    def _csv_batches(self, docs, batch_size):
+        """
+        Yields ``(batch, last)`` pairs, at least one batch is yielded.
+        """
+        if not batch_size:
+            yield docs, True
+            return
+
+        docs = iter(docs)
+        batch = list(itertools.islice(docs, batch_size))
+        while True:
+            next_batch = list(itertools.islice(docs, batch_size))
+            if not next_batch:
+                yield batch, True
+                return
+            yield batch, False
+            batch = next_batch
+
+    def _csv_update(self, docs, fields, separator, split, multivalued, **kwargs):
+        fields = list(fields)
+        params = {'separator': separator, 'header': 'true', 'encapsulator': '"'}
+        for field in multivalued:
+            params['f.%s.split' % field] = 'true'
+            params['f.%s.separator' % field] = split
+        return self._update(self._csv_rows(docs, fields, separator, split),
+                            content_type='application/csv; charset=utf-8',
+                            params=params, **kwargs)
+
+    def add(self, docs, commit=True, boost=None, commitWithin=None, waitFlush=None, waitSearcher=None,
+            format=None):
         """
         Adds or updates documents.
 
@@ -864,13 +1509,29 @@ class Solr(object):
 
         where possible operators are: ``set``, ``inc`` and ``add``.
 
+        Optionally accepts ``format``: ``'xml'`` or ``'json'``.
+        Default is ``update_format`` attribute.
+        JSON update message is generated while it is being sent
+        so memory usage does not depend on the number of documents
+        and ``docs`` can be any iterable.
+
         """
+        format = format or self.update_format
+        if format == 'json':
+            commands = (('add', self._build_json_doc(doc, boost=boost)) for doc in docs)
+            return self._update(self._json_commands(commands),
+                                commit=commit, commitWithin=commitWithin,
+                                waitFlush=waitFlush, waitSearcher=waitSearcher,
+                                content_type='application/json; charset=utf-8')
+        elif format != 'xml':
+            raise ValueError('Unknown update format: {0}'.format(format))
+
         start_time = time.time()
         self.log.debug("Starting to build add request...")
         message = ET.Element('add')
 
         if commitWithin:
-            message.set('commitWithin', commitWithin)
+            message.set('commitWithin', '%d' % int(commitWithin))
 
         for doc in docs:
             message.append(self._build_doc(doc, boost=boost))
@@ -884,7 +1545,7 @@ class Solr(object):
         self.log.debug("Built add request of %s docs in %0.2f seconds.", len(message), end_time - start_time)
         return self._update(m, commit=commit, waitFlush=waitFlush, waitSearcher=waitSearcher)
 
-    def delete(self, id=None, q=None, commit=True, waitFlush=None, waitSearcher=None):
+    def delete(self, id=None, q=None, commit=True, waitFlush=None, waitSearcher=None, commitWithin=None):
         """
         Deletes documents.
 
@@ -898,6 +1559,8 @@ class Solr(object):
 
         Optionally accepts ``waitSearcher``. Default is ``None``.
 
+        Optionally accepts ``commitWithin``. Default is ``None``.
+
         Usage::
 
             solr.delete(id='doc_12')
@@ -913,9 +1576,73 @@ class Solr(object):
         elif q is not None:
             m = '<delete><query>%s</query></delete>' % q
 
-        return self._update(m, commit=commit, waitFlush=waitFlush, waitSearcher=waitSearcher)
+        return self._update(m, commit=commit, waitFlush=waitFlush, waitSearcher=waitSearcher,
+                            commitWithin=commitWithin)
 
-    def commit(self, waitFlush=None, waitSearcher=None, expungeDeletes=None):
+    def _build_xml_commands(self, commands):
+        """
+        Returns ``update`` element for ``(name, command)`` pairs.
+        Consecutive commands of the same kind share an element.
+        """
+        message = ET.Element('update')
+        last_name = None
+        elem = None
+        for name, command in commands:
+            if name != last_name:
+                elem = ET.SubElement(message, name)
+                last_name = name
+            if name == 'add':
+                elem.append(self._build_doc(command))
+            elif name == 'delete':
+                if 'id' in command:
+                    ET.SubElement(elem, 'id').text = force_unicode(command['id'])
+                else:
+                    ET.SubElement(elem, 'query').text = force_unicode(command['query'])
+            else:
+                raise ValueError('Unknown update command: {0}'.format(name))
+        return message
+
+    def batch_update(self, commands, commit=True, commitWithin=None, waitFlush=None,
+                     waitSearcher=None, format=None):
+        """
+        Sends several update commands in one request.
+
+        Requires ``commands``, the list of ``(name, command)`` pairs
+        in the order they should be applied, where command is one of:
+        ``('add', doc)``, ``('delete', {'id': id})`` or
+        ``('delete', {'query': q})``. Documents can contain atomic updates
+        like in :meth:`add`.
+
+        Optionally accepts ``commit``, ``commitWithin``, ``waitFlush``,
+        ``waitSearcher`` and ``format`` like :meth:`add`.
+
+        Usage::
+
+            solr.batch_update([
+                ('add', {'id': 'doc_1', 'title': 'A test document'}),
+                ('add', {'id': 'doc_2', 'price': {'inc': 10}}),
+                ('delete', {'id': 'doc_3'}),
+                ('delete', {'query': 'category:obsolete'}),
+            ])
+
+        """
+        format = format or self.update_format
+        if format == 'json':
+            commands = ((name, self._build_json_doc(command) if name == 'add' else command)
+                        for name, command in commands)
+            return self._update(self._json_commands(commands),
+                                commit=commit, commitWithin=commitWithin,
+                                waitFlush=waitFlush, waitSearcher=waitSearcher,
+                                content_type='application/json; charset=utf-8')
+        elif format != 'xml':
+            raise ValueError('Unknown update format: {0}'.format(format))
+
+        m = force_unicode(ET.tostring(self._build_xml_commands(commands), encoding='utf-8'))
+        return self._update(m, commit=commit, commitWithin=commitWithin,
+                            waitFlush=waitFlush, waitSearcher=waitSearcher)
+
+    def commit(self, waitFlush=None, waitSearcher=None, expungeDeletes=None,
+               softCommit=None, openSearcher=None):
         """
         Forces Solr to write the index data to disk.
 
@@ -925,9 +1652,17 @@ class Solr(object):
 
         Optionally accepts ``waitSearcher``. Default is ``None``.
 
+        Optionally accepts ``softCommit``. Soft commit makes changes visible
+        without flushing them to disk. Default is ``None``.
+
+        Optionally accepts ``openSearcher``. Pass ``False`` to flush changes
+        to disk without opening new searcher. Default is ``None``.
+
         Usage::
 
             solr.commit()
+            solr.commit(softCommit=True)
+            solr.commit(openSearcher=False)
 
         """
         if expungeDeletes is not None:
@@ -935,7 +1670,8 @@ class Solr(object):
         else:
             msg = '<commit />'
 
-        return self._update(msg, waitFlush=waitFlush, waitSearcher=waitSearcher)
+        return self._update(msg, waitFlush=waitFlush, waitSearcher=waitSearcher,
+                            softCommit=softCommit, openSearcher=openSearcher)
 
     def optimize(self, waitFlush=None, waitSearcher=None, maxSegments=None):
         """
@@ -1045,7 +1781,10 @@ class SolrCoreAdmin(object):
         self.url = url
 
     def _get_url(self, url, params={}, headers={}):
-        resp = requests.get(url, data=safe_urlencode(params), headers=headers)
+        resp = requests.get(url, params=params, headers=headers)
+        if resp.status_code != 200:
+            raise SolrError("Core admin request failed (HTTP %s): %s" % (
+                resp.status_code, force_unicode(resp.content)))
         return force_unicode(resp.content)
 
     def status(self, core=None):
@@ -1147,10 +1886,8 @@ REPLACEMENTS = (
     (b'\x1f', b''), # Unit separator
 )
 
-def sanitize(data):
-    fixed_string = force_bytes(data)
+CONTROL_CHARS_REGEX = re.compile(
+    '[%s]' % ''.join(force_unicode(bad) for bad, good in REPLACEMENTS))
 
-    for bad, good in REPLACEMENTS:
-        fixed_string = fixed_string.replace(bad, good)
-
-    return force_unicode(fixed_string)
+def sanitize(data):
+    return CONTROL_CHARS_REGEX.sub('', force_unicode(data))
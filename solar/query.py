@@ -19,6 +19,10 @@ from .util import _pop_from_kwargs
 
 log = logging.getLogger(__name__)
 
+# parameters that do not change the number of found documents
+COUNT_IGNORED_PARAMS = ('start', 'sort', 'fl', 'facet', 'stats', 'group', 'hl',
+                        'debug', 'debugQuery', 'spellcheck', 'mlt', 'cursorMark')
+
 
 def _with_clone(fn):
     @wraps(fn)
@@ -74,6 +78,8 @@ class SolrQuery(object):
 
         self._iter_instances = False
 
+        self._cache_ttl = None
+
         self._result_cache = None
 
     def __str__(self):
@@ -166,8 +172,6 @@ class SolrQuery(object):
                     params[p] = v
             return params
         
-        if only_count:
-            params['rows'] = 0
         if self._fq:
             params['fq'] = [make_fq(x, local_params)
                             for x, local_params in self._fq]
@@ -175,6 +179,13 @@ class SolrQuery(object):
             params['qf'] = ' '.join(
                 starmap('{}^{}'.format,
                         filter(lambda fw: fw[1], params['qf'])))
+        if only_count:
+            # components are not needed to count documents
+            for p in list(params):
+                if p.split('.')[0] in COUNT_IGNORED_PARAMS:
+                    del params[p]
+            params['rows'] = 0
+            return
         if 'fl' not in params:
             params['fl'] = ('*', 'score')
 
@@ -194,8 +205,16 @@ class SolrQuery(object):
 
     def _do_search(self, only_count=False):
         params = self._prepare_params(only_count=only_count)
-        raw_results = self.searcher.select(self._make_q(), **params)
+        if self._cache_ttl is not None:
+            params['_cache_ttl'] = self._cache_ttl
+        if self.searcher.deep_paging is not None and not only_count:
+            raw_results = self.searcher.deep_paging.select(
+                self.searcher, self._make_q(), params)
+        else:
+            raw_results = self.searcher.select(self._make_q(), **params)
+        return self._make_results(raw_results)
 
+    def _make_results(self, raw_results):
         facet_fields = clone_all(self._facet_fields)
         facet_queries = clone_all(self._facet_queries)
         facet_dates = clone_all(self._facet_dates)
@@ -230,6 +249,7 @@ class SolrQuery(object):
         clone._instance_mapper = self._instance_mapper
         clone._db_query = self._db_query
         clone._iter_instances = self._iter_instances
+        clone._cache_ttl = self._cache_ttl
         return clone
 
     @_with_clone
@@ -265,8 +285,121 @@ class SolrQuery(object):
     def all(self):
         return list(self.results)
 
+    def _cached_count(self):
+        # number of groups is not known for grouped results
+        if self._result_cache is not None and not self._groupeds:
+            return self._result_cache.ndocs
+        return None
+
+    def _count_params(self):
+        params = self._prepare_params(only_count=True)
+        if self._cache_ttl is not None:
+            params['_cache_ttl'] = self._cache_ttl
+        return params
+
     def count(self):
-        return self._clone()._fetch_results(only_count=True).ndocs
+        """Returns the number of found documents.
+
+        Does not make a request if the results are already fetched,
+        otherwise only the query and filters are sent.
+        """
+        ndocs = self._cached_count()
+        if ndocs is not None:
+            return ndocs
+        return self.searcher.select(self._make_q(), **self._count_params()).hits
+
+    def _cursor_clone(self, batch_size):
+        if self._groupeds or self._params.get('group'):
+            raise ValueError('Grouped query cannot be paged with cursor')
+        clone = self._clone()
+        # facets, stats and highlighting must not be computed for every page
+        clone._facet_fields = []
+        clone._facet_queries = []
+        clone._facet_dates = []
+        clone._facet_ranges = []
+        clone._facet_pivots = []
+        clone._stats_fields = []
+        for name in ('facet', 'stats', 'group', 'hl'):
+            clone._remove_component(name)
+        sort = clone._params.get('sort') or ()
+        if not isinstance(sort, (list, tuple)):
+            sort = [s.strip() for s in force_unicode(sort).split(',')]
+        sort = list(sort)
+        # cursor requires unique field to be a tiebreaker
+        unique_field = self.searcher.unique_field
+        if not any(force_unicode(s).split()[:1] == [unique_field] for s in sort):
+            sort.append('{} asc'.format(unique_field))
+        clone._params['sort'] = tuple(sort)
+        clone._params['rows'] = batch_size
+        clone._params.pop('start', None)
+        # pages must not be kept in the searcher cache
+        clone._cache_ttl = 0
+        return clone
+
+    def _iter_page(self, results):
+        if self._iter_instances:
+            return (doc.instance for doc in results.docs if doc.instance)
+        return iter(results.docs)
+
+    @staticmethod
+    def _next_cursor_mark(results, cursor_mark):
+        next_cursor_mark = results.raw_results.next_cursor_mark
+        if not results.docs or next_cursor_mark in (None, cursor_mark):
+            return None
+        return next_cursor_mark
+
+    def iterator(self, batch_size=1000):
+        """Iterates over all the matching documents fetching them
+        in batches of ``batch_size`` with ``cursorMark``. Unlike slicing
+        every batch costs the same, and only one batch is kept in memory.
+
+        Unique field is added to the sort as a tiebreaker,
+        ``offset`` and ``limit`` are ignored, facets, stats and highlighting
+        are not requested. Grouped queries raise :exc:`ValueError`.
+        Yields instances if :meth:`instances` was called,
+        instances are mapped per batch.
+
+        Usage::
+
+            for doc in searcher.search().order_by('-date_created').iterator(5000):
+                ...
+        """
+        clone = self._cursor_clone(batch_size)
+        cursor_mark = '*'
+        while cursor_mark is not None:
+            clone._params['cursorMark'] = cursor_mark
+            results = clone._do_search()
+            for doc in self._iter_page(results):
+                yield doc
+            cursor_mark = self._next_cursor_mark(results, cursor_mark)
+
+    def export(self, *fields):
+        """Streams all the matching documents with the ``/export`` handler
+        and yields plain dictionaries with ``fields``, by default
+        the fields set with :meth:`only`. All the fields must have docValues.
+
+        Sort of the query is used, by default documents are sorted
+        by the unique field. ``offset``, ``limit``, facets and the other
+        components are ignored.
+
+        Usage::
+
+            for row in searcher.search(status=0).export('id', 'price'):
+                ...
+        """
+        return self.searcher.export(self._make_q(), **self._export_params(fields))
+
+    def _export_params(self, fields=()):
+        clone = self._clone()
+        if fields:
+            clone._params['fl'] = tuple(fields)
+        elif 'fl' not in clone._params:
+            raise ValueError('Specify fields to export')
+        if not clone._params.get('sort'):
+            clone._params['sort'] = '{} asc'.format(self.searcher.unique_field)
+        params = clone._prepare_params()
+        return dict((p, params[p]) for p in ('fl', 'sort', 'fq', 'defType', 'qf')
+                    if p in params)
 
     @_with_clone
     def instances(self):
@@ -283,6 +416,14 @@ class SolrQuery(object):
         local_params = LocalParams(_pop_from_kwargs(kwargs, 'local_params'))
         self._fq.append((~X(*args, **kwargs), local_params))
 
+    @_with_clone
+    def cache(self, ttl):
+        """Sets time to live in seconds of the results in the searcher cache.
+
+        Pass ``0`` to bypass the cache for this query.
+        """
+        self._cache_ttl = ttl
+
     @_with_clone
     def instance_mapper(self, instance_mapper):
         self._instance_mapper = instance_mapper
@@ -0,0 +1,245 @@
+from __future__ import unicode_literals
+
+import os
+import copy
+import json
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .indexer import BatchResult, BulkIndexer, estimate_doc_size
+
+
+log = logging.getLogger(__name__)
+
+
+def _build_docs(build_doc, rows):
+    docs = []
+    for row in rows:
+        doc = build_doc(row)
+        if doc:
+            docs.append(doc)
+    return docs
+
+
+class ReindexStats(object):
+    """Progress of the reindex, ``docs`` and ``size`` include documents
+    indexed before resuming but the rates are calculated for this run only.
+    """
+    def __init__(self, docs=0, size=0):
+        self.docs = self._resumed_docs = docs
+        self.size = self._resumed_size = size
+        self.pages = 0
+        self.start_time = time.time()
+        self.seconds = 0.0
+
+    @property
+    def docs_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return (self.docs - self._resumed_docs) / self.seconds
+
+    @property
+    def bytes_per_second(self):
+        if not self.seconds:
+            return 0.0
+        return (self.size - self._resumed_size) / self.seconds
+
+    def __repr__(self):
+        return '<ReindexStats {} docs, {} bytes in {:.1f}s: {:.1f} docs/s, {:.1f} bytes/s>'.format(
+            self.docs, self.size, self.seconds,
+            self.docs_per_second, self.bytes_per_second)
+
+
+class Reindexer(object):
+    """Rebuilds the index from the database.
+
+    Rows are read from ``searcher.get_db_query()`` page by page with
+    keyset pagination over ``searcher.db_field``, so memory usage does not
+    depend on the table size. Every row is converted into a document with
+    ``build_doc``; if ``processes`` is set documents are built in a process
+    pool, then ``build_doc`` and the rows must be picklable.
+    Pages are sent to the ``staging_url`` core by ``concurrency`` threads.
+
+    When all the documents are indexed the staging core is committed and
+    swapped with ``core`` using ``core_admin``.
+
+    If ``state_path`` is set the last indexed key is saved there after
+    every page and :meth:`run` continues from it after a failure.
+    ``on_progress`` is called with :class:`ReindexStats` after every page.
+    Documents rejected by Solr are not counted as indexed, they are passed
+    with the error to ``dead_letter``, see :class:`~solar.indexer.BulkIndexer`.
+
+    Usage::
+
+        reindexer = Reindexer(
+            searcher, build_doc, 'http://localhost:8983/solr/products_staging',
+            core_admin=SolrCoreAdmin('http://localhost:8983/solr/admin/cores'),
+            core='products', staging_core='products_staging',
+            processes=4, state_path='/var/tmp/products-reindex.json')
+        stats = reindexer.run()
+    """
+    def __init__(self, searcher, build_doc, staging_url,
+                 core_admin=None, core=None, staging_core=None,
+                 page_size=1000, processes=None, concurrency=8,
+                 state_path=None, on_progress=None, dead_letter=None):
+        self.searcher = searcher
+        self.build_doc = build_doc
+        self.staging_url = staging_url
+        self.core_admin = core_admin
+        self.core = core
+        self.staging_core = staging_core
+        self.page_size = page_size
+        self.processes = processes
+        self.concurrency = concurrency
+        self.state_path = state_path
+        self.on_progress = on_progress
+        self.dead_letter = dead_letter
+
+    def make_staging_searcher(self):
+        staging = copy.copy(self.searcher)
+        staging.solr = self.searcher.solr_cls(self.staging_url)
+        staging.cache = None
+        staging.commit_manager = None
+        return staging
+
+    # state
+
+    def load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def save_state(self, last_key, docs, size):
+        if not self.state_path:
+            return
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'last_key': last_key, 'docs': docs, 'size': size}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.state_path)
+
+    def clear_state(self):
+        if self.state_path and os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    # pipeline
+
+    def iter_pages(self, last_key=None):
+        """Yields ``(rows, last_key)`` pairs."""
+        column = getattr(self.searcher.model, self.searcher.db_field)
+        while True:
+            query = self.searcher.get_db_query()
+            if last_key is not None:
+                query = query.filter(column > last_key)
+            rows = list(query.order_by(column).limit(self.page_size))
+            if not rows:
+                return
+            last_key = getattr(rows[-1], self.searcher.db_field)
+            yield rows, last_key
+
+    def iter_docs(self, pages):
+        """Yields ``(docs, last_key)`` pairs in the order of the pages."""
+        if not self.processes:
+            for rows, last_key in pages:
+                yield _build_docs(self.build_doc, rows), last_key
+            return
+
+        executor = ProcessPoolExecutor(max_workers=self.processes)
+        try:
+            pending = deque()
+            for rows, last_key in pages:
+                pending.append(
+                    (executor.submit(_build_docs, self.build_doc, rows), last_key))
+                # do not read the whole table while workers are busy
+                if len(pending) >= self.processes * 2:
+                    future, key = pending.popleft()
+                    yield future.result(), key
+            while pending:
+                future, key = pending.popleft()
+                yield future.result(), key
+        finally:
+            executor.shutdown(wait=True)
+
+    def run(self, resume=True):
+        """Reindexes all the rows and returns :class:`ReindexStats`."""
+        staging = self.make_staging_searcher()
+        indexer = BulkIndexer(staging, commit=False, dead_letter=self.dead_letter)
+
+        state = self.load_state() if resume else None
+        if state is not None:
+            last_key = state['last_key']
+            stats = ReindexStats(docs=state['docs'], size=state['size'])
+            log.info('Resuming reindex after key %r', last_key)
+        else:
+            last_key = None
+            stats = ReindexStats()
+            staging.solr.delete(q='*:*', commit=False)
+
+        lock = threading.Lock()
+        # pages that are being sent, in order; the state is saved only
+        # for the prefix of the completed pages
+        in_flight = deque()
+        completed = {}
+        saved = [stats.docs, stats.size]
+        errors = []
+        semaphore = threading.BoundedSemaphore(self.concurrency * 2)
+
+        def page_done(page_id, result):
+            with lock:
+                if result.failed:
+                    errors.append(result.error)
+                    return
+                stats.docs += result.ndocs - len(result.rejected)
+                stats.size += result.size
+                stats.pages += 1
+                stats.seconds = time.time() - stats.start_time
+                completed[page_id] = result
+                saved_key = None
+                while in_flight and in_flight[0][0] in completed:
+                    page_result = completed.pop(in_flight[0][0])
+                    saved[0] += page_result.ndocs - len(page_result.rejected)
+                    saved[1] += page_result.size
+                    saved_key = in_flight.popleft()[1]
+                if saved_key is not None:
+                    self.save_state(saved_key, saved[0], saved[1])
+            if self.on_progress:
+                self.on_progress(stats)
+
+        def send(page_id, docs):
+            try:
+                if docs:
+                    size = sum(estimate_doc_size(doc) for doc in docs)
+                    result = indexer.send_batch(docs, size)
+                else:
+                    result = BatchResult(docs, 0, 0.0)
+                page_done(page_id, result)
+            finally:
+                semaphore.release()
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            for page_id, (docs, key) in enumerate(
+                    self.iter_docs(self.iter_pages(last_key))):
+                if errors:
+                    break
+                semaphore.acquire()
+                with lock:
+                    in_flight.append((page_id, key))
+                executor.submit(send, page_id, docs)
+        finally:
+            executor.shutdown(wait=True)
+        if errors:
+            raise errors[0]
+
+        staging.commit()
+        if self.core_admin is not None and self.core and self.staging_core:
+            self.core_admin.swap(core=self.core, other=self.staging_core)
+        self.clear_state()
+        stats.seconds = time.time() - stats.start_time
+        log.info('Reindex finished: %r', stats)
+        return stats
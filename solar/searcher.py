@@ -1,13 +1,19 @@
 from __future__ import unicode_literals
 
+import sys
+import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from .compat import text_type, with_metaclass
+from .compat import text_type, with_metaclass, reraise
 from .pysolr import Solr
 from .query import SolrQuery
-from .util import SafeUnicode, X, make_q
+from .util import SafeUnicode, X, make_q, make_request_key
+from .singleflight import SingleFlight
 from .grouped import Group
 from .document import Document
+from .batch import UpdateBatch
 
 
 class SolrSearcherMeta(type):
@@ -30,14 +36,34 @@ class SolrSearcher(with_metaclass(SolrSearcherMeta, object)):
     db_field = 'id'
     db_field_type = int
 
+    solr_cls = Solr
     query_cls = SolrQuery
     group_cls = Group
     document_cls = Document
+    update_batch_cls = UpdateBatch
+
+    # share one request between concurrent identical searches
+    single_flight = False
+    # ResultCache instance
+    cache = None
+    # maximum number of queries sent concurrently by multi_search
+    multi_search_workers = 16
+    # CommitManager instance, coalesces commits of add and delete
+    commit_manager = None
+    # DeepPagingPolicy instance, protects from requests with large start
+    deep_paging = None
+    # delete matching documents by their unique values instead of
+    # delete-by-query that blocks concurrent updates
+    delete_by_id = False
+    delete_batch_size = 1000
+    # maximum number of documents deleted per second
+    delete_rate = None
 
     def __init__(self, solr_url=None, solr=None, model=None, session=None, db_field=None,
-                 query_cls=None, group_cls=None, document_cls=None):
+                 query_cls=None, group_cls=None, document_cls=None,
+                 single_flight=None, cache=None, commit_manager=None, deep_paging=None):
         if solr_url:
-            self.solr = Solr(solr_url)
+            self.solr = self.solr_cls(solr_url)
         else:
             self.solr = solr
 
@@ -49,6 +75,22 @@ class SolrSearcher(with_metaclass(SolrSearcherMeta, object)):
         self.group_cls = group_cls or self.group_cls
         self.document_cls = document_cls or self.document_cls
 
+        if single_flight is not None:
+            self.single_flight = single_flight
+        self._single_flight = SingleFlight() if self.single_flight else None
+        if cache is not None:
+            self.cache = cache
+        if commit_manager is not None:
+            self.commit_manager = commit_manager
+        if self.commit_manager is not None:
+            self.commit_manager.on_commit.append(self._invalidate_cache)
+        if deep_paging is not None:
+            self.deep_paging = deep_paging
+
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._commit_ticket = 0
+
         self._field_name_to_facet_cls_cache = {}
 
     # public methods
@@ -62,26 +104,211 @@ class SolrSearcher(with_metaclass(SolrSearcherMeta, object)):
         raw_results = self.solr.get(id=id, ids=ids, **kwargs)
         return [self.document_cls(**raw_doc) for raw_doc in raw_results.docs]
 
+    def multi_search(self, queries):
+        """Fetches results of the queries concurrently
+        so the latency is bounded by the slowest query.
+
+        Every query gets its results cached as if it was iterated.
+        Returns list of the results in the same order.
+
+        Usage::
+
+            products = searcher.search('nokia').limit(20)
+            related = searcher.search('lumia').limit(5)
+            counters = searcher.search().facet('category').limit(0)
+            searcher.multi_search([products, related, counters])
+            for doc in products:
+                ...
+        """
+        queries = list(queries)
+        pending = [q for q in queries if q._result_cache is None]
+        if len(pending) == 1:
+            pending[0]._fetch_results()
+        elif pending:
+            executor = self._get_executor()
+            futures = [executor.submit(q._do_search) for q in pending]
+            exc_info = None
+            for q, future in zip(pending, futures):
+                try:
+                    q._result_cache = future.result()
+                except Exception:
+                    if exc_info is None:
+                        exc_info = sys.exc_info()
+            if exc_info is not None:
+                reraise(*exc_info)
+        return [q._result_cache for q in queries]
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.multi_search_workers)
+            return self._executor
+
     # proxy methods
 
-    def select(self, q, **kwargs):
+    def select(self, q, _cache_ttl=None, **kwargs):
+        cache = self.cache
+        if cache is None or _cache_ttl == 0:
+            return self._select(q, **kwargs)
+
+        if cache.needs_version_check():
+            cache.update_version(self.solr.index_version())
+        key = make_request_key(q, kwargs)
+        raw_results = cache.get(key)
+        if raw_results is None:
+            raw_results = self._select(q, **kwargs)
+            cache.set(key, raw_results, ttl=_cache_ttl)
+        return raw_results
+
+    def _select(self, q, **kwargs):
+        if self._single_flight is not None:
+            return self._single_flight.do(
+                make_request_key(q, kwargs), self.solr.search, q, **kwargs)
         return self.solr.search(q, **kwargs)
 
+    def export(self, q, **kwargs):
+        return self.solr.export(q, **kwargs)
+
+    def _invalidate_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _update_commit_params(self, commit):
+        if self.commit_manager is None or not commit:
+            return {'commit': commit}
+        return {'commit': False, 'commitWithin': self.commit_manager.commit_within}
+
+    def _request_commit(self, commit):
+        if self.commit_manager is not None and commit:
+            self._commit_ticket = self.commit_manager.request_commit()
+
     def add(self, docs, commit=True):
-        return self.solr.add(docs, commit=commit)
+        try:
+            result = self.solr.add(docs, **self._update_commit_params(commit))
+        finally:
+            self._invalidate_cache()
+        self._request_commit(commit)
+        return result
+
+    def bulk_load_csv(self, docs, fields, commit=True, **kwargs):
+        """Adds flat documents with the CSV update handler,
+        see :meth:`solar.pysolr.Solr.bulk_load_csv`.
+        """
+        try:
+            result = self.solr.bulk_load_csv(docs, fields,
+                                             **dict(kwargs, **self._update_commit_params(commit)))
+        finally:
+            self._invalidate_cache()
+        self._request_commit(commit)
+        return result
 
     def commit(self):
-        self.solr.commit()
+        try:
+            return self.solr.commit()
+        finally:
+            self._invalidate_cache()
+
+    def wait_for_commit(self, timeout=None):
+        """Waits until changes made by this searcher are visible.
+
+        Only makes sense with ``commit_manager``.
+        Returns ``False`` if ``timeout`` expired.
+        """
+        if self.commit_manager is None:
+            return True
+        return self.commit_manager.wait(self._commit_ticket, timeout=timeout)
+
+    def update_batch(self, **kwargs):
+        """Returns :class:`~solar.batch.UpdateBatch` that sends adds
+        and deletes of this searcher in as few requests as possible.
+        """
+        return self.update_batch_cls(self, **kwargs)
+
+    def iter_unique_values(self, q, batch_size=1000):
+        """Yields lists of unique values of the documents matching ``q``
+        using cursor, so it is safe to delete them while iterating.
+        """
+        cursor_mark = '*'
+        while True:
+            results = self.solr.search(q, **self._cursor_params(cursor_mark, batch_size))
+            if results.docs:
+                yield [doc[self.unique_field] for doc in results.docs]
+            if not results.docs or results.next_cursor_mark in (None, cursor_mark):
+                return
+            cursor_mark = results.next_cursor_mark
+
+    def _cursor_params(self, cursor_mark, rows):
+        return {'fl': self.unique_field,
+                'sort': '{} asc'.format(self.unique_field),
+                'rows': rows,
+                'cursorMark': cursor_mark}
+
+    def _delete_delay(self, deleted, start_time):
+        if not self.delete_rate:
+            return 0
+        return deleted / float(self.delete_rate) - (time.time() - start_time)
+
+    def _delete_by_id(self, q, commit):
+        params = self._update_commit_params(commit)
+        commit_now = params.pop('commit')
+        deleted = 0
+        start_time = time.time()
+        try:
+            for ids in self.iter_unique_values(q, self.delete_batch_size):
+                delay = self._delete_delay(deleted, start_time)
+                if delay > 0:
+                    time.sleep(delay)
+                self.solr.batch_update([('delete', {'id': id}) for id in ids],
+                                       commit=False, **params)
+                deleted += len(ids)
+            if commit_now:
+                self.solr.commit()
+        finally:
+            self._invalidate_cache()
+        self._request_commit(commit)
+        return deleted
 
     def delete(self, *args, **kwargs):
+        """Deletes documents matching the query.
+
+        Pass ``by_id=True`` (default is ``delete_by_id`` attribute)
+        to find the documents with a cursor and delete them by unique values
+        in batches of ``delete_batch_size``, no more than ``delete_rate``
+        documents per second. Then the number of deleted documents is returned.
+        """
         commit = kwargs.pop('commit', True)
-        self.solr.delete(q=make_q(None, None, *args, **kwargs), commit=commit)
+        by_id = kwargs.pop('by_id', self.delete_by_id)
+        if by_id:
+            return self._delete_by_id(self.make_delete_query(*args, **kwargs), commit)
+        try:
+            result = self.solr.delete(q=self.make_delete_query(*args, **kwargs),
+                                      **self._update_commit_params(commit))
+        finally:
+            self._invalidate_cache()
+        self._request_commit(commit)
+        return result
 
     def optimize_index(self):
-        self.solr.optimize()
+        try:
+            return self.solr.optimize()
+        finally:
+            self._invalidate_cache()
 
     # methods to override
 
+    def get_unique_value(self, id):
+        return id
+
+    def get_doc_unique_value(self, doc):
+        return doc.get(self.unique_field)
+
+    def prepare_doc(self, doc):
+        return doc
+
+    def make_delete_query(self, *args, **kwargs):
+        return make_q(None, None, *args, **kwargs)
+
     def get_db_query(self):
         return self.session.query(self.model)
 
@@ -130,19 +357,25 @@ class CommonSearcher(SolrSearcher):
             .filter(**{self.type_field: self.get_type_value()})
         )
 
+    def get_doc_unique_value(self, doc):
+        return self.get_unique_value(doc[self.db_field])
+
+    def prepare_doc(self, doc):
+        doc = doc.copy()
+        doc[self.unique_field] = self.get_doc_unique_value(doc)
+        doc[self.type_field] = self.get_type_value()
+        return doc
+
     def add(self, docs, commit=True):
-        patched_docs = []
-        for _doc in docs:
-            if _doc:
-                doc = _doc.copy()
-                doc[self.unique_field] = self.get_unique_value(
-                    doc[self.db_field]
-                )
-                doc[self.type_field] = self.get_type_value()
-                patched_docs.append(doc)
-                
+        patched_docs = [self.prepare_doc(doc) for doc in docs if doc]
         return super(CommonSearcher, self).add(patched_docs, commit=commit)
 
+    def bulk_load_csv(self, docs, fields, commit=True, **kwargs):
+        patched_docs = (self.prepare_doc(doc) for doc in docs if doc)
+        fields = list(fields) + [self.unique_field, self.type_field]
+        return super(CommonSearcher, self).bulk_load_csv(
+            patched_docs, fields, commit=commit, **kwargs)
+
     def get(self, id=None, ids=None, **kwargs):
         if id:
             id = self.get_unique_value(id)
@@ -150,7 +383,7 @@ class CommonSearcher(SolrSearcher):
             ids = map(self.get_unique_value, ids)
         return super(CommonSearcher, self).get(id=id, ids=ids, **kwargs)
 
-    def delete(self, *args, **kwargs):
+    def make_delete_query(self, *args, **kwargs):
         kwargs = kwargs.copy()
         kwargs[self.type_field] = self.get_type_value()
-        return super(CommonSearcher, self).delete(*args, **kwargs)
+        return super(CommonSearcher, self).make_delete_query(*args, **kwargs)
@@ -0,0 +1,347 @@
+from __future__ import unicode_literals
+
+import os
+import json
+import mmap
+import zlib
+import struct
+import logging
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+from .util import json_default
+
+
+log = logging.getLogger(__name__)
+
+
+# record header: payload length and crc32 of the payload
+HEADER = struct.Struct('<II')
+
+
+def _crc(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+class Spool(object):
+    """Append-only on-disk queue of index updates.
+
+    Updates are written into memory-mapped segment files of
+    ``segment_size`` bytes in the ``path`` directory, so the write path
+    only serializes the update and copies it into the page cache.
+    Records survive a crash of the process, pass ``sync=True``
+    to flush every record to disk to survive a crash of the machine.
+
+    Every record is ``<length><crc32><json>``, a record with zero length
+    marks the end of the written data. A torn record found at the end
+    of the last segment when the spool is opened is discarded.
+
+    Records are read by :class:`SpoolDrainer` starting at the checkpoint
+    position, the segments before the checkpoint are removed.
+    Only one :class:`Spool` instance can be opened for a directory,
+    writers and the drainer should share it.
+    """
+    segment_suffix = '.log'
+    checkpoint_name = 'checkpoint'
+
+    def __init__(self, path, segment_size=64 * 1024 * 1024, sync=False):
+        self.path = path
+        self.segment_size = segment_size
+        self.sync = sync
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._file = None
+        self._segment = None
+        self._pos = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._open_last_segment()
+
+    # write path
+
+    def add(self, docs):
+        """Appends documents to the spool."""
+        self._append([{'add': doc} for doc in docs if doc])
+
+    def delete(self, *args, **kwargs):
+        """Appends deletion, arguments are passed to ``searcher.delete``."""
+        self._append([{'delete': {'args': list(args), 'kwargs': kwargs}}])
+
+    def _append(self, records):
+        if not records:
+            return
+        data = [json.dumps(r, default=json_default, separators=(',', ':')).encode('utf-8')
+                for r in records]
+        with self._lock:
+            for payload in data:
+                self._write(payload)
+            if self.sync:
+                self._mmap.flush()
+
+    def _write(self, payload):
+        size = HEADER.size + len(payload)
+        # always leave room for the zero header that marks the end
+        if self._pos + size + HEADER.size > len(self._mmap):
+            self._roll(size + HEADER.size)
+        start = self._pos + HEADER.size
+        self._mmap[start:start + len(payload)] = payload
+        # header is written last so readers never see partial payload
+        self._mmap[self._pos:start] = HEADER.pack(len(payload), _crc(payload))
+        self._pos += size
+
+    # segments
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, '{:010d}{}'.format(segment, self.segment_suffix))
+
+    def segments(self):
+        segments = []
+        for name in os.listdir(self.path):
+            if name.endswith(self.segment_suffix):
+                segments.append(int(name[:-len(self.segment_suffix)]))
+        return sorted(segments)
+
+    def _open_last_segment(self):
+        segments = self.segments()
+        if not segments:
+            self._roll(0)
+            return
+        self._map_segment(segments[-1])
+        self._pos = self._scan(self._mmap)
+        # wipe torn record if any
+        end = min(self._pos + HEADER.size, len(self._mmap))
+        tail = self._mmap[self._pos:end]
+        if tail.strip(b'\x00'):
+            log.warning('Discarding torn record in spool segment %s at %s',
+                        self._segment, self._pos)
+            self._mmap[self._pos:] = b'\x00' * (len(self._mmap) - self._pos)
+
+    def _map_segment(self, segment, size=None):
+        self._close_segment()
+        path = self._segment_path(segment)
+        self._file = open(path, 'r+b' if size is None else 'w+b')
+        if size is not None:
+            self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._segment = segment
+
+    def _roll(self, min_size):
+        segments = self.segments()
+        segment = segments[-1] + 1 if segments else 1
+        if self._mmap is not None:
+            self._mmap.flush()
+        self._map_segment(segment, max(self.segment_size, min_size))
+        self._pos = 0
+
+    def _close_segment(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.flush()
+            self._close_segment()
+
+    # read path
+
+    @staticmethod
+    def _scan(data, pos=0, limit=None):
+        """Returns position after the last valid record."""
+        for _, pos in Spool._records(data, pos, limit):
+            pass
+        return pos
+
+    @staticmethod
+    def _records(data, pos=0, limit=None):
+        while limit is None or limit > 0:
+            if pos + HEADER.size > len(data):
+                return
+            length, crc = HEADER.unpack(data[pos:pos + HEADER.size])
+            if length == 0:
+                return
+            start = pos + HEADER.size
+            payload = data[start:start + length]
+            if len(payload) != length or _crc(payload) != crc:
+                return
+            pos = start + length
+            yield payload, pos
+            if limit is not None:
+                limit -= 1
+
+    def read(self, position, limit):
+        """Reads at most ``limit`` records starting at ``position``.
+
+        Returns list of ``(record, next_position)`` pairs,
+        position is ``(segment, offset)`` tuple.
+        """
+        records = []
+        segment, offset = position
+        while len(records) < limit:
+            path = self._segment_path(segment)
+            if not os.path.exists(path):
+                break
+            # the segment can be skipped only if it was closed before the scan,
+            # otherwise the writer could append to it and roll in between
+            with self._lock:
+                closed = segment < self._segment
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for payload, offset in self._records(data, offset, limit - len(records)):
+                        records.append((json.loads(payload.decode('utf-8')),
+                                        (segment, offset)))
+                finally:
+                    data.close()
+            if len(records) >= limit or not closed:
+                break
+            # the rest of the segment is empty, the writer has moved on
+            segment, offset = segment + 1, 0
+            records.append((None, (segment, offset)))
+        return records
+
+    def checkpoint(self):
+        """Returns position of the first record that was not delivered."""
+        path = os.path.join(self.path, self.checkpoint_name)
+        if not os.path.exists(path):
+            segments = self.segments()
+            return (segments[0] if segments else 1, 0)
+        with open(path) as f:
+            data = json.load(f)
+        return (data['segment'], data['offset'])
+
+    def save_checkpoint(self, position):
+        """Atomically stores ``position`` and removes the delivered segments."""
+        segment, offset = position
+        path = os.path.join(self.path, self.checkpoint_name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'segment': segment, 'offset': offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+        for old_segment in self.segments():
+            if old_segment >= segment:
+                break
+            os.remove(self._segment_path(old_segment))
+
+
+class SpoolDrainer(object):
+    """Replays spooled updates to Solr from a background thread.
+
+    Records are read starting at the spool checkpoint, consecutive
+    documents are sent with ``searcher.add`` in batches of ``batch_size``
+    (deduplicated by the unique value, the last one wins), deletions
+    are sent with ``searcher.delete``. The checkpoint is saved after
+    every successful request; when Solr fails the drainer retries from
+    the checkpoint after ``retry_interval`` seconds. Since both add and
+    delete are idempotent an update can be re-delivered safely
+    after a crash.
+
+    After every drained pass changes are committed, with the searcher's
+    commit manager if it has one.
+
+    Usage::
+
+        spool = Spool('/var/spool/solr/products')
+        drainer = SpoolDrainer(spool, searcher)
+        drainer.start()
+
+        # in the request path
+        spool.add([doc])
+    """
+    def __init__(self, spool, searcher, batch_size=1000, interval=1.0,
+                 retry_interval=5.0, commit=True):
+        self.spool = spool
+        self.searcher = searcher
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.commit = commit
+        self.sent_docs = 0
+        self.sent_deletes = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _send_docs(self, docs):
+        if not docs:
+            return
+        batch = OrderedDict()
+        for doc in docs:
+            key = self.searcher.get_doc_unique_value(doc)
+            if key is None:
+                key = object()
+            batch.pop(key, None)
+            batch[key] = doc
+        unique_docs = list(batch.values())
+        self.searcher.add(unique_docs, commit=False)
+        self.sent_docs += len(unique_docs)
+
+    def drain(self):
+        """Sends all the spooled updates, returns number of records sent."""
+        position = self.spool.checkpoint()
+        sent = 0
+        while True:
+            records = self.spool.read(position, self.batch_size)
+            if not records:
+                break
+            docs = []
+            for record, next_position in records:
+                if record is not None and 'delete' in record:
+                    if docs:
+                        self._send_docs(docs)
+                        self.spool.save_checkpoint(position)
+                        sent += len(docs)
+                        docs = []
+                    delete = record['delete']
+                    self.searcher.delete(*delete['args'], commit=False, **delete['kwargs'])
+                    self.sent_deletes += 1
+                    sent += 1
+                elif record is not None:
+                    docs.append(record['add'])
+                position = next_position
+            self._send_docs(docs)
+            sent += len(docs)
+            self.spool.save_checkpoint(position)
+
+        if sent and self.commit:
+            if self.searcher.commit_manager is not None:
+                self.searcher._request_commit(True)
+            else:
+                self.searcher.commit()
+        return sent
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='solr-spool-drainer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, drain=True):
+        """Stops the background thread, sends remaining updates if ``drain``."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if drain:
+            self.drain()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.drain()
+                delay = self.interval
+            except Exception:
+                log.exception('Error when draining spool')
+                self.errors += 1
+                delay = self.retry_interval
+            self._stop.wait(delay)
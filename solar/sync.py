@@ -0,0 +1,184 @@
+from __future__ import unicode_literals
+
+import sys
+import logging
+import threading
+
+
+log = logging.getLogger(__name__)
+
+
+class SessionSync(object):
+    """Keeps the index in sync with the searcher's ``model``.
+
+    Listens for flush and commit events of the searcher's ``session``,
+    collects the ids of the changed and deleted instances of the model
+    and after the transaction is committed schedules them for indexing.
+    All the ids collected during ``delay`` seconds are indexed together:
+    changed instances are loaded with ``searcher.instance_mapper``
+    in batches of ``batch_size`` and converted with ``build_doc``, then
+    the documents and the deletion of the deleted ones are sent
+    with one :meth:`~solar.searcher.SolrSearcher.update_batch` request.
+    Rolled back changes
+    are discarded. Ids are scheduled again if indexing failed.
+
+    Indexing runs in a timer thread, so instances cannot be loaded
+    with the application's session: pass ``session_factory``
+    (e.g. a ``sessionmaker``) to load them with a new session
+    or make the searcher's session a ``scoped_session``.
+
+    Requires SQLAlchemy.
+
+    Usage::
+
+        sync = SessionSync(searcher, build_doc, delay=1,
+                           session_factory=sessionmaker(bind=engine))
+        sync.listen()
+    """
+    info_key = 'solar_sync'
+
+    def __init__(self, searcher, build_doc, delay=1.0, batch_size=500,
+                 session=None, commit=True, session_factory=None):
+        self.searcher = searcher
+        self.build_doc = build_doc
+        self.delay = delay
+        self.batch_size = batch_size
+        self.session = session or searcher.session
+        self.commit = commit
+        self.session_factory = session_factory
+        self._changed = set()
+        self._deleted = set()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def listen(self):
+        from sqlalchemy import event
+
+        event.listen(self.session, 'after_flush', self.after_flush)
+        event.listen(self.session, 'after_commit', self.after_commit)
+        event.listen(self.session, 'after_rollback', self.after_rollback)
+
+    def remove(self):
+        from sqlalchemy import event
+
+        event.remove(self.session, 'after_flush', self.after_flush)
+        event.remove(self.session, 'after_commit', self.after_commit)
+        event.remove(self.session, 'after_rollback', self.after_rollback)
+
+    def _get_id(self, obj):
+        return getattr(obj, self.searcher.db_field)
+
+    def _pending(self, session):
+        return session.info.setdefault(self.info_key, (set(), set()))
+
+    # session events
+
+    def after_flush(self, session, flush_context):
+        model = self.searcher.model
+        changed, deleted = self._pending(session)
+        for obj in session.new | session.dirty:
+            if isinstance(obj, model):
+                changed.add(self._get_id(obj))
+        for obj in session.deleted:
+            if isinstance(obj, model):
+                obj_id = self._get_id(obj)
+                changed.discard(obj_id)
+                deleted.add(obj_id)
+
+    def after_commit(self, session):
+        changed, deleted = session.info.pop(self.info_key, (set(), set()))
+        if changed or deleted:
+            self.schedule(changed, deleted)
+
+    def after_rollback(self, session):
+        session.info.pop(self.info_key, None)
+
+    # indexing
+
+    def schedule(self, changed_ids=(), deleted_ids=()):
+        """Schedules indexing of ``changed_ids`` and deletion of ``deleted_ids``."""
+        with self._lock:
+            for obj_id in changed_ids:
+                self._deleted.discard(obj_id)
+                self._changed.add(obj_id)
+            for obj_id in deleted_ids:
+                self._changed.discard(obj_id)
+                self._deleted.add(obj_id)
+            if self._timer is None and (self._changed or self._deleted):
+                self._timer = threading.Timer(self.delay, self._run)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _run(self):
+        try:
+            self.flush()
+        except Exception:
+            log.exception('Error when indexing changed %s instances',
+                          self.searcher.model.__name__)
+            # retry failed ids later
+            self.schedule()
+        finally:
+            if self.session_factory is None and hasattr(self.searcher.session, 'remove'):
+                # scoped session of the timer thread
+                self.searcher.session.remove()
+
+    def _restore(self, changed, deleted):
+        # ids scheduled after the failed flush are newer
+        with self._lock:
+            for obj_id in changed:
+                if obj_id not in self._deleted:
+                    self._changed.add(obj_id)
+            for obj_id in deleted:
+                if obj_id not in self._changed:
+                    self._deleted.add(obj_id)
+
+    def flush(self):
+        """Indexes all the scheduled ids now. If indexing fails the ids
+        are scheduled again and the exception is raised.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            changed, self._changed = self._changed, set()
+            deleted, self._deleted = self._deleted, set()
+
+        try:
+            return self._index(changed, deleted)
+        except Exception:
+            self._restore(changed, deleted)
+            raise
+
+    def _index(self, changed, deleted):
+        if self.session_factory is None:
+            return self._send(changed, deleted, None)
+        session = self.session_factory()
+        try:
+            return self._send(changed, deleted, session.query(self.searcher.model))
+        finally:
+            session.close()
+
+    def _send(self, changed, deleted, db_query):
+        changed = sorted(changed)
+        deleted = set(deleted)
+        # all the changes go in one request
+        batch = self.searcher.update_batch(max_commands=sys.maxsize, max_bytes=sys.maxsize,
+                                           commit=self.commit)
+        for i in range(0, len(changed), self.batch_size):
+            ids = changed[i:i + self.batch_size]
+            if db_query is None:
+                instances = self.searcher.instance_mapper(ids)
+            else:
+                instances = self.searcher.instance_mapper(ids, db_query=db_query)
+            for obj_id in ids:
+                obj = instances.get(obj_id)
+                if obj is None:
+                    # was deleted by someone else
+                    deleted.add(obj_id)
+                    continue
+                batch.add([self.build_doc(obj)])
+        if deleted:
+            batch.delete(**{'{}__in'.format(self.searcher.db_field): sorted(deleted)})
+        if len(batch):
+            batch.close()
+        return len(deleted.union(changed))
@@ -17,6 +17,7 @@ from .compat import (
     PY2, text_type, string_types, binary_type, int_types, force_unicode,
     implements_to_string,
 )
+from .pysolr import format_date
 from .tree import Node
 
 
@@ -125,6 +126,12 @@ X_ALL = X(ALL)
 @implements_to_string
 class LocalParams(OrderedDict):
     SPECIAL_CHARACTERS = " '" + SPECIAL_CHARACTERS
+
+    def __init__(self, other=None, **kwargs):
+        # C implementation of OrderedDict (Python 3.5+) does not call
+        # overridden update method from __init__
+        super(LocalParams, self).__init__()
+        self.update(other, **kwargs)
     
     def update(self, other=None, **kwargs):
         if other is None:
@@ -348,3 +355,20 @@ def wrap_list(v):
     if not isinstance(v, (list, tuple)):
         return [v]
     return v
+
+def make_request_key(q, params):
+    """Returns hashable key that identifies a search request."""
+    key = []
+    for p, v in sorted(params.items(), key=lambda pv: pv[0]):
+        if isinstance(v, (list, tuple)):
+            v = tuple(force_unicode(w) for w in v)
+        else:
+            v = force_unicode(v)
+        key.append((p, v))
+    return (force_unicode(q), tuple(key))
+
+def json_default(value):
+    """Serializes values that :mod:`json` does not support as Solr does."""
+    if hasattr(value, 'strftime'):
+        return format_date(value)
+    return force_unicode(value)
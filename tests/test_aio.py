@@ -0,0 +1,203 @@
+from __future__ import unicode_literals
+
+import sys
+import unittest
+
+if sys.version_info < (3, 5):
+    raise unittest.SkipTest('asyncio support requires Python 3.5+')
+
+import asyncio
+
+from mock import patch
+
+from solar.aio import AsyncSolrSearcher, AsyncSolrQuery
+
+
+RESPONSE = '''
+{
+  "response": {
+    "numFound": 28,
+    "start": 0,
+    "docs": [
+      {"id": "111"},
+      {"id": "222"}
+    ]
+  }
+}
+'''
+
+
+class AsyncSearcherTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.searcher = AsyncSolrSearcher('http://example.com:8180/solr')
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_coro(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def patch_send_request(self, value):
+        calls = []
+
+        def send_request(*args, **kwargs):
+            calls.append((args, kwargs))
+            future = self.loop.create_future()
+            future.set_result(value)
+            return future
+        send_request.calls = calls
+        return patch.object(self.searcher.solr, '_send_request', send_request), send_request
+
+    def test_fetch(self):
+        patcher, send_request = self.patch_send_request(RESPONSE)
+        with patcher:
+            q = self.searcher.search().filter(status=0)
+            self.assertIsInstance(q, AsyncSolrQuery)
+            self.assertRaises(RuntimeError, len, q)
+
+            results = self.run_coro(q.fetch())
+            self.assertEqual(results.ndocs, 28)
+            self.assertEqual(len(q), 28)
+            self.assertEqual([doc.id for doc in q], ['111', '222'])
+            self.assertEqual(q[1].id, '222')
+
+            self.run_coro(q.fetch())
+            self.assertEqual(len(send_request.calls), 1)
+            method, path = send_request.calls[0][0][:2]
+            self.assertEqual(method, 'get')
+            self.assertIn('fq=status%3A0', path)
+
+    def test_count(self):
+        patcher, send_request = self.patch_send_request(RESPONSE)
+        with patcher:
+            q = self.searcher.search()
+            self.assertEqual(self.run_coro(q.count()), 28)
+            self.assertIn('rows=0', send_request.calls[0][0][1])
+            self.assertRaises(RuntimeError, len, q)
+
+    def test_async_iteration(self):
+        patcher, send_request = self.patch_send_request(RESPONSE)
+        with patcher:
+            q = self.searcher.search()
+
+            ids = []
+            it = q.__aiter__()
+            while True:
+                try:
+                    doc = self.run_coro(it.__anext__())
+                except StopAsyncIteration:
+                    break
+                ids.append(doc.id)
+            self.assertEqual(ids, ['111', '222'])
+            self.assertEqual(len(send_request.calls), 1)
+
+    def test_get(self):
+        patcher, send_request = self.patch_send_request(
+            '{"doc": {"id": "111", "name": "Test realtime doc"}}')
+        with patcher:
+            docs = self.run_coro(self.searcher.get('111'))
+            self.assertEqual(docs[0].id, '111')
+            self.assertEqual(docs[0].name, 'Test realtime doc')
+
+    def test_add(self):
+        patcher, send_request = self.patch_send_request('{}')
+        with patcher:
+            self.run_coro(self.searcher.add([{'id': '1'}]))
+            method, path, body = send_request.calls[0][0][:3]
+            self.assertEqual(method, 'post')
+            self.assertEqual(path, 'update/?commit=true')
+            self.assertIn('<field name="id">1</field>', body)
+
+    def test_single_flight(self):
+        searcher = AsyncSolrSearcher('http://example.com:8180/solr', single_flight=True)
+        future = self.loop.create_future()
+        calls = []
+
+        def send_request(*args, **kwargs):
+            calls.append(args)
+            return future
+
+        with patch.object(searcher.solr, '_send_request', send_request):
+            queries = [searcher.search().filter(status=0) for _ in range(3)]
+            tasks = [self.loop.create_task(q.fetch()) for q in queries]
+            self.loop.call_soon(future.set_result, RESPONSE)
+            self.run_coro(asyncio.wait(tasks))
+            self.assertEqual(len(calls), 1)
+            self.assertEqual([t.result().ndocs for t in tasks], [28] * 3)
+            self.assertEqual(searcher._in_flight, {})
+
+    def test_delete_by_id(self):
+        pages = [
+            '{"response": {"docs": [{"id": "1"}, {"id": "2"}]}, "nextCursorMark": "AoE1"}',
+            '{"response": {"docs": []}, "nextCursorMark": "AoE1"}',
+        ]
+        calls = []
+
+        def send_request(method, path, *args, **kwargs):
+            calls.append(path)
+            future = self.loop.create_future()
+            future.set_result(pages.pop(0) if path.startswith('select') else '{}')
+            return future
+
+        with patch.object(self.searcher.solr, '_send_request', send_request):
+            deleted = self.run_coro(self.searcher.delete(status=0, by_id=True, commit=False))
+        self.assertEqual(deleted, 2)
+        self.assertEqual(len(calls), 3)
+        self.assertIn('cursorMark=AoE1', calls[2])
+        self.assertEqual(calls[1], 'update/?commit=false')
+
+    def test_iterator(self):
+        pages = [
+            '{"response": {"docs": [{"id": "1"}, {"id": "2"}]}, "nextCursorMark": "AoE2"}',
+            '{"response": {"docs": [{"id": "3"}]}, "nextCursorMark": "AoE3"}',
+            '{"response": {"docs": []}, "nextCursorMark": "AoE3"}',
+        ]
+        calls = []
+
+        def send_request(method, path, *args, **kwargs):
+            calls.append(path)
+            future = self.loop.create_future()
+            future.set_result(pages.pop(0))
+            return future
+
+        with patch.object(self.searcher.solr, '_send_request', send_request):
+            it = self.searcher.search().iterator(batch_size=2).__aiter__()
+            ids = []
+            while True:
+                try:
+                    doc = self.run_coro(it.__anext__())
+                except StopAsyncIteration:
+                    break
+                ids.append(doc.id)
+        self.assertEqual(ids, ['1', '2', '3'])
+        self.assertEqual(len(calls), 3)
+        self.assertIn('cursorMark=AoE2', calls[1])
+
+    def test_bulk_load_csv(self):
+        patcher, send_request = self.patch_send_request('{}')
+        with patcher:
+            self.run_coro(self.searcher.bulk_load_csv(
+                ({'id': str(i)} for i in range(5)), ['id'], batch_size=2))
+        paths = [call[0][1] for call in send_request.calls]
+        self.assertEqual([path.split('&')[0] for path in paths],
+                         ['update/?commit=false', 'update/?commit=false',
+                          'update/?commit=true'])
+        self.assertEqual([b''.join(call[0][2]) for call in send_request.calls],
+                         [b'id\n0\n1\n', b'id\n2\n3\n', b'id\n4\n'])
+
+    def test_update_batch(self):
+        patcher, send_request = self.patch_send_request('{}')
+        with patcher:
+            batch = self.run_coro(self.searcher.update_batch(
+                max_commands=3, commit=True).__aenter__())
+            self.run_coro(batch.add([{'id': '1'}, {'id': '2'}, {'id': '3'}]))
+            self.assertEqual(len(send_request.calls), 1)
+            self.run_coro(batch.delete_ids(['4']))
+            self.assertEqual(len(send_request.calls), 1)
+            self.run_coro(batch.__aexit__(None, None, None))
+            self.assertEqual(len(send_request.calls), 2)
+            self.assertEqual([call[0][1] for call in send_request.calls],
+                             ['update/?commit=false', 'update/?commit=true'])
+            self.assertIn('<id>4</id>', send_request.calls[1][0][2])
+        self.assertEqual((batch.requests, batch.commands), (2, 4))
@@ -0,0 +1,93 @@
+from __future__ import unicode_literals
+
+import re
+from datetime import datetime
+
+from solar.searcher import CommonSearcher
+from solar.atomic import AtomicUpdater, diff_doc
+
+from .base import TestCase
+
+
+GET_RESPONSE = '''
+{
+  "response": {
+    "numFound": 2,
+    "start": 0,
+    "docs": [
+      {"id": "1", "name": "Nokia", "price": 100, "tags": ["phone"],
+       "dt_created": "2013-05-01T12:30:00Z", "_version_": 123},
+      {"id": "2", "name": "Lumia", "price": 200, "tags": ["phone", "new"],
+       "description": "Long text", "_version_": 124}
+    ]
+  }
+}
+'''
+
+
+class AtomicUpdateTest(TestCase):
+    def test_diff_doc(self):
+        old = {'id': '1', 'name': 'Nokia', 'price': 100, 'tags': ['phone'],
+               'dt_created': '2013-05-01T12:30:00Z', 'color': 'red',
+               '_version_': 123}
+        new = {'id': '1', 'name': 'Nokia', 'price': 90, 'tags': 'phone',
+               'dt_created': datetime(2013, 5, 1, 12, 30), 'empty': ''}
+        self.assertEqual(diff_doc(old, new),
+                         {'id': '1', 'price': {'set': 90}, 'color': {'set': None}})
+        self.assertEqual(diff_doc(old, new, remove_missing=False),
+                         {'id': '1', 'price': {'set': 90}})
+        self.assertIs(diff_doc(old, new, non_updatable=['price']), new)
+        self.assertIsNone(diff_doc(old, dict(new, price=100), ignore_fields=['color']))
+        self.assertIs(diff_doc(None, new), new)
+        atomic = {'id': '1', 'price': {'inc': 1}}
+        self.assertIs(diff_doc(old, atomic), atomic)
+
+    def test_realtime_get(self):
+        updater = AtomicUpdater(self.searcher, non_updatable=['description'],
+                                fetch_batch_size=2)
+        docs = [
+            {'id': '1', 'name': 'Nokia', 'price': 90, 'tags': ['phone'],
+             'dt_created': datetime(2013, 5, 1, 12, 30)},
+            {'id': '2', 'name': 'Lumia', 'price': 200, 'tags': ['phone', 'new'],
+             'description': 'Long text'},
+            {'id': '3', 'name': 'New'},
+        ]
+        with self.patch_send_request() as send_request:
+            send_request.side_effect = [GET_RESPONSE, GET_RESPONSE, '{}']
+            updater.add(docs, commit=False)
+            self.assertEqual(send_request.call_count, 3)
+            self.assertIn('ids=1%2C2', send_request.call_args_list[0][0][1])
+            self.assertIn('ids=3', send_request.call_args_list[1][0][1])
+            body = send_request.call_args[0][2]
+            self.assertIn('<field name="price" update="set">90</field>', body)
+            self.assertNotIn('Lumia', body)
+            self.assertIn('<field name="name">New</field>', body)
+        self.assertEqual((updater.full, updater.partial, updater.unchanged), (1, 1, 1))
+
+    def test_snapshot(self):
+        searcher = CommonSearcher('http://example.com:8180/solr')
+        searcher.type_value = 'Product'
+        snapshot = {}
+        updater = AtomicUpdater(searcher, snapshot=snapshot)
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            updater.add([{'id': 1, 'name': 'Nokia', 'price': 100}])
+            self.assertIn('<field name="name">Nokia</field>', send_request.call_args[0][2])
+            self.assertEqual(snapshot['Product:1'], {'id': 1, 'name': 'Nokia', 'price': 100})
+
+            updater.add([{'id': 1, 'name': 'Nokia', 'price': 90, 'color': None}])
+            body = send_request.call_args[0][2]
+            self.assertIn('<field name="_id">Product:1</field>', body)
+            self.assertIn('<field name="id">1</field>', body)
+            self.assertIn('<field name="price" update="set">90</field>', body)
+            self.assertNotIn('Nokia', body)
+            self.assertNotIn('color', body)
+
+            send_request.reset_mock()
+            self.assertIsNone(updater.add([{'id': 1, 'name': 'Nokia', 'price': 90}]))
+            self.assertFalse(send_request.called)
+
+            updater.add([{'id': 1, 'price': 90}])
+            field = re.search(r'<field name="name"[^>]*/>', send_request.call_args[0][2])
+            self.assertIn('update="set"', field.group())
+            self.assertIn('null="true"', field.group())
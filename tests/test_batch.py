@@ -0,0 +1,69 @@
+from __future__ import unicode_literals
+
+from mock import patch
+
+from solar.searcher import CommonSearcher
+
+from .base import TestCase
+
+
+class UpdateBatchTest(TestCase):
+    def test_flush(self):
+        batch = self.searcher.update_batch(max_commands=3, commit=True)
+        with patch.object(self.searcher.solr, 'batch_update') as batch_update:
+            batch.add([{'id': '1'}, None, {'id': '2', 'price': {'set': 10}}])
+            batch.delete_ids(['3'])
+            self.assertEqual(batch_update.call_count, 1)
+            self.assertEqual(batch_update.call_args[0][0], [
+                ('add', {'id': '1'}),
+                ('add', {'id': '2', 'price': {'set': 10}}),
+                ('delete', {'id': '3'}),
+            ])
+            self.assertEqual(batch_update.call_args[1], {'commit': False, 'format': None})
+
+            batch.delete(category='obsolete')
+            self.assertEqual(len(batch), 1)
+            batch.close()
+            self.assertEqual(batch_update.call_count, 2)
+            self.assertEqual(batch_update.call_args[0][0],
+                             [('delete', {'query': 'category:obsolete'})])
+            self.assertEqual(batch_update.call_args[1], {'commit': True, 'format': None})
+        self.assertEqual((batch.requests, batch.commands), (2, 4))
+
+    def test_max_bytes(self):
+        batch = self.searcher.update_batch(max_bytes=100)
+        with patch.object(self.searcher.solr, 'batch_update') as batch_update:
+            batch.add([{'id': str(i), 'text': 'x' * 30} for i in range(5)])
+            self.assertEqual([len(call[0][0]) for call in batch_update.call_args_list],
+                             [2, 2])
+            batch.close()
+            self.assertEqual(len(batch_update.call_args[0][0]), 1)
+            self.assertEqual(batch_update.call_args[1]['commit'], False)
+
+    def test_context_manager(self):
+        searcher = CommonSearcher('http://example.com:8180/solr')
+        searcher.type_value = 'Product'
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            with searcher.update_batch(commit=True) as batch:
+                batch.add([{'id': 1, 'name': 'Nokia'}])
+                batch.delete_ids([2])
+                batch.delete(name='Lumia')
+                self.assertFalse(send_request.called)
+            self.assertEqual(send_request.call_count, 1)
+            path, body = send_request.call_args[0][1:3]
+            self.assertEqual(path, 'update/?commit=true')
+            self.assertIn('<field name="_id">Product:1</field>', body)
+            self.assertIn('<field name="_type">Product</field>', body)
+            self.assertIn('<id>Product:2</id>', body)
+            self.assertIn('<query>', body)
+            self.assertIn('_type:Product', body)
+
+            send_request.reset_mock()
+            try:
+                with searcher.update_batch() as batch:
+                    batch.add([{'id': 1}])
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.assertFalse(send_request.called)
@@ -0,0 +1,109 @@
+from __future__ import unicode_literals
+
+from itertools import count
+
+from mock import patch
+
+from solar import SolrSearcher
+from solar.cache import ResultCache
+
+from .base import TestCase
+
+
+RESPONSE = '''
+{
+  "response": {
+    "numFound": 2,
+    "start": 0,
+    "docs": [{"id": "111"}, {"id": "222"}]
+  }
+}
+'''
+
+
+class ResultCacheTest(TestCase):
+    def test_lru(self):
+        cache = ResultCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=60)
+        with patch('solar.cache.time.time', return_value=1000):
+            cache.set('a', 1)
+            cache.set('b', 2, ttl=10)
+        with patch('solar.cache.time.time', return_value=1030):
+            self.assertEqual(cache.get('a'), 1)
+            self.assertIsNone(cache.get('b'))
+        with patch('solar.cache.time.time', return_value=1060):
+            self.assertIsNone(cache.get('a'))
+
+    def test_searcher_cache(self):
+        searcher = SolrSearcher('http://example.com:8180/solr', cache=ResultCache())
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = RESPONSE
+
+            q = searcher.search().filter(status=0).facet('category')
+            self.assertEqual(len(q), 2)
+            self.assertEqual(send_request.call_count, 1)
+
+            q = searcher.search().facet('category').filter(status=0)
+            self.assertEqual([doc.id for doc in q], ['111', '222'])
+            self.assertEqual(send_request.call_count, 1)
+
+            self.assertEqual(len(searcher.search().filter(status=1)), 2)
+            self.assertEqual(send_request.call_count, 2)
+
+            # bypass cache
+            self.assertEqual(len(searcher.search().filter(status=0).cache(0)), 2)
+            self.assertEqual(send_request.call_count, 3)
+
+            searcher.add([{'id': '333'}])
+            self.assertEqual(len(searcher.cache), 0)
+            self.assertEqual(send_request.call_count, 4)
+            self.assertEqual(len(searcher.search().filter(status=0)), 2)
+            self.assertEqual(send_request.call_count, 5)
+
+            send_request.reset_mock()
+            searcher.delete(id='333')
+            searcher.search().filter(status=0).results
+            self.assertEqual(send_request.call_count, 2)
+
+    def test_query_ttl(self):
+        searcher = SolrSearcher('http://example.com:8180/solr', cache=ResultCache(ttl=60))
+        with self.patch_send_request(searcher) as send_request, \
+                patch('solar.cache.time.time') as time_mock:
+            send_request.return_value = RESPONSE
+            time_mock.return_value = 1000
+            searcher.search().cache(10).results
+            time_mock.return_value = 1020
+            searcher.search().cache(10).results
+            self.assertEqual(send_request.call_count, 2)
+
+    def test_index_version(self):
+        searcher = SolrSearcher(
+            'http://example.com:8180/solr',
+            cache=ResultCache(version_check_interval=0))
+        versions = iter([1, 1, 2])
+
+        def send_request(method, path, *args, **kwargs):
+            if path.startswith('admin/luke'):
+                return '{"index": {"version": %d}}' % next(versions)
+            return RESPONSE
+
+        with self.patch_send_request(searcher) as send_request_mock, \
+                patch('solar.cache.time.time', side_effect=count(1000)):
+            send_request_mock.side_effect = send_request
+            searcher.search().results
+            searcher.search().results
+            self.assertEqual(send_request_mock.call_count, 3)
+            searcher.search().results
+            self.assertEqual(send_request_mock.call_count, 5)
+            self.assertEqual(searcher.cache.version, 2)
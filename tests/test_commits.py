@@ -0,0 +1,125 @@
+from __future__ import unicode_literals
+
+import threading
+
+from solar import SolrSearcher
+from solar.cache import ResultCache
+from solar.commits import CommitManager
+
+from .base import TestCase
+
+
+class CommitManagerTest(TestCase):
+    def make_searcher(self, **kwargs):
+        searcher = SolrSearcher('http://example.com:8180/solr', cache=ResultCache())
+        searcher.commit_manager = CommitManager(searcher.solr, **kwargs)
+        searcher.commit_manager.on_commit.append(searcher._invalidate_cache)
+        return searcher
+
+    def commit_paths(self, send_request):
+        return [call[0][1] for call in send_request.call_args_list
+                if call[0][2] == '<commit />']
+
+    def test_commit_params(self):
+        with self.patch_send_request() as send_request:
+            send_request.return_value = '{}'
+            self.searcher.solr.commit(softCommit=True)
+            self.assertEqual(send_request.call_args[0][1],
+                             'update/?commit=true&softCommit=true')
+            self.searcher.solr.commit(openSearcher=False)
+            self.assertEqual(send_request.call_args[0][1],
+                             'update/?commit=true&openSearcher=false')
+            self.searcher.solr.delete(id='1', commit=False, commitWithin=500)
+            self.assertEqual(send_request.call_args[0][1],
+                             'update/?commit=false&commitWithin=500')
+
+    def test_coalescing(self):
+        searcher = self.make_searcher(soft_commit_interval=0.05,
+                                      hard_commit_interval=None)
+        commit_manager = searcher.commit_manager
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            threads = [
+                threading.Thread(target=searcher.add, args=([{'id': str(i)}],))
+                for i in range(10)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            searcher.delete(id='3')
+            self.assertTrue(searcher.wait_for_commit(timeout=5))
+
+            self.assertEqual(send_request.call_count,
+                             11 + len(self.commit_paths(send_request)))
+            self.assertLessEqual(commit_manager.soft_commits, 2)
+            send_request.reset_mock()
+
+            searcher.add([{'id': '11'}])
+            self.assertTrue(searcher.wait_for_commit(timeout=5))
+            self.assertEqual(self.commit_paths(send_request),
+                             ['update/?commit=true&softCommit=true'])
+            # no more changes
+            self.assertTrue(searcher.wait_for_commit(timeout=0))
+            commit_manager.close()
+
+    def test_wait_timeout(self):
+        searcher = self.make_searcher(soft_commit_interval=10,
+                                      hard_commit_interval=None)
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            searcher.add([{'id': '1'}])
+            self.assertFalse(searcher.wait_for_commit(timeout=0.01))
+            searcher.commit_manager.close()
+            self.assertTrue(searcher.wait_for_commit(timeout=0))
+            self.assertEqual(self.commit_paths(send_request),
+                             ['update/?commit=true&softCommit=true',
+                              'update/?commit=true&openSearcher=false'])
+
+    def test_hard_commit(self):
+        searcher = self.make_searcher(soft_commit_interval=0.01,
+                                      hard_commit_interval=0.05)
+        commit_manager = searcher.commit_manager
+        committed = threading.Event()
+        commit_manager.on_commit.append(committed.set)
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            searcher.add([{'id': '1'}])
+            self.assertTrue(committed.wait(5))
+            self.assertEqual(commit_manager.hard_commits, 0)
+            with commit_manager._cond:
+                while commit_manager.hard_commits == 0:
+                    commit_manager._cond.wait(0.01)
+            self.assertEqual(self.commit_paths(send_request),
+                             ['update/?commit=true&softCommit=true',
+                              'update/?commit=true&openSearcher=false'])
+            commit_manager.close()
+            self.assertEqual(len(self.commit_paths(send_request)), 2)
+
+    def test_commit_within(self):
+        searcher = self.make_searcher(commit_within=50, hard_commit_interval=None)
+        commit_manager = searcher.commit_manager
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            searcher.add([{'id': '1'}])
+            self.assertEqual(send_request.call_args[0][1], 'update/?commit=false')
+            self.assertIn('<add commitWithin="50">', send_request.call_args[0][2])
+            # filled after the update
+            searcher.cache.set('key', 'value')
+            self.assertFalse(searcher.wait_for_commit(timeout=0.01))
+            self.assertTrue(searcher.wait_for_commit(timeout=5))
+            self.assertEqual(commit_manager.committed, 1)
+            self.assertIsNone(searcher.cache.get('key'))
+            self.assertEqual(self.commit_paths(send_request), [])
+            self.assertEqual(commit_manager.soft_commits, 0)
+            commit_manager.close()
+            self.assertEqual(self.commit_paths(send_request),
+                             ['update/?commit=true&openSearcher=false'])
+
+    def test_without_commit(self):
+        searcher = self.make_searcher(soft_commit_interval=0.01)
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            searcher.add([{'id': '1'}], commit=False)
+            self.assertEqual(searcher.commit_manager.requested, 0)
+            self.assertTrue(searcher.wait_for_commit(timeout=0))
@@ -0,0 +1,287 @@
+from __future__ import unicode_literals
+
+import time
+import threading
+import unittest
+from functools import partial
+
+import requests
+from mock import patch
+
+from solar import SolrSearcher
+from solar.pysolr import Solr, SolrError, SolrUnavailableError, SolrCircuitOpenError
+from solar.endpoints import EndpointPool, CircuitBreaker
+
+
+RESPONSE = '{"response": {"numFound": 1, "docs": [{"id": "1"}]}}'
+
+
+class EndpointsTest(unittest.TestCase):
+    def setUp(self):
+        self.solr = Solr(['http://solr1:8983/solr', 'http://solr2:8983/solr',
+                          'http://solr3:8983/solr'],
+                         check_interval=None)
+        self.requested_urls = []
+        self.down = set()
+
+    def send_endpoint_request(self, endpoint, method, path='', **kwargs):
+        self.requested_urls.append(endpoint.url)
+        if endpoint.url in self.down:
+            raise SolrUnavailableError('Connection refused')
+        return RESPONSE
+
+    def patch_send_endpoint_request(self):
+        return patch.object(self.solr, '_send_endpoint_request',
+                            side_effect=self.send_endpoint_request)
+
+    def test_rotation(self):
+        with self.patch_send_endpoint_request():
+            for _ in range(6):
+                self.solr.search('*:*')
+        self.assertEqual(
+            self.requested_urls,
+            ['http://solr1:8983/solr', 'http://solr2:8983/solr',
+             'http://solr3:8983/solr'] * 2)
+
+    def test_failover(self):
+        self.down.add('http://solr1:8983/solr')
+        with self.patch_send_endpoint_request():
+            results = self.solr.search('*:*')
+            self.assertEqual(results.hits, 1)
+            self.assertEqual(self.requested_urls,
+                             ['http://solr1:8983/solr', 'http://solr2:8983/solr'])
+            self.assertEqual([e.url for e in self.solr.endpoints.dead],
+                             ['http://solr1:8983/solr'])
+
+            self.requested_urls = []
+            for _ in range(4):
+                self.solr.search('*:*')
+            self.assertNotIn('http://solr1:8983/solr', self.requested_urls)
+
+    def test_updates_are_not_retried(self):
+        self.down.add('http://solr1:8983/solr')
+        with self.patch_send_endpoint_request():
+            self.assertRaises(SolrUnavailableError,
+                              self.solr.add, [{'id': '1'}])
+            self.assertEqual(self.requested_urls, ['http://solr1:8983/solr'])
+
+    def test_all_nodes_down(self):
+        self.down.update(e.url for e in self.solr.endpoints)
+        with self.patch_send_endpoint_request():
+            self.assertRaises(SolrUnavailableError, self.solr.search, '*:*')
+            self.assertEqual(len(self.requested_urls), 3)
+            self.assertEqual(len(self.solr.endpoints.alive), 0)
+
+            # requests are still sent when every node is ejected
+            self.requested_urls = []
+            self.assertRaises(SolrUnavailableError, self.solr.search, '*:*')
+            self.assertEqual(len(self.requested_urls), 3)
+
+    def test_health_check(self):
+        self.down.add('http://solr2:8983/solr')
+        with self.patch_send_endpoint_request():
+            for _ in range(3):
+                self.solr.search('*:*')
+        self.assertEqual(len(self.solr.endpoints.dead), 1)
+
+        with patch.object(self.solr, '_ping_endpoint', return_value=False):
+            self.solr.endpoints.check_fn = self.solr._ping_endpoint
+            self.solr.endpoints.check()
+        self.assertEqual(len(self.solr.endpoints.dead), 1)
+
+        with patch.object(self.solr, '_ping_endpoint', return_value=True):
+            self.solr.endpoints.check_fn = self.solr._ping_endpoint
+            self.solr.endpoints.check()
+        self.assertEqual(len(self.solr.endpoints.dead), 0)
+
+    def test_client_errors_do_not_eject(self):
+        def bad_request(endpoint, method, path='', **kwargs):
+            raise SolrError('[Reason: undefined field]')
+
+        with patch.object(self.solr, '_send_endpoint_request',
+                          side_effect=bad_request) as send_request:
+            self.assertRaises(SolrError, self.solr.search, 'unknown:1')
+            self.assertEqual(send_request.call_count, 1)
+        self.assertEqual(len(self.solr.endpoints.dead), 0)
+
+    def test_searcher(self):
+        searcher = SolrSearcher(['http://solr1:8983/solr', 'http://solr2:8983/solr'])
+        self.assertEqual([e.url for e in searcher.solr.endpoints],
+                         ['http://solr1:8983/solr', 'http://solr2:8983/solr'])
+
+
+class LatencyAwareTest(unittest.TestCase):
+    def test_peak_ewma(self):
+        pool = EndpointPool(['http://solr1:8983/solr', 'http://solr2:8983/solr'],
+                            policy='peak_ewma', check_interval=None)
+        slow, fast = pool.endpoints
+        for _ in range(3):
+            pool.request_started(slow)
+            pool.request_finished(slow, 0.5)
+            pool.request_started(fast)
+            pool.request_finished(fast, 0.01)
+        for _ in range(10):
+            self.assertIs(pool.candidates()[0], fast)
+
+        # a spike is taken into account immediately
+        pool.request_started(fast)
+        pool.request_finished(fast, 2.0)
+        self.assertIs(pool.candidates()[0], slow)
+
+        # requests in flight make node more expensive
+        for _ in range(10):
+            pool.request_started(slow)
+        self.assertIs(pool.candidates()[0], fast)
+
+    def test_latency_percentile(self):
+        pool = EndpointPool(['http://solr1:8983/solr'], check_interval=None)
+        endpoint = pool.endpoints[0]
+        self.assertIsNone(pool.latency_percentile(95))
+        for i in range(1, 101):
+            pool.request_started(endpoint)
+            pool.request_finished(endpoint, i / 1000.0)
+        pool.request_started(endpoint)
+        pool.request_finished(endpoint, 10.0, read=False)
+        self.assertEqual(pool.latency_percentile(95), 0.095)
+        self.assertEqual(pool.latency_percentile(100), 0.1)
+
+    def test_hedged_request(self):
+        solr = Solr(['http://solr1:8983/solr', 'http://solr2:8983/solr'],
+                    check_interval=None, hedge_percentile=90)
+        slow_url = 'http://solr1:8983/solr'
+        release = threading.Event()
+        requested_urls = []
+        slow_fails = []
+
+        def send_endpoint_request(endpoint, method, path='', **kwargs):
+            requested_urls.append(endpoint.url)
+            if endpoint.url == slow_url:
+                release.wait(5)
+                if slow_fails:
+                    raise SolrUnavailableError('Node is down')
+                return '{"response": {"numFound": 1, "docs": []}}'
+            return '{"response": {"numFound": 2, "docs": []}}'
+
+        # without enough samples request is not hedged
+        with patch.object(solr, '_send_endpoint_request',
+                          side_effect=lambda e, *a, **kw: RESPONSE):
+            self.assertEqual(solr.search('*:*').hits, 1)
+
+        for endpoint in solr.endpoints:
+            for _ in range(10):
+                solr.endpoints.request_started(endpoint)
+                solr.endpoints.request_finished(endpoint, 0.2)
+
+        with patch.object(solr, '_send_endpoint_request',
+                          side_effect=send_endpoint_request):
+            # round robin continues from the second node
+            self.assertEqual(solr.search('*:*').hits, 2)
+            self.assertEqual(requested_urls, ['http://solr2:8983/solr'])
+
+            # hedged response is used while the first node is still busy
+            requested_urls[:] = []
+            start_time = time.time()
+            self.assertEqual(solr.search('*:*').hits, 2)
+            self.assertLess(time.time() - start_time, 2)
+            self.assertEqual(requested_urls,
+                             ['http://solr1:8983/solr', 'http://solr2:8983/solr'])
+            self.assertFalse(release.is_set())
+            release.set()
+
+            # response of the first node is used when it is fast enough
+            requested_urls[:] = []
+            self.assertEqual(solr.search('*:*').hits, 2)
+            self.assertEqual(solr.search('*:*').hits, 1)
+            self.assertEqual(requested_urls,
+                             ['http://solr2:8983/solr', 'http://solr1:8983/solr'])
+
+            # hedged request is sent at once when the first node fails
+            slow_fails.append(True)
+            requested_urls[:] = []
+            self.assertEqual(solr.search('*:*').hits, 2)
+            self.assertEqual(solr.search('*:*').hits, 2)
+            self.assertEqual(requested_urls,
+                             ['http://solr2:8983/solr', 'http://solr1:8983/solr',
+                              'http://solr2:8983/solr'])
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_states(self):
+        breaker = CircuitBreaker(window=10, min_calls=4, error_rate=0.5,
+                                 reset_timeout=0)
+        for _ in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.record(False, 0.01)
+        self.assertTrue(breaker.allow())
+        breaker.record(True, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record(True, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # reset_timeout passed so a single trial request is allowed
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record(True, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        self.assertTrue(breaker.allow())
+        breaker.record(False, 0.01)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.transitions,
+                         {'closed': 1, 'open': 2, 'half_open': 2})
+        self.assertEqual(breaker.rejected, 1)
+
+    def test_slow_calls(self):
+        breaker = CircuitBreaker(min_calls=2, slow_call_duration=1.0,
+                                 slow_call_rate=1.0)
+        breaker.record(False, 0.5)
+        breaker.record(False, 1.5)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record(False, 1.5)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker = CircuitBreaker(min_calls=2, slow_call_duration=1.0,
+                                 slow_call_rate=1.0)
+        breaker.record(False, 1.5)
+        breaker.record(False, 2.5)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_fail_fast(self):
+        solr = Solr('http://solr1:8983/solr', check_interval=None,
+                    circuit_breaker=partial(CircuitBreaker, min_calls=2,
+                                            reset_timeout=60))
+        with patch.object(solr.session, 'get',
+                          side_effect=requests.exceptions.Timeout('timed out')) as get:
+            for _ in range(2):
+                self.assertRaises(SolrUnavailableError, solr.search, '*:*')
+            self.assertEqual(get.call_count, 2)
+
+            self.assertRaises(SolrCircuitOpenError, solr.search, '*:*')
+            self.assertEqual(get.call_count, 2)
+
+        self.assertEqual(
+            solr.endpoints.breaker_stats(),
+            {'http://solr1:8983/solr': {
+                'state': 'open',
+                'transitions': {'closed': 0, 'open': 1, 'half_open': 0},
+                'rejected': 1,
+            }})
+
+    def test_update_skips_open_breaker(self):
+        solr = Solr(['http://solr1:8983/solr', 'http://solr2:8983/solr'],
+                    check_interval=None,
+                    circuit_breaker=partial(CircuitBreaker, min_calls=1, reset_timeout=60))
+        endpoint = solr.endpoints.endpoints[0]
+        endpoint.breaker.record(True, 0.01)
+        requested_urls = []
+
+        def send_endpoint_request(endpoint, method, path='', **kwargs):
+            if not solr.endpoints.request_started(endpoint):
+                raise SolrCircuitOpenError('Circuit breaker is open')
+            requested_urls.append(endpoint.url)
+            return '{}'
+
+        with patch.object(solr, '_send_endpoint_request', side_effect=send_endpoint_request):
+            for _ in range(2):
+                solr.add([{'id': '1'}])
+        self.assertEqual(requested_urls, ['http://solr2:8983/solr'] * 2)
@@ -0,0 +1,92 @@
+from __future__ import unicode_literals
+
+import os
+import re
+import json
+import shutil
+import tempfile
+
+from mock import patch
+
+from solar.export import ParallelExporter
+
+from .base import TestCase
+
+
+class ParallelExporterTest(TestCase):
+    def send_request(self, method, path, *args, **kwargs):
+        # documents with odd ids are in the partition 1
+        worker = int(re.search(r'worker%3D(\d)', path).group(1))
+        cursor_mark = re.search(r'cursorMark=([^&]+)', path).group(1)
+        if cursor_mark == '%2A':
+            docs = [{'id': str(i)} for i in range(worker, 6, 2)][:2]
+            return json.dumps({'response': {'docs': docs}, 'nextCursorMark': 'next'})
+        if cursor_mark == 'next':
+            docs = [{'id': str(4 + worker)}]
+            return json.dumps({'response': {'docs': docs}, 'nextCursorMark': 'last'})
+        return json.dumps({'response': {'docs': []}, 'nextCursorMark': 'last'})
+
+    def test_cursor(self):
+        q = self.searcher.search(status=0)
+        exporter = ParallelExporter(q, partitions=2, batch_size=2, fields=['id'])
+        batches = []
+        with self.patch_send_request() as send_request:
+            send_request.side_effect = self.send_request
+            stats = exporter.run(callback=lambda rows, p: batches.append((p, rows)))
+
+            paths = [call[0][1] for call in send_request.call_args_list]
+            for path in paths:
+                self.assertIn('q=status%3A0', path)
+                self.assertIn('%7B%21hash+cache%3Dfalse+partitionKeys%3Did+worker%3D', path)
+                self.assertIn('workers%3D2%7D', path)
+                self.assertIn('sort=id+asc', path)
+                self.assertIn('fl=id', path)
+                self.assertIn('rows=2', path)
+
+        self.assertEqual(
+            sorted(row['id'] for _, rows in batches for row in rows),
+            ['0', '1', '2', '3', '4', '5'])
+        self.assertEqual(stats.docs, 6)
+        self.assertEqual([(p.partition, p.docs) for p in stats.partitions], [(0, 3), (1, 3)])
+        self.assertEqual(stats.failed_partitions, [])
+
+    def test_export_files(self):
+        path = tempfile.mkdtemp()
+        try:
+            self._test_export_files(path)
+        finally:
+            shutil.rmtree(path)
+
+    def _test_export_files(self, path):
+        q = self.searcher.search().only('id', 'price')
+
+        def export(q, **params):
+            worker = int(re.search(r'worker=(\d)', params['fq'][0]).group(1))
+            if worker == 2:
+                raise ValueError('Export failed')
+            for i in range(worker, 7, 3):
+                yield {'id': str(i), 'price': i * 10}
+
+        exporter = ParallelExporter(q, partitions=3, mode='export', batch_size=2)
+        with patch.object(self.searcher.solr, 'export', side_effect=export) as export_mock, \
+                patch('solar.export.log'):
+            stats = exporter.run(path=os.path.join(path, 'dump-{partition}.json'))
+            self.assertEqual(export_mock.call_args[1]['fl'], 'id,price')
+            self.assertEqual(export_mock.call_args[1]['sort'], 'id asc')
+
+        with open(os.path.join(path, 'dump-0.json')) as f:
+            self.assertEqual([json.loads(line) for line in f],
+                             [{'id': '0', 'price': 0}, {'id': '3', 'price': 30},
+                              {'id': '6', 'price': 60}])
+        with open(os.path.join(path, 'dump-1.json')) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(stats.docs, 5)
+        self.assertEqual([p.partition for p in stats.failed_partitions], [2])
+
+        exporter = ParallelExporter(q, partitions=3, mode='export')
+        with patch.object(self.searcher.solr, 'export', side_effect=export), \
+                patch('solar.export.log'):
+            exporter.run(path=os.path.join(path, 'dump.json'))
+        with open(os.path.join(path, 'dump.json')) as f:
+            self.assertEqual(sorted(json.loads(line)['id'] for line in f),
+                             ['0', '1', '3', '4', '6'])
@@ -0,0 +1,239 @@
+from __future__ import unicode_literals
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+
+from mock import patch
+
+from solar import SolrSearcher
+from solar.searcher import CommonSearcher
+from solar.pysolr import SolrError
+from solar.indexer import BulkIndexer, DeadLetterFile, estimate_doc_size
+from solar.fingerprints import FingerprintStore, doc_fingerprint
+
+from .base import TestCase
+
+
+class BulkIndexerTest(TestCase):
+    def test_batches(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        results = []
+        indexer = BulkIndexer(searcher, batch_size=3, workers=2,
+                              on_batch=results.append)
+        docs = [{'id': str(i), 'name': 'doc {}'.format(i)} for i in range(10)]
+        with patch.object(searcher, 'add') as add, \
+                patch.object(searcher, 'commit') as commit:
+            stats = indexer.index(iter(docs))
+
+            self.assertEqual(add.call_count, 4)
+            sent = sorted(
+                (doc for call in add.call_args_list for doc in call[0][0]),
+                key=lambda doc: int(doc['id']))
+            self.assertEqual(sent, docs)
+            for call in add.call_args_list:
+                self.assertEqual(call[1], {'commit': False})
+            commit.assert_called_once_with()
+
+        self.assertEqual(stats.batches, 4)
+        self.assertEqual(stats.docs, 10)
+        self.assertEqual(stats.failed_docs, 0)
+        self.assertEqual(sorted(r.ndocs for r in results), [1, 3, 3, 3])
+        self.assertEqual(stats.size, sum(estimate_doc_size(d) for d in docs))
+
+    def test_batch_bytes(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        indexer = BulkIndexer(searcher, batch_bytes=250, workers=1, commit=False)
+        docs = [{'id': str(i), 'text': 'x' * 100} for i in range(5)]
+        with patch.object(searcher, 'add') as add, \
+                patch.object(searcher, 'commit') as commit:
+            indexer.index(docs)
+            self.assertEqual([len(call[0][0]) for call in add.call_args_list],
+                             [3, 2])
+            self.assertFalse(commit.called)
+
+    def test_dedupe(self):
+        searcher = CommonSearcher('http://example.com:8180/solr')
+        searcher.type_value = 'Product'
+        indexer = BulkIndexer(searcher, batch_size=10, workers=1, commit=False)
+        docs = [{'id': 1, 'name': 'old'}, {'id': 2, 'name': 'second'},
+                {'id': 1, 'name': 'new'}, None]
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            stats = indexer.index(docs)
+            self.assertEqual(send_request.call_count, 1)
+            body = send_request.call_args[0][2]
+            self.assertNotIn('old', body)
+            self.assertLess(body.index('second'), body.index('new'))
+            self.assertIn('<field name="_id">Product:1</field>', body)
+            self.assertIn('<field name="_type">Product</field>', body)
+        self.assertEqual(stats.docs, 2)
+        self.assertEqual(stats.duplicates, 1)
+
+    def test_failures(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        indexer = BulkIndexer(searcher, batch_size=2, workers=3)
+
+        def add(docs, commit=True):
+            if any(doc['id'] == '3' for doc in docs):
+                raise ValueError('bad doc')
+
+        with patch.object(searcher, 'add', side_effect=add), \
+                patch.object(searcher, 'commit'), \
+                patch('solar.indexer.log'):
+            stats = indexer.index({'id': str(i)} for i in range(6))
+
+        self.assertEqual(stats.batches, 3)
+        self.assertEqual(stats.docs, 4)
+        self.assertEqual(stats.failed_docs, 2)
+        self.assertEqual([d['id'] for d in stats.failed_batches[0].docs], ['2', '3'])
+        self.assertIsInstance(stats.failed_batches[0].error, ValueError)
+
+    def test_backpressure(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        indexer = BulkIndexer(searcher, batch_size=1, workers=1, queue_size=1,
+                              commit=False)
+        release = threading.Event()
+        produced = []
+
+        def docs():
+            for i in range(5):
+                produced.append(i)
+                yield {'id': str(i)}
+
+        def add(docs, commit=True):
+            release.wait()
+
+        with patch.object(searcher, 'add', side_effect=add):
+            t = threading.Thread(target=indexer.index, args=(docs(),))
+            t.start()
+            t.join(0.2)
+            # one batch is being sent, one is in the queue and
+            # the producer is blocked on the next one
+            self.assertLessEqual(len(produced), 3)
+            release.set()
+            t.join()
+        self.assertEqual(len(produced), 5)
+
+    def test_fingerprints(self):
+        path = tempfile.mkdtemp()
+        fingerprints = FingerprintStore(os.path.join(path, 'fingerprints'))
+        try:
+            self._test_fingerprints(fingerprints)
+        finally:
+            fingerprints.close()
+            shutil.rmtree(path)
+
+    def _test_fingerprints(self, fingerprints):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        indexer = BulkIndexer(searcher, batch_size=2, workers=2,
+                              fingerprints=fingerprints, delete_missing=True)
+        docs = [{'id': str(i), 'price': i * 10} for i in range(5)]
+        with patch.object(searcher, 'add') as add, \
+                patch.object(searcher, 'delete') as delete, \
+                patch.object(searcher, 'commit'):
+            stats = indexer.index(docs)
+            self.assertEqual(stats.docs, 5)
+            self.assertFalse(delete.called)
+            self.assertEqual(len(fingerprints), 5)
+
+            add.reset_mock()
+            docs[1] = {'id': '1', 'price': 11}
+            # the last version is the same as the indexed one
+            # but it is in the next batch
+            docs.append({'id': '2', 'price': 21})
+            docs.append({'id': '2', 'price': 20})
+            stats = indexer.index(docs[1:])
+            self.assertEqual(stats.skipped, 3)
+            self.assertEqual(add.call_count, 2)
+            self.assertEqual(
+                sorted(doc['price'] for call in add.call_args_list for doc in call[0][0]),
+                [11, 20, 21])
+            delete.assert_called_once_with(commit=False, id__in=['0'])
+            self.assertEqual(stats.deleted, 1)
+            self.assertEqual(sorted(fingerprints.keys()), ['1', '2', '3', '4'])
+
+            add.reset_mock()
+            add.side_effect = ValueError()
+            with patch('solar.indexer.log'):
+                stats = indexer.index([{'id': '1', 'price': 12}])
+            self.assertEqual(stats.failed_docs, 1)
+            # nothing is deleted when batch failed
+            self.assertEqual(delete.call_count, 1)
+            self.assertNotEqual(fingerprints.get('1'),
+                                doc_fingerprint({'id': '1', 'price': 12}))
+
+    def test_on_batch_error(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+
+        def on_batch(result):
+            raise ValueError('callback error')
+
+        indexer = BulkIndexer(searcher, batch_size=1, workers=1, queue_size=1,
+                              commit=False, on_batch=on_batch)
+        with patch.object(searcher, 'add') as add, \
+                patch('solar.indexer.log') as log:
+            stats = indexer.index({'id': str(i)} for i in range(5))
+            self.assertEqual(add.call_count, 5)
+            self.assertEqual(log.exception.call_count, 5)
+        self.assertEqual(stats.docs, 5)
+
+    def test_bisect(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        rejected = []
+        indexer = BulkIndexer(searcher, batch_size=8, workers=1, commit=False,
+                              dead_letter=lambda doc, error: rejected.append((doc, error)))
+        sent = []
+
+        def add(docs, commit=True):
+            bad = [doc['id'] for doc in docs if doc.get('bad')]
+            if bad:
+                raise SolrError('ERROR: [doc={}] bad field'.format(bad[0]), status_code=400)
+            sent.extend(doc['id'] for doc in docs)
+
+        docs = [{'id': str(i), 'bad': i in (2, 5)} for i in range(8)]
+        with patch.object(searcher, 'add', side_effect=add) as add_mock, \
+                patch('solar.indexer.log'):
+            stats = indexer.index(docs)
+            # 8 -> 4 + 4 -> 2 + 2 + 2 + 2 -> 1 + 1 + 1 + 1
+            self.assertEqual(add_mock.call_count, 11)
+
+        self.assertEqual(sorted(sent), ['0', '1', '3', '4', '6', '7'])
+        self.assertEqual(stats.rejected, 2)
+        self.assertEqual(stats.docs, 6)
+        self.assertEqual(stats.failed_docs, 0)
+        self.assertEqual([doc['id'] for doc, _ in rejected], ['2', '5'])
+        self.assertEqual(str(rejected[0][1]), 'ERROR: [doc=2] bad field')
+
+    def test_bisect_server_error(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        indexer = BulkIndexer(searcher, batch_size=8, workers=1, commit=False)
+        for status_code in (500, 401, 404):
+            with patch.object(searcher, 'add',
+                              side_effect=SolrError('Error', status_code=status_code)) as add, \
+                    patch('solar.indexer.log'):
+                stats = indexer.index({'id': str(i)} for i in range(4))
+                self.assertEqual(add.call_count, 1)
+            self.assertEqual(stats.docs, 0)
+            self.assertEqual(stats.size, 0)
+            self.assertEqual(stats.failed_docs, 4)
+            self.assertEqual(stats.rejected, 0)
+
+    def test_dead_letter_file(self):
+        path = tempfile.mkdtemp()
+        dead_letter = DeadLetterFile(os.path.join(path, 'rejected.json'))
+        try:
+            dead_letter({'id': '1', 'price': 'abc'}, SolrError('bad price'))
+            dead_letter({'id': '2'}, SolrError('bad doc'))
+            dead_letter.close()
+            with open(dead_letter.path) as f:
+                lines = [json.loads(line) for line in f]
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(lines, [
+            {'doc': {'id': '1', 'price': 'abc'}, 'error': 'bad price'},
+            {'doc': {'id': '2'}, 'error': 'bad doc'},
+        ])
+
@@ -0,0 +1,143 @@
+from __future__ import unicode_literals
+
+import re
+import json
+
+from solar import SolrSearcher
+from solar.paging import DeepPagingPolicy, DeepPagingError, cursor_sort
+from solar.ext.pagination.flask import Pagination
+
+from .base import TestCase
+
+
+def cursor_response(method, path, *args, **kwargs):
+    """Emulates cursor over 100 documents with ids from 0 to 99."""
+    if 'cursorMark' not in path:
+        match = re.search(r'start=(\d+)', path)
+        start = int(match.group(1)) if match else 0
+        docs = [{'id': str(i)} for i in range(start, min(start + 10, 100))]
+        return json.dumps({'response': {'numFound': 100, 'docs': docs}})
+    cursor_mark = re.search(r'cursorMark=([^&]+)', path).group(1)
+    rows = int(re.search(r'rows=(\d+)', path).group(1))
+    position = 0 if cursor_mark == '%2A' else int(cursor_mark)
+    docs = [{'id': str(i)} for i in range(position, min(position + rows, 100))]
+    return json.dumps({'response': {'numFound': 100, 'docs': docs},
+                       'nextCursorMark': str(position + len(docs))})
+
+
+class DeepPagingTest(TestCase):
+    def make_searcher(self, **kwargs):
+        return SolrSearcher('http://example.com:8180/solr',
+                            deep_paging=DeepPagingPolicy(**kwargs))
+
+    def test_cursor_sort(self):
+        self.assertEqual(cursor_sort(None, 'id'), 'id asc')
+        self.assertEqual(cursor_sort('price desc, name asc', 'id'),
+                         'price desc,name asc,id asc')
+        self.assertEqual(cursor_sort('id desc', 'id'), 'id desc')
+
+    def test_reject(self):
+        searcher = self.make_searcher(max_start=20)
+        with self.patch_send_request(searcher) as send_request:
+            send_request.side_effect = cursor_response
+            self.assertEqual(len(searcher.search()[20:30]), 100)
+            with self.assertRaises(DeepPagingError):
+                searcher.search()[30:40].results
+            self.assertEqual(send_request.call_count, 1)
+            # count does not fetch documents
+            self.assertEqual(searcher.search().offset(30).count(), 100)
+
+    def test_clamp(self):
+        searcher = self.make_searcher(max_start=20, mode='clamp')
+        with self.patch_send_request(searcher) as send_request:
+            send_request.side_effect = cursor_response
+            docs = list(searcher.search()[50:60])
+            self.assertEqual([doc.id for doc in docs][:1], ['20'])
+            self.assertIn('start=20', send_request.call_args[0][1])
+
+            p = Pagination(searcher.search(), page=2, per_page=10)
+            self.assertEqual(p.total, 100)
+            self.assertEqual(p.pages, 3)
+            self.assertFalse(p.next().next().has_next)
+
+    def test_cursor(self):
+        searcher = self.make_searcher(max_start=20, mode='cursor', walk_rows=15)
+        with self.patch_send_request(searcher) as send_request:
+            send_request.side_effect = cursor_response
+            q = searcher.search().order_by('-rank')
+
+            docs = list(q[40:50])
+            self.assertEqual([doc.id for doc in docs], [str(i) for i in range(40, 50)])
+            paths = [call[0][1] for call in send_request.call_args_list]
+            # walk: 0 -> 15 -> 30 -> 40, then the page itself
+            self.assertEqual(len(paths), 4)
+            self.assertEqual([re.search(r'rows=(\d+)', path).group(1) for path in paths],
+                             ['15', '15', '10', '10'])
+            for path in paths[:3]:
+                self.assertTrue(re.search(r'fl=id(&|$)', path))
+                self.assertIn('facet=false', path)
+            for path in paths:
+                self.assertIn('sort=rank+desc%2Cid+asc', path)
+                self.assertNotIn('start=', path)
+
+            # next page costs one request
+            send_request.reset_mock()
+            docs = list(q[50:60])
+            self.assertEqual(docs[0].id, '50')
+            self.assertEqual(send_request.call_count, 1)
+            self.assertIn('cursorMark=50', send_request.call_args[0][1])
+
+            # page with another size starts from the nearest known position
+            send_request.reset_mock()
+            docs = list(q[55:75])
+            self.assertEqual(docs[0].id, '55')
+            self.assertEqual(send_request.call_count, 2)
+            self.assertIn('cursorMark=50', send_request.call_args_list[0][0][1])
+
+            # other query has its own cursors
+            send_request.reset_mock()
+            list(q.filter(status=0)[50:60])
+            self.assertEqual(send_request.call_count, 5)
+
+            # no documents at the start
+            send_request.reset_mock()
+            results = searcher.search()[150:160].results
+            self.assertEqual(results.ndocs, 100)
+            self.assertEqual(len(results.docs), 0)
+
+            # pagination shows all the pages
+            p = Pagination(q, page=7, per_page=10)
+            self.assertEqual(p.pages, 10)
+            self.assertEqual(p.items[0].id, '60')
+
+    def test_cursor_grouped(self):
+        searcher = self.make_searcher(max_start=20, mode='cursor')
+        with self.patch_send_request(searcher):
+            with self.assertRaises(DeepPagingError):
+                searcher.search().group('company')[30:40].results
+
+    def test_cursor_max_walk(self):
+        searcher = self.make_searcher(max_start=20, mode='cursor', walk_rows=10, max_walk=3)
+        with self.patch_send_request(searcher) as send_request:
+            send_request.side_effect = cursor_response
+            with self.assertRaises(DeepPagingError):
+                searcher.search()[40:50].results
+            self.assertFalse(send_request.called)
+
+            # walks from the remembered position
+            list(searcher.search()[30:40])
+            self.assertEqual(send_request.call_count, 4)
+            send_request.reset_mock()
+            docs = list(searcher.search()[60:70])
+            self.assertEqual(docs[0].id, '60')
+            self.assertEqual(send_request.call_count, 3)
+
+        searcher = self.make_searcher(max_start=20, mode='cursor', walk_rows=10, max_walk=3,
+                                      walk_fallback='clamp')
+        with self.patch_send_request(searcher) as send_request:
+            send_request.side_effect = cursor_response
+            docs = list(searcher.search()[40:50])
+            self.assertEqual(docs[0].id, '20')
+            self.assertEqual(send_request.call_count, 1)
+            self.assertIn('start=20', send_request.call_args[0][1])
+            self.assertNotIn('cursorMark', send_request.call_args[0][1])
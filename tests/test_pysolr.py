@@ -0,0 +1,277 @@
+# coding: utf-8
+from __future__ import unicode_literals
+
+import json
+import zlib
+import unittest
+from datetime import datetime
+
+from mock import Mock, patch
+
+from solar.pysolr import Solr, SolrError, sanitize
+
+
+def read_body(body):
+    if isinstance(body, (bytes, type(''))):
+        return body
+    return b''.join(body)
+
+
+def gzip_decompress(body):
+    return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+
+def load_commands(body):
+    """Parses JSON update message into list of ``(name, command)`` pairs."""
+    def to_python(value):
+        if isinstance(value, list) and value and isinstance(value[0], tuple):
+            return dict((k, to_python(v)) for k, v in value)
+        if isinstance(value, list):
+            return [to_python(v) for v in value]
+        return value
+
+    pairs = json.loads(read_body(body).decode('utf-8'),
+                       object_pairs_hook=lambda pairs: pairs)
+    return [(name, to_python(command)) for name, command in pairs]
+
+
+class SolrUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.solr = Solr('http://example.com:8180/solr')
+
+    def patch_send_request(self):
+        return patch.object(self.solr, '_send_request', return_value='{}')
+
+    def test_sanitize(self):
+        self.assertEqual(sanitize('a\x00b\x1fc\td\ne\x0b'), 'abc\td\ne')
+        self.assertEqual(sanitize(b'\xd1\x82\x07'), 'т')
+
+    def test_add_xml(self):
+        with self.patch_send_request() as send_request:
+            self.solr.add([{'id': '1', 'name': 'test\x07'}], commit=False)
+            method, path, body, headers = send_request.call_args[0]
+            self.assertEqual(method, 'post')
+            self.assertEqual(path, 'update/?commit=false')
+            self.assertIn('<field name="name">test</field>', body)
+            self.assertEqual(headers, {'Content-type': 'text/xml; charset=utf-8'})
+
+    def test_add_json(self):
+        def docs():
+            yield {'id': '1', 'name': 'Nokia “Lumia”\x00',
+                   'tags': ['phone', None, ''], 'empty': '',
+                   'dt_created': datetime(2013, 5, 1, 12, 30),
+                   'rank': 1.5, 'is_active': True, 'boost': 2}
+            yield {'id': '2', 'price': {'set': 100}, 'tags': {'add': ['new']},
+                   'category': {'set': None}}
+
+        with self.patch_send_request() as send_request:
+            self.solr.add(docs(), boost={'name': 3}, commitWithin=1000, format='json')
+            method, path, body, headers = send_request.call_args[0]
+            self.assertEqual(method, 'post')
+            self.assertEqual(path, 'update/?commit=true&commitWithin=1000')
+            self.assertEqual(headers, {'Content-type': 'application/json; charset=utf-8'})
+
+            commands = load_commands(body)
+            self.assertEqual([name for name, _ in commands], ['add', 'add'])
+            commands = [command for _, command in commands]
+            self.assertEqual(commands[0], {
+                'doc': {
+                    'id': '1',
+                    'name': {'value': 'Nokia “Lumia”\x00', 'boost': 3.0},
+                    'tags': ['phone'],
+                    'dt_created': '2013-05-01T12:30:00Z',
+                    'rank': 1.5,
+                    'is_active': True,
+                },
+                'boost': 2.0,
+            })
+            self.assertEqual(commands[1], {
+                'doc': {
+                    'id': '2',
+                    'price': {'set': 100},
+                    'tags': {'add': ['new']},
+                    'category': {'set': None},
+                },
+            })
+
+    def test_add_json_chunks(self):
+        self.solr.json_chunk_size = 100
+        with self.patch_send_request() as send_request:
+            self.solr.add(({'id': str(i), 'name': 'x' * 50} for i in range(10)),
+                          format='json')
+            chunks = list(send_request.call_args[0][2])
+            self.assertEqual(len(chunks), 6)
+            self.assertTrue(all(len(c) < 200 for c in chunks))
+            self.assertEqual(len(load_commands(chunks)), 10)
+
+        with self.patch_send_request() as send_request:
+            self.solr.add([], format='json')
+            self.assertEqual(read_body(send_request.call_args[0][2]), b'{}')
+
+    def test_gzip(self):
+        solr = Solr('http://example.com:8180/solr', gzip_min_size=1000)
+        with patch.object(solr, '_send_request', return_value='{}') as send_request:
+            solr.add([{'id': '1'}])
+            method, path, body, headers = send_request.call_args[0]
+            self.assertNotIn('Content-Encoding', headers)
+            self.assertIn('<field name="id">1</field>', body)
+
+            docs = [{'id': str(i), 'name': 'Nokia Lumia'} for i in range(100)]
+            solr.add(docs)
+            method, path, body, headers = send_request.call_args[0]
+            self.assertEqual(headers['Content-Encoding'], 'gzip')
+            body = gzip_decompress(body).decode('utf-8')
+            self.assertEqual(body.count('<doc>'), 100)
+
+            solr.add(iter(docs), format='json')
+            method, path, body, headers = send_request.call_args[0]
+            self.assertEqual(headers['Content-Encoding'], 'gzip')
+            self.assertEqual(len(load_commands(gzip_decompress(read_body(body)))), 100)
+
+        stats = solr.compression_stats
+        self.assertEqual(stats.requests, 2)
+        self.assertLess(stats.ratio, 0.5)
+        self.assertGreater(stats.raw_size, stats.compressed_size)
+
+    def test_bulk_load_csv(self):
+        docs = [
+            {'id': '1', 'name': 'Nokia, "Lumia"', 'tags': ['phone', 'new'],
+             'dt_created': datetime(2013, 5, 1, 12, 30), 'is_active': True},
+            {'id': '2', 'name': 'Line\nbreak', 'tags': [], 'price': 1.5},
+            {'id': '3', 'name': None},
+        ]
+        with self.patch_send_request() as send_request:
+            self.solr.bulk_load_csv(iter(docs), ['id', 'name', 'tags', 'price',
+                                                 'dt_created', 'is_active'],
+                                    multivalued=['tags'], commitWithin=1000)
+            self.assertEqual(send_request.call_count, 1)
+            method, path, body, headers = send_request.call_args[0]
+            self.assertEqual(headers, {'Content-type': 'application/csv; charset=utf-8'})
+            self.assertEqual(
+                path,
+                'update/?commit=true&commitWithin=1000&encapsulator=%22'
+                '&f.tags.separator=%7C&f.tags.split=true&header=true&separator=%2C')
+            self.assertEqual(
+                read_body(body).decode('utf-8'),
+                'id,name,tags,price,dt_created,is_active\n'
+                '1,"Nokia, ""Lumia""",phone|new,,2013-05-01T12:30:00Z,true\n'
+                '2,"Line\nbreak",,1.5,,\n'
+                '3,,,,,\n')
+
+    def test_bulk_load_csv_batches(self):
+        with self.patch_send_request() as send_request:
+            self.solr.bulk_load_csv(({'id': str(i)} for i in range(5)), ['id'],
+                                    separator='\t', batch_size=2)
+            calls = send_request.call_args_list
+            self.assertEqual([read_body(c[0][2]).count(b'\n') - 1 for c in calls], [2, 2, 1])
+            self.assertEqual([c[0][1].split('&')[0] for c in calls],
+                             ['update/?commit=false', 'update/?commit=false',
+                              'update/?commit=true'])
+            self.assertIn('separator=%09', calls[0][0][1])
+
+    def test_batch_update(self):
+        commands = [
+            ('add', {'id': '1', 'name': 'Nokia'}),
+            ('add', {'id': '2', 'price': {'inc': 10}}),
+            ('delete', {'id': '3'}),
+            ('delete', {'query': 'name:"a & b"'}),
+            ('add', {'id': '4'}),
+        ]
+        with self.patch_send_request() as send_request:
+            self.solr.batch_update(commands, commitWithin=1000)
+            method, path, body, headers = send_request.call_args[0]
+            self.assertEqual(path, 'update/?commit=true&commitWithin=1000')
+            self.assertIn(
+                '<update><add><doc><field name="id">1</field>'
+                '<field name="name">Nokia</field></doc><doc>', body)
+            self.assertIn(
+                '</doc></add><delete><id>3</id>'
+                '<query>name:"a &amp; b"</query></delete>'
+                '<add><doc><field name="id">4</field></doc></add></update>', body)
+
+            self.solr.batch_update(commands, commit=False, format='json')
+            method, path, body, headers = send_request.call_args[0]
+            self.assertEqual(path, 'update/?commit=false')
+            self.assertEqual(headers, {'Content-type': 'application/json; charset=utf-8'})
+            self.assertEqual(load_commands(body), [
+                ('add', {'doc': {'id': '1', 'name': 'Nokia'}}),
+                ('add', {'doc': {'id': '2', 'price': {'inc': 10}}}),
+                ('delete', {'id': '3'}),
+                ('delete', {'query': 'name:"a & b"'}),
+                ('add', {'doc': {'id': '4'}}),
+            ])
+
+
+EXPORT_RESPONSE = (
+    '{"responseHeader": {"status": 0},\n'
+    ' "response": {"numFound": 3, "docs": [\n'
+    '  {"id": "1", "name": "Nokia “Lumia”", "price": 100},\n'
+    '  {"id": "2", "name": "Lumia", "price": 1.5e2},\n'
+    '  {"id": "3", "tags": ["a", "b]"]}]}}'
+).encode('utf-8')
+
+
+class SolrExportTest(unittest.TestCase):
+    def setUp(self):
+        self.solr = Solr('http://example.com:8180/solr')
+
+    def test_export(self):
+        with patch.object(self.solr, '_send_request',
+                          return_value=iter([EXPORT_RESPONSE])) as send_request:
+            rows = self.solr.export('name:lumia', fl='id,name,price', sort='id asc',
+                                    fq=['status:0', 'price:[* TO 200]'])
+            # nothing is sent until iteration
+            self.assertEqual(len(list(rows)), 3)
+            method, path, body = send_request.call_args[0]
+            self.assertEqual((method, path), ('post', 'export'))
+            self.assertIn('fl=id%2Cname%2Cprice', body)
+            self.assertIn('sort=id+asc', body)
+            self.assertIn('fq=status%3A0&fq=price%3A%5B%2A+TO+200%5D', body)
+            self.assertIn('wt=json', body)
+            self.assertTrue(send_request.call_args[1]['stream'])
+
+    def test_parse_export(self):
+        expected = [
+            {'id': '1', 'name': 'Nokia “Lumia”', 'price': 100},
+            {'id': '2', 'name': 'Lumia', 'price': 150.0},
+            {'id': '3', 'tags': ['a', 'b]']},
+        ]
+        for chunk_size in (1, 2, 3, 7, 64, len(EXPORT_RESPONSE)):
+            chunks = [EXPORT_RESPONSE[i:i + chunk_size]
+                      for i in range(0, len(EXPORT_RESPONSE), chunk_size)]
+            self.assertEqual(list(self.solr._parse_export(chunks)), expected)
+
+        empty = b'{"responseHeader": {"status": 0}, "response": {"numFound": 0, "docs": []}}'
+        self.assertEqual(list(self.solr._parse_export([empty])), [])
+
+    def test_parse_export_errors(self):
+        error = (b'{"responseHeader": {"status": 400}, "response": {"numFound": 0,'
+                 b' "docs": [{"EXCEPTION": "field name must have docValues"}]}}')
+        with self.assertRaises(SolrError) as cm:
+            list(self.solr._parse_export([error]))
+        self.assertEqual(str(cm.exception), 'field name must have docValues')
+
+        truncated = EXPORT_RESPONSE[:EXPORT_RESPONSE.index(b'{"id": "2"') + 5]
+        rows = self.solr._parse_export([truncated])
+        self.assertEqual(next(rows)['id'], '1')
+        self.assertRaises(SolrError, list, rows)
+        self.assertRaises(SolrError, list, self.solr._parse_export([b'<html>']))
+
+    def test_export_closes_response(self):
+        resp = Mock(status_code=200)
+        resp.iter_content.return_value = iter(
+            [EXPORT_RESPONSE[:60], EXPORT_RESPONSE[60:]])
+        with patch.object(self.solr.session, 'post', return_value=resp) as post:
+            rows = self.solr.export('*:*', fl='id', sort='id asc')
+            self.assertTrue(post.call_args[1]['stream'])
+            self.assertEqual(next(rows)['id'], '1')
+            self.assertFalse(resp.close.called)
+            # consumer stopped iterating
+            rows.close()
+            resp.close.assert_called_once_with()
+
+            resp.reset_mock()
+            resp.iter_content.return_value = iter([EXPORT_RESPONSE])
+            self.assertEqual(len(list(self.solr.export('*:*', fl='id', sort='id asc'))), 3)
+            resp.close.assert_called_once_with()
+
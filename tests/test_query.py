@@ -1,4 +1,5 @@
 from __future__ import unicode_literals
+import re
 
 from datetime import datetime
 from collections import namedtuple
@@ -258,6 +259,25 @@ class QueryTest(TestCase):
             self.assertEqual(q.count(), 181)
             self.assertEqual(send_request.call_count, 2)
 
+            q = (self.searcher.search('nokia').filter(status=0)
+                 .facet_field('category').stats('price').group('company')
+                 .highlight('name').order_by('-price').only('id').offset(20).limit(10)
+                 .dismax().qf({'name': 2}))
+            self.assertEqual(q.count(), 181)
+            path = send_request.call_args[0][1]
+            self.assertEqual(
+                sorted(path.split('?', 1)[1].split('&')),
+                ['defType=dismax', 'fq=status%3A0', 'q=nokia', 'qf=name%5E2',
+                 'rows=0', 'wt=json'])
+
+            # count of fetched results
+            send_request.reset_mock()
+            q = self.searcher.search()
+            list(q)
+            self.assertEqual(q.count(), 181)
+            self.assertEqual(len(q), 181)
+            self.assertEqual(send_request.call_count, 1)
+
 
     def test_iter_docs(self):
         with self.patch_send_request() as send_request:
@@ -296,6 +316,86 @@ class QueryTest(TestCase):
             check_docs(iter(q), canonical_docs)
             self.assertEqual(send_request.call_count, 1)
 
+    def test_iterator(self):
+        pages = [
+            '{"response": {"numFound": 3, "docs": [{"id": "1"}, {"id": "2"}]},'
+            ' "nextCursorMark": "AoE2"}',
+            '{"response": {"numFound": 3, "docs": [{"id": "3"}]},'
+            ' "nextCursorMark": "AoE3"}',
+            '{"response": {"numFound": 3, "docs": []}, "nextCursorMark": "AoE3"}',
+        ]
+        with self.patch_send_request() as send_request:
+            send_request.side_effect = lambda *args, **kwargs: pages.pop(0)
+            q = self.searcher.search('nokia').order_by('-rank').offset(10)
+            it = q.iterator(batch_size=2)
+            self.assertEqual(next(it).id, '1')
+            self.assertEqual(send_request.call_count, 1)
+            self.assertEqual([doc.id for doc in it], ['2', '3'])
+            self.assertEqual(send_request.call_count, 3)
+
+            paths = [call[0][1] for call in send_request.call_args_list]
+            self.assertIn('cursorMark=%2A', paths[0])
+            self.assertIn('cursorMark=AoE2', paths[1])
+            self.assertIn('cursorMark=AoE3', paths[2])
+            for path in paths:
+                self.assertIn('sort=rank+desc%2Cid+asc', path)
+                self.assertIn('rows=2', path)
+                self.assertNotIn('start=', path)
+            # original query is not changed
+            self.assertEqual(q._params['sort'], ('rank desc',))
+            self.assertEqual(q._params['start'], 10)
+
+    def test_iterator_components(self):
+        with self.patch_send_request() as send_request:
+            send_request.return_value = '{"response": {"docs": []}, "nextCursorMark": "*"}'
+            q = (self.searcher.search('nokia')
+                 .facet_field('category').facet_query(price__lt=100)
+                 .stats('price').highlight('name'))
+            list(q.iterator())
+            path = send_request.call_args[0][1]
+            self.assertIn('cursorMark=%2A', path)
+            for param in ('facet', 'stats', 'hl'):
+                self.assertFalse(re.search(r'(^|&|\?){}[.=]'.format(param), path), path)
+            self.assertIn('category', q._prepare_params()['facet.field'])
+
+            self.assertRaises(ValueError, list, q.group('company').iterator())
+
+    def test_iterator_instances(self):
+        Obj = namedtuple('Obj', ['id', 'name'])
+        mapped = []
+
+        def instance_mapper(ids, db_query=None):
+            mapped.append(ids)
+            return dict((id, Obj(id, 'Obj {}'.format(id))) for id in ids if id != '2')
+
+        pages = [
+            '{"response": {"docs": [{"id": "1"}, {"id": "2"}]}, "nextCursorMark": "AoE2"}',
+            '{"response": {"docs": [{"id": "3"}]}, "nextCursorMark": "AoE3"}',
+            '{"response": {"docs": []}, "nextCursorMark": "AoE3"}',
+        ]
+        with self.patch_send_request() as send_request:
+            send_request.side_effect = lambda *args, **kwargs: pages.pop(0)
+            q = self.searcher.search().instances().instance_mapper(instance_mapper)
+            objs = list(q.iterator(batch_size=2))
+            self.assertEqual([obj.name for obj in objs], ['Obj 1', 'Obj 3'])
+            self.assertEqual(mapped, [['1', '2'], ['3']])
+            self.assertIn('sort=id+asc', send_request.call_args_list[0][0][1])
+            self.assertIn('fl=id', send_request.call_args_list[0][0][1])
+
+    def test_export(self):
+        with patch.object(self.searcher.solr, 'export', return_value=iter([])) as export:
+            q = (self.searcher.search('nokia').filter(status=0)
+                 .facet_field('category').limit(10))
+            self.assertRaises(ValueError, q.export)
+
+            q.export('id', 'price')
+            export.assert_called_with('nokia', fl='id,price', sort='id asc',
+                                      fq=['status:0'])
+
+            q.only('id').order_by('-price').export()
+            export.assert_called_with('nokia', fl='id', sort='price desc',
+                                      fq=['status:0'])
+
     def test_query_cloning(self):
         q = self.searcher.search()
         q = q.qf([('name', 5)])
@@ -0,0 +1,162 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from mock import patch, Mock
+
+from solar import SolrSearcher
+from solar.pysolr import Solr, SolrError, SolrCoreAdmin
+from solar.reindex import Reindexer
+
+from .base import TestCase
+
+
+Row = namedtuple('Row', ['id', 'name'])
+
+
+def build_doc(row):
+    if row.name is None:
+        return None
+    return {'id': row.id, 'name': row.name}
+
+
+class Column(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __gt__(self, value):
+        return lambda row: getattr(row, self.name) > value
+
+
+class Query(object):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def filter(self, predicate):
+        return Query([row for row in self.rows if predicate(row)])
+
+    def order_by(self, column):
+        return Query(sorted(self.rows, key=lambda row: getattr(row, column.name)))
+
+    def limit(self, limit):
+        return Query(self.rows[:limit])
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class Model(object):
+    id = Column('id')
+
+
+ROWS = [Row(i, None if i == 7 else 'name {}'.format(i)) for i in range(25, 0, -1)]
+
+
+class ProductSearcher(SolrSearcher):
+    model = Model
+
+    def get_db_query(self):
+        return Query(ROWS)
+
+
+class ReindexerTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.searcher = ProductSearcher('http://example.com:8180/solr/products')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_pages(self):
+        reindexer = Reindexer(self.searcher, build_doc, None, page_size=10)
+        pages = list(reindexer.iter_pages())
+        self.assertEqual([key for _, key in pages], [10, 20, 25])
+        self.assertEqual([row.id for row in pages[1][0]], list(range(11, 21)))
+
+    def reindex(self, processes=None):
+        core_admin = Mock(spec=SolrCoreAdmin)
+        progress = []
+        reindexer = Reindexer(
+            self.searcher, build_doc, 'http://example.com:8180/solr/products_staging',
+            core_admin=core_admin, core='products', staging_core='products_staging',
+            page_size=10, processes=processes, concurrency=2,
+            state_path=os.path.join(self.path, 'state.json'),
+            on_progress=progress.append)
+
+        with patch.object(Solr, '_send_request', return_value='{}') as send_request:
+            stats = reindexer.run()
+
+            paths = [call[0][1] for call in send_request.call_args_list]
+            self.assertEqual(paths[0], 'update/?commit=false')
+            self.assertIn('<query>*:*</query>', send_request.call_args_list[0][0][2])
+            self.assertEqual(paths[-1], 'update/?commit=true')
+            bodies = ''.join(call[0][2] for call in send_request.call_args_list[1:-1])
+            self.assertEqual(bodies.count('<doc>'), 24)
+            self.assertNotIn('name 7<', bodies)
+
+        self.assertEqual(stats.docs, 24)
+        self.assertEqual(stats.pages, 3)
+        self.assertGreater(stats.size, 0)
+        self.assertEqual(len(progress), 3)
+        core_admin.swap.assert_called_once_with(core='products', other='products_staging')
+        self.assertFalse(os.path.exists(reindexer.state_path))
+
+    def test_reindex(self):
+        self.reindex()
+
+    def test_process_pool(self):
+        self.reindex(processes=2)
+
+    def test_rejected_docs(self):
+        rejected = []
+        reindexer = Reindexer(
+            self.searcher, build_doc, 'http://example.com:8180/solr/products_staging',
+            page_size=10, concurrency=1,
+            state_path=os.path.join(self.path, 'state.json'),
+            dead_letter=lambda doc, error: rejected.append(doc['id']))
+
+        def reject_doc(method, path, body, headers):
+            if '<field name="id">15</field>' in body:
+                raise SolrError('ERROR: [doc=15] bad field', status_code=400)
+            return '{}'
+
+        with patch.object(Solr, '_send_request', side_effect=reject_doc), \
+                patch('solar.indexer.log'), \
+                patch.object(reindexer, 'save_state', wraps=reindexer.save_state) as save_state:
+            stats = reindexer.run()
+        self.assertEqual(rejected, [15])
+        self.assertEqual(stats.docs, 23)
+        self.assertEqual(save_state.call_args_list[-1][0][1], 23)
+
+    def test_resume(self):
+        core_admin = Mock(spec=SolrCoreAdmin)
+        reindexer = Reindexer(
+            self.searcher, build_doc, 'http://example.com:8180/solr/products_staging',
+            core_admin=core_admin, core='products', staging_core='products_staging',
+            page_size=10, concurrency=1,
+            state_path=os.path.join(self.path, 'state.json'))
+
+        def fail_on_second_page(method, path, body, headers):
+            if '<field name="id">15</field>' in body:
+                raise SolrError('Solr is down')
+            return '{}'
+
+        with patch.object(Solr, '_send_request', side_effect=fail_on_second_page), \
+                patch('solar.indexer.log'):
+            self.assertRaises(SolrError, reindexer.run)
+        self.assertFalse(core_admin.swap.called)
+        state = reindexer.load_state()
+        self.assertEqual((state['last_key'], state['docs']), (10, 9))
+
+        with patch.object(Solr, '_send_request', return_value='{}') as send_request:
+            stats = reindexer.run()
+            bodies = [call[0][2] for call in send_request.call_args_list]
+            # staging core is not cleared
+            self.assertNotIn('<query>*:*</query>', bodies[0])
+            self.assertIn('<field name="id">11</field>', bodies[0])
+            self.assertEqual(''.join(bodies).count('<doc>'), 15)
+        self.assertEqual(stats.docs, 24)
+        core_admin.swap.assert_called_once_with(core='products', other='products_staging')
@@ -1,7 +1,17 @@
  #!/usr/bin/env python
+import time
+import threading
 from collections import namedtuple
 
-from solar.searcher import SolrSearcher
+from mock import patch
+
+try:
+    from threading import Barrier
+except ImportError:
+    # Python 2
+    Barrier = None
+
+from solar.searcher import SolrSearcher, CommonSearcher
 
 from .base import TestCase
 
@@ -58,3 +68,130 @@ class SearcherTestCase(TestCase):
             self.assertEqual(docs[0].name, 'Test realtime doc')
             self.assertEqual(docs[1].id, '222')
             self.assertEqual(docs[1].name, 'Test realtime doc duplicate')
+
+    def test_single_flight(self):
+        searcher = SolrSearcher('http://example.com:8180/solr', single_flight=True)
+        started = threading.Event()
+        release = threading.Event()
+
+        def send_request(*args, **kwargs):
+            started.set()
+            release.wait(5)
+            return '{"response": {"numFound": 3, "docs": [{"id": "1"}]}}'
+
+        with patch.object(searcher.solr, '_send_request',
+                          side_effect=send_request) as send_request_mock:
+            results = []
+
+            def search():
+                q = searcher.search().filter(status=0)
+                results.append(q.results)
+
+            threads = [threading.Thread(target=search) for _ in range(5)]
+            threads[0].start()
+            started.wait(5)
+            for t in threads[1:]:
+                t.start()
+            while searcher._single_flight.shared < 4:
+                time.sleep(0.001)
+            release.set()
+            for t in threads:
+                t.join()
+
+            self.assertEqual(send_request_mock.call_count, 1)
+            self.assertEqual([r.ndocs for r in results], [3] * 5)
+            self.assertEqual(len(set(id(r) for r in results)), 5)
+
+            searcher.search().filter(status=1).results
+            self.assertEqual(send_request_mock.call_count, 2)
+
+    def test_multi_search(self):
+        barrier = Barrier(3) if Barrier else None
+
+        def send_request(method, path, *args, **kwargs):
+            # all the requests must be in flight at the same time
+            if barrier:
+                barrier.wait(5)
+            if 'rows=0' in path:
+                return '{"response": {"numFound": 7, "docs": []}}'
+            return '{"response": {"numFound": 1, "docs": [{"id": "111"}]}}'
+
+        with self.patch_send_request() as send_request_mock:
+            send_request_mock.side_effect = send_request
+            q1 = self.searcher.search('nokia')
+            q2 = self.searcher.search('lumia').limit(1)
+            q3 = self.searcher.search().limit(0)
+            results = self.searcher.multi_search([q1, q2, q3])
+            self.assertEqual(send_request_mock.call_count, 3)
+            self.assertEqual([r.ndocs for r in results], [1, 1, 7])
+            self.assertIs(results[0], q1.results)
+            self.assertEqual(q2[0].id, '111')
+            self.assertEqual(len(q3), 7)
+            self.assertEqual(send_request_mock.call_count, 3)
+
+    def test_bulk_load_csv(self):
+        searcher = CommonSearcher('http://example.com:8180/solr')
+        searcher.type_value = 'Product'
+        with self.patch_send_request(searcher) as send_request:
+            send_request.return_value = '{}'
+            searcher.bulk_load_csv([{'id': 1, 'name': 'Nokia'}, None], ['id', 'name'])
+            body = b''.join(send_request.call_args[0][2]).decode('utf-8')
+            self.assertEqual(body, 'id,name,_id,_type\n1,Nokia,Product:1,Product\n')
+            self.assertIn('commit=true', send_request.call_args[0][1])
+
+    def test_delete_by_id(self):
+        searcher = CommonSearcher('http://example.com:8180/solr')
+        searcher.type_value = 'Product'
+        searcher.delete_batch_size = 2
+        pages = [
+            '{"response": {"numFound": 3, "docs": [{"_id": "Product:1"}, {"_id": "Product:2"}]},'
+            ' "nextCursorMark": "AoE1"}',
+            '{"response": {"numFound": 3, "docs": [{"_id": "Product:3"}]},'
+            ' "nextCursorMark": "AoE2"}',
+            '{"response": {"numFound": 3, "docs": []}, "nextCursorMark": "AoE2"}',
+        ]
+
+        def send_request(method, path, *args, **kwargs):
+            if path.startswith('select'):
+                return pages.pop(0)
+            return '{}'
+
+        with self.patch_send_request(searcher) as send_request_mock:
+            send_request_mock.side_effect = send_request
+            self.assertEqual(searcher.delete(status=0, by_id=True), 3)
+            calls = send_request_mock.call_args_list
+            self.assertEqual(len(calls), 6)
+            self.assertIn('cursorMark=%2A', calls[0][0][1])
+            self.assertIn('fl=_id', calls[0][0][1])
+            self.assertIn('sort=_id+asc', calls[0][0][1])
+            self.assertIn('rows=2', calls[0][0][1])
+            self.assertIn('_type%3AProduct', calls[0][0][1])
+            self.assertIn('status%3A0', calls[0][0][1])
+            self.assertEqual(calls[1][0][1], 'update/?commit=false')
+            self.assertIn('<delete><id>Product:1</id><id>Product:2</id></delete>', calls[1][0][2])
+            self.assertIn('cursorMark=AoE1', calls[2][0][1])
+            self.assertIn('<delete><id>Product:3</id></delete>', calls[3][0][2])
+            self.assertIn('cursorMark=AoE2', calls[4][0][1])
+            self.assertIn('<commit />', calls[5][0][2])
+
+    def test_delete_rate(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        searcher.delete_batch_size = 1
+        searcher.delete_rate = 10
+        pages = [
+            '{"response": {"docs": [{"id": "%d"}]}, "nextCursorMark": "%d"}' % (i, i)
+            for i in range(3)
+        ] + ['{"response": {"docs": []}, "nextCursorMark": "2"}']
+
+        with self.patch_send_request(searcher) as send_request, \
+                patch('solar.searcher.time.sleep') as sleep:
+            send_request.side_effect = lambda method, path, *args, **kwargs: (
+                pages.pop(0) if path.startswith('select') else '{}')
+            self.assertEqual(searcher.delete(by_id=True, commit=False), 3)
+            # no delay before the first batch, sleep is mocked
+            # so the next batches must wait for the previous ones
+            delays = [call[0][0] for call in sleep.call_args_list]
+            self.assertEqual(len(delays), 2)
+            self.assertAlmostEqual(delays[0], 0.1, places=1)
+            self.assertAlmostEqual(delays[1], 0.2, places=1)
+
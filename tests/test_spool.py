@@ -0,0 +1,147 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+from mock import patch
+
+from solar import SolrSearcher
+from solar.pysolr import SolrError
+from solar.spool import Spool, SpoolDrainer
+
+from .base import TestCase
+
+
+class SpoolTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_read_write(self):
+        spool = Spool(self.path, segment_size=256)
+        spool.add([{'id': '1', 'dt': datetime(2013, 5, 1, 12, 30)}, None])
+        spool.delete('status:0', id='2')
+        spool.add({'id': str(i), 'name': 'x' * 50} for i in range(3, 6))
+        self.assertEqual(spool.segments(), [1, 2])
+
+        records = spool.read(spool.checkpoint(), 100)
+        self.assertEqual(
+            [r for r, _ in records],
+            [{'add': {'id': '1', 'dt': '2013-05-01T12:30:00Z'}},
+             {'delete': {'args': ['status:0'], 'kwargs': {'id': '2'}}},
+             {'add': {'id': '3', 'name': 'x' * 50}},
+             None,
+             {'add': {'id': '4', 'name': 'x' * 50}},
+             {'add': {'id': '5', 'name': 'x' * 50}}])
+        self.assertEqual(records[3][1], (2, 0))
+        self.assertEqual(len(spool.read(records[2][1], 2)), 2)
+        self.assertEqual(spool.read(records[-1][1], 100), [])
+        spool.close()
+
+    def test_read_while_rolling(self):
+        spool = Spool(self.path, segment_size=64)
+        spool.add([{'id': '1'}])
+        records = Spool._records
+
+        def records_mock(data, pos=0, limit=None):
+            for item in records(data, pos, limit):
+                yield item
+            if spool.segments() == [1]:
+                # writer appends to the scanned segment and rolls
+                spool.add([{'id': '2'}, {'id': 'x' * 30}])
+
+        with patch.object(Spool, '_records', side_effect=records_mock):
+            position = (1, 0)
+            ids = []
+            for _ in range(3):
+                for record, position in spool.read(position, 100):
+                    ids.append(record and record['add']['id'])
+        self.assertEqual(ids, ['1', '2', None, 'x' * 30])
+        spool.close()
+
+    def test_torn_record(self):
+        spool = Spool(self.path)
+        spool.add([{'id': '1'}, {'id': '2'}])
+        spool.close()
+        segment_path = os.path.join(self.path, '0000000001.log')
+        with open(segment_path, 'r+b') as f:
+            data = f.read()
+            pos = data.index(b'{"add":{"id":"2"}}')
+            f.seek(pos + 5)
+            f.write(b'XX')
+
+        spool = Spool(self.path)
+        spool.add([{'id': '3'}])
+        self.assertEqual([r['add']['id'] for r, _ in spool.read((1, 0), 100)],
+                         ['1', '3'])
+        spool.close()
+
+    def test_drain(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        spool = Spool(self.path, segment_size=256)
+        spool.add([{'id': '1'}, {'id': '2', 'name': 'old'}])
+        spool.add([{'id': '2', 'name': 'new'}])
+        spool.delete(id='3')
+        spool.add([{'id': '4', 'name': 'x' * 100}, {'id': '5', 'name': 'x' * 100}])
+
+        drainer = SpoolDrainer(spool, searcher, batch_size=100)
+        with patch.object(searcher, 'add') as add, \
+                patch.object(searcher, 'delete') as delete, \
+                patch.object(searcher, 'commit') as commit:
+            self.assertEqual(drainer.drain(), 6)
+            self.assertEqual(
+                [[d['id'] for d in call[0][0]] for call in add.call_args_list],
+                [['1', '2'], ['4', '5']])
+            self.assertEqual(add.call_args_list[0][0][0][1]['name'], 'new')
+            delete.assert_called_once_with(commit=False, id='3')
+            commit.assert_called_once_with()
+            # delivered segments are removed
+            self.assertEqual(spool.segments(), [3])
+
+            add.reset_mock()
+            commit.reset_mock()
+            self.assertEqual(drainer.drain(), 0)
+            self.assertFalse(add.called)
+            self.assertFalse(commit.called)
+        spool.close()
+
+    def test_redelivery(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        spool = Spool(self.path)
+        spool.add([{'id': '1'}])
+        spool.delete(id='2')
+        spool.add([{'id': '3'}])
+
+        drainer = SpoolDrainer(spool, searcher, commit=False)
+        with patch.object(searcher, 'add') as add, \
+                patch.object(searcher, 'delete', side_effect=SolrError('down')):
+            self.assertRaises(SolrError, drainer.drain)
+            self.assertEqual(add.call_count, 1)
+        spool.close()
+
+        # restart
+        spool = Spool(self.path)
+        drainer = SpoolDrainer(spool, searcher, commit=False)
+        with patch.object(searcher, 'add') as add, \
+                patch.object(searcher, 'delete') as delete:
+            self.assertEqual(drainer.drain(), 2)
+            delete.assert_called_once_with(commit=False, id='2')
+            self.assertEqual(add.call_args[0][0], [{'id': '3'}])
+        spool.close()
+
+    def test_background(self):
+        searcher = SolrSearcher('http://example.com:8180/solr')
+        spool = Spool(self.path)
+        drainer = SpoolDrainer(spool, searcher, interval=0.01)
+        with patch.object(searcher, 'add') as add, \
+                patch.object(searcher, 'commit'):
+            drainer.start()
+            spool.add([{'id': '1'}])
+            drainer.stop()
+            self.assertEqual(drainer.sent_docs, 1)
+            self.assertEqual(add.call_count, 1)
+        spool.close()
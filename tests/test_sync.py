@@ -0,0 +1,129 @@
+from __future__ import unicode_literals
+
+import threading
+
+from mock import Mock, patch
+
+from solar import SolrSearcher
+from solar.pysolr import SolrError
+from solar.sync import SessionSync
+
+from .base import TestCase
+
+
+class Product(object):
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class Session(object):
+    def __init__(self):
+        self.info = {}
+        self.new = set()
+        self.dirty = set()
+        self.deleted = set()
+
+
+def build_doc(obj):
+    return {'id': obj.id, 'name': obj.name}
+
+
+class SessionSyncTest(TestCase):
+    def setUp(self):
+        self.searcher = SolrSearcher('http://example.com:8180/solr', model=Product)
+        self.products = dict((i, Product(i, 'product {}'.format(i))) for i in range(1, 6))
+
+    def instance_mapper(self, ids, db_query=None):
+        return dict((i, self.products[i]) for i in ids if i in self.products)
+
+    def test_session_events(self):
+        sync = SessionSync(self.searcher, build_doc, delay=10)
+        session = Session()
+        session.new = set([self.products[1], 'not a product'])
+        session.dirty = set([self.products[2], self.products[3]])
+        sync.after_flush(session, None)
+        session.new = set()
+        session.dirty = set()
+        session.deleted = set([self.products[3]])
+        sync.after_flush(session, None)
+        with patch.object(sync, 'schedule') as schedule:
+            sync.after_commit(session)
+            schedule.assert_called_once_with(set([1, 2]), set([3]))
+            self.assertEqual(session.info, {})
+
+            session.new = set([self.products[4]])
+            sync.after_flush(session, None)
+            sync.after_rollback(session)
+            sync.after_commit(session)
+            self.assertEqual(schedule.call_count, 1)
+
+    def test_flush(self):
+        sync = SessionSync(self.searcher, build_doc, delay=10, batch_size=2)
+        sync.schedule([1, 2, 3], [4])
+        sync.schedule([4, 9], [1])
+        with patch.object(self.searcher, 'instance_mapper', side_effect=self.instance_mapper), \
+                patch.object(self.searcher.solr, '_send_request', return_value='{}') as send_request:
+            self.assertEqual(sync.flush(), 5)
+            # one request for all the changes
+            self.assertEqual(send_request.call_count, 1)
+            path, body = send_request.call_args[0][1:3]
+            self.assertEqual(path, 'update/?commit=true')
+            self.assertEqual(body.count('<doc>'), 3)
+            self.assertTrue(body.endswith(
+                '<delete><query>(id:1 OR id:9)</query></delete></update>'), body)
+
+            send_request.reset_mock()
+            self.assertEqual(sync.flush(), 0)
+            self.assertFalse(send_request.called)
+
+    def test_debounce(self):
+        sync = SessionSync(self.searcher, build_doc, delay=0.05)
+        done = threading.Event()
+        flush = sync.flush
+
+        def flush_mock():
+            try:
+                return flush()
+            finally:
+                done.set()
+
+        with patch.object(self.searcher, 'instance_mapper', side_effect=self.instance_mapper), \
+                patch.object(self.searcher.solr, 'batch_update') as batch_update, \
+                patch.object(sync, 'flush', side_effect=flush_mock):
+            for i in range(1, 4):
+                sync.schedule([i])
+            self.assertTrue(done.wait(5))
+            batch_update.assert_called_once_with(
+                [('add', build_doc(self.products[i])) for i in range(1, 4)],
+                commit=True, format=None)
+
+    def test_flush_error(self):
+        sync = SessionSync(self.searcher, build_doc, delay=10)
+        sync.schedule([1, 2], [3])
+        with patch.object(self.searcher, 'instance_mapper', side_effect=self.instance_mapper), \
+                patch.object(self.searcher.solr, '_send_request') as send_request:
+            send_request.side_effect = SolrError('Connection refused')
+            with self.assertRaises(SolrError):
+                sync.flush()
+            # changes made after the failure win
+            sync.schedule([3], [2])
+            self.assertEqual(sync._changed, set([1, 3]))
+            self.assertEqual(sync._deleted, set([2]))
+
+            send_request.side_effect = None
+            send_request.return_value = '{}'
+            self.assertEqual(sync.flush(), 3)
+            self.assertEqual(sync._changed, set())
+
+    def test_session_factory(self):
+        session = Mock()
+        sync = SessionSync(self.searcher, build_doc, delay=10,
+                           session_factory=lambda: session)
+        sync.schedule([1])
+        with patch.object(self.searcher, 'instance_mapper', side_effect=self.instance_mapper) as mapper, \
+                patch.object(self.searcher.solr, '_send_request', return_value='{}'):
+            sync.flush()
+            mapper.assert_called_once_with([1], db_query=session.query.return_value)
+            session.query.assert_called_once_with(Product)
+            session.close.assert_called_once_with()